@@ -1,23 +1,26 @@
 # agents/alert_agent.py
 from agents.base_agent import BaseAgent
+from services.risk_rules import get_risk_engine, risk_frames
 from datetime import datetime
 
 class AlertAgent(BaseAgent):
     """⚠️ Alert & Risk Agent - monitors and alerts on issues"""
     
+    snapshot_key = "alert"
+    
     def __init__(self):
         super().__init__(
             name="Alert & Risk Agent",
             description="Monitors alerts and risks"
         )
     
-    def analyze(self, org_id: str, query: str):
-        """Check and analyze alerts"""
+    def build_prompt(self, org_id: str, query: str, data):
+        """Build alert and risk summary prompt"""
         # Get current alerts
-        alerts = self._get_active_alerts(org_id)
+        alerts = data.alerts(org_id)
         
-        # Check for new risks
-        risks = self._check_risks(org_id)
+        # Check for new risks (precomputed or live)
+        risks = self.load_context(org_id, data)['risks']
         
         # Generate alert summary
         prompt = f"""
@@ -31,52 +34,42 @@ class AlertAgent(BaseAgent):
         {self._format_alerts(alerts[:5])}
         
         Identified risks:
-        {risks}
+        {self._format_risks(risks)}
         
         User question: {query}
         
         Provide risk assessment and recommendations.
         """
-        
-        response = self.llm.invoke(prompt)
-        return response.content
+        return prompt
     
-    def _get_active_alerts(self, org_id):
-        """Get active alerts from database"""
-        result = self.db.table('alerts')\
-            .select("*")\
-            .eq('organization_id', org_id)\
-            .eq('is_read', False)\
-            .order('created_at', desc=True)\
-            .execute()
-        return result.data
+    @classmethod
+    def compute_context(cls, org_id: str, data):
+        """Fired risk rules over the shared, already-loaded table data"""
+        engine = get_risk_engine()
+        fired = engine.evaluate(risk_frames(data, [org_id], engine.tables))
+        return {'risks': fired.get(org_id, [])}
     
-    def _check_risks(self, org_id):
-        """Check for various risks"""
-        risks = []
-        
-        # Check budget overruns
-        budgets = self.db.table('budgets')\
-            .select("*")\
-            .eq('organization_id', org_id)\
-            .execute().data
+    def _format_risks(self, risks):
+        """Format fired risk rules for the prompt"""
+        if not risks:
+            return "No risks identified"
         
-        for budget in budgets:
-            if budget['actual_spent'] > budget['approved_amount'] * 1.2:
-                risks.append(f"{budget['dept']} is 20%+ over budget")
-        
-        # Check overdue invoices
-        invoices = self.db.table('invoices')\
-            .select("*")\
-            .eq('organization_id', org_id)\
-            .eq('is_overdue', True)\
-            .execute().data
-        
-        if len(invoices) > 5:
-            total_overdue = sum(inv['amount'] for inv in invoices)
-            risks.append(f"{len(invoices)} overdue invoices totaling ${total_overdue:,.2f}")
+        formatted = []
+        for risk in risks:
+            if isinstance(risk, str):
+                # Snapshots built before the rule engine
+                formatted.append(f"- {risk}")
+                continue
+            numbers = ", ".join(
+                f"{k}={v:,.2f}" if isinstance(v, float) else f"{k}={v}"
+                for k, v in risk['numbers'].items()
+            )
+            formatted.append(
+                f"- [{risk['severity']}] {risk['message']}"
+                + (f" ({numbers})" if numbers else "")
+            )
         
-        return risks
+        return "\n".join(formatted)
     
     def _format_alerts(self, alerts):
         """Format alerts for display"""
@@ -1,17 +1,103 @@
 # agents/base_agent.py
+import asyncio
+from typing import Dict, Optional
+from agents.data_context import AgentDataContext
 from config.database import get_db
 from config.llm_config import get_llm
 from datetime import datetime
+from utils.prompt_payload import PromptPayload, estimate_tokens, get_token_budget
 
 
 class BaseAgent:
     """Base class for all agents"""
 
+    # Key for the PROMPT_TOKEN_BUDGET_<KEY> override
+    budget_key = "default"
+    # Returned instead of calling the LLM when build_prompt finds no data
+    empty_response = "No data available for analysis."
+    # Section of the nightly agent_context_snapshots payload for this agent
+    snapshot_key: Optional[str] = None
+
     def __init__(self, name, description):
         self.name = name
         self.description = description
         self.db = get_db()
         self.llm = get_llm()
+        self.token_budget = get_token_budget(self.budget_key)
+        self.last_prompt_tokens = 0
+
+    def build_prompt(
+        self, org_id: str, query: str, data: AgentDataContext
+    ) -> Optional[str]:
+        """Build the agent's prompt from shared request data (None if there is no data)"""
+        raise NotImplementedError
+
+    @classmethod
+    def compute_context(cls, org_id: str, data: AgentDataContext) -> Optional[Dict]:
+        """Pre-LLM metrics for the prompt; JSON-serializable so it can be snapshotted"""
+        raise NotImplementedError
+
+    def load_context(self, org_id: str, data: AgentDataContext) -> Optional[Dict]:
+        """Fresh snapshot section if there is one, else computed live"""
+        if self.snapshot_key:
+            snapshot = data.snapshot(org_id)
+            if snapshot and self.snapshot_key in snapshot:
+                return snapshot[self.snapshot_key]
+        return self.compute_context(org_id, data)
+
+    def analyze(self, org_id: str, query: str, memory=None, data=None):
+        """Answer a query for an organization"""
+        data = self._data_context(memory, data)
+        prompt = self.build_prompt(org_id, query, data)
+        if prompt is None:
+            return self.empty_response
+
+        prompt = self._with_context(prompt, memory)
+
+        self.count_prompt_tokens(prompt)
+        response = self.llm.invoke(prompt, config=self.llm_config(org_id))
+        return response.content
+
+    async def aanalyze(self, org_id: str, query: str, memory=None, data=None):
+        """Async analyze: data access runs off the event loop, LLM via ainvoke"""
+        data = self._data_context(memory, data)
+        prompt = await asyncio.to_thread(self.build_prompt, org_id, query, data)
+        if prompt is None:
+            return self.empty_response
+
+        prompt = self._with_context(prompt, memory)
+
+        self.count_prompt_tokens(prompt)
+        response = await self.llm.ainvoke(prompt, config=self.llm_config(org_id))
+        return response.content
+
+    def _data_context(self, memory=None, data=None) -> AgentDataContext:
+        """Explicit context, else the conversation's, else a fresh per-request one"""
+        if data is not None:
+            return data
+        if memory is not None:
+            return memory.data
+        return AgentDataContext(self.db)
+
+    def _with_context(self, prompt: str, memory=None) -> str:
+        """Prefix the prompt with the conversation so far, if any"""
+        context = memory.context_text() if memory is not None else ""
+        if not context:
+            return prompt
+        return f"{context}\n\n{prompt}"
+
+    def new_payload(self) -> PromptPayload:
+        """Prompt data builder bounded by this agent's token budget"""
+        return PromptPayload(self.token_budget)
+
+    def llm_config(self, org_id=None) -> Dict:
+        """LLM run config attributing the call to this org and agent"""
+        return {"metadata": {"org_id": org_id, "agent": self.name}}
+
+    def count_prompt_tokens(self, prompt: str) -> int:
+        """Record the estimated size of the prompt about to be sent"""
+        self.last_prompt_tokens = estimate_tokens(prompt)
+        return self.last_prompt_tokens
 
     def log_interaction(self, user_id, message, response):
         """Log chat history to database"""
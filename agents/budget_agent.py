@@ -5,25 +5,24 @@ import pandas as pd
 class BudgetAgent(BaseAgent):
     """🧾 Budget Planning Agent - manages and optimizes budgets"""
     
+    snapshot_key = "budget"
+    
     def __init__(self):
         super().__init__(
             name="Budget Planning Agent",
             description="Budget planning and variance analysis"
         )
     
-    def analyze(self, org_id: str, query: str):
-        """Analyze budget performance"""
-        # Get budget data
-        budgets = self._get_budgets(org_id)
-        
-        # Calculate variance
-        analysis = self._analyze_variance(budgets)
+    def build_prompt(self, org_id: str, query: str, data):
+        """Build budget performance prompt"""
+        # Precomputed or live variance analysis
+        analysis = self.load_context(org_id, data)
         
         # Generate recommendations
         prompt = f"""
         Budget analysis:
         
-        Total budgets: {len(budgets)}
+        Total budgets: {analysis['total']}
         Over budget: {analysis['over_count']} departments
         Under budget: {analysis['under_count']} departments
         Average variance: {analysis['avg_variance']:.1f}%
@@ -35,19 +34,16 @@ class BudgetAgent(BaseAgent):
         
         Provide budget optimization recommendations.
         """
-        
-        response = self.llm.invoke(prompt)
-        return response.content
+        return prompt
     
-    def _get_budgets(self, org_id):
-        """Get budget data"""
-        result = self.db.table('budgets')\
-            .select("*")\
-            .eq('organization_id', org_id)\
-            .execute()
-        return result.data
+    @classmethod
+    def compute_context(cls, org_id: str, data):
+        """Variance analysis of the org's budgets"""
+        budgets = data.budgets(org_id)
+        return {'total': len(budgets), **cls._analyze_variance(budgets)}
     
-    def _analyze_variance(self, budgets):
+    @staticmethod
+    def _analyze_variance(budgets):
         """Analyze budget variance"""
         over_budget = []
         under_budget = []
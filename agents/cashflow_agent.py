@@ -1,34 +1,56 @@
 # agents/cashflow_agent.py
 from agents.base_agent import BaseAgent
+from services.cashflow_forecast import (
+    burn_outlook,
+    cash_balance,
+    daily_outflows,
+    forecast_outflows,
+)
+from services.runway_simulator import (
+    format_runway,
+    simulate_runway,
+    simulation_seed,
+)
 import pandas as pd
-from datetime import datetime, timedelta
 
 class CashflowAgent(BaseAgent):
     """📊 Cashflow Forecaster - predicts cash flow and runway"""
     
+    snapshot_key = "cashflow"
+    
     def __init__(self):
         super().__init__(
             name="Cashflow Forecaster Agent",
             description="Analyzes and forecasts cash flow"
         )
     
-    def analyze(self, org_id: str, query: str):
-        """Analyze cashflow for organization"""
-        # Get transaction data
-        transactions = self._get_transactions(org_id)
-        invoices = self._get_invoices(org_id)
+    def build_prompt(self, org_id: str, query: str, data):
+        """Build cashflow analysis prompt for organization"""
+        # Precomputed or live metrics
+        metrics = self.load_context(org_id, data)
+        
+        forecast = "\n".join(
+            f"  Month {m['month']}: ${m['burn']:,.2f} (${m['low']:,.2f} - ${m['high']:,.2f})"
+            for m in metrics.get('burn_forecast', [])
+        )
         
-        # Calculate metrics
-        metrics = self._calculate_metrics(transactions, invoices)
+        simulation = metrics.get('runway_simulation')
+        runway = format_runway(simulation) if simulation else 'not available'
+        runway_paths = simulation['paths'] if simulation else 0
         
         # Generate AI insights
         prompt = f"""
         As a CFO, analyze this cashflow data:
         
-        Monthly burn rate: ${metrics['monthly_burn']:,.2f}
+        Cash balance: ${metrics.get('cash_balance', 100000):,.2f}
+        Monthly burn rate (forecast): ${metrics['monthly_burn']:,.2f}
         Monthly income: ${metrics['monthly_income']:,.2f}
         Net cashflow: ${metrics['net_flow']:,.2f}
         Current runway: {metrics['runway_months']:.1f} months
+        Runway simulation ({runway_paths} cash paths): {runway}
+        
+        Burn forecast, seasonal model with 80% intervals:
+{forecast or '  not available'}
         
         Outstanding receivables: ${metrics['receivables']:,.2f}
         Overdue invoices: {metrics['overdue_count']}
@@ -37,34 +59,26 @@ class CashflowAgent(BaseAgent):
         
         Provide specific insights and recommendations.
         """
-        
-        response = self.llm.invoke(prompt)
-        return response.content
-    
-    def _get_transactions(self, org_id):
-        """Get transaction data from database"""
-        result = self.db.table('transactions')\
-            .select("*")\
-            .eq('organization_id', org_id)\
-            .gte('date', (datetime.now() - timedelta(days=90)).date().isoformat())\
-            .execute()
-        return result.data
+        return prompt
     
-    def _get_invoices(self, org_id):
-        """Get invoice data"""
-        result = self.db.table('invoices')\
-            .select("*")\
-            .eq('organization_id', org_id)\
-            .execute()
-        return result.data
+    @classmethod
+    def compute_context(cls, org_id: str, data):
+        """Cashflow metrics from shared transactions, invoices and org settings"""
+        return cls._calculate_metrics(
+            org_id,
+            data.transactions_df(org_id, days=90),
+            data.invoices(org_id),
+            cash_balance(data.organization(org_id)),
+        )
     
-    def _calculate_metrics(self, transactions, invoices):
+    @staticmethod
+    def _calculate_metrics(org_id, transactions: pd.DataFrame, invoices, balance):
         """Calculate cashflow metrics"""
-        if transactions:
-            df = pd.DataFrame(transactions)
-            monthly_burn = df['amount'].sum() / 3  # 90 days / 3
-        else:
-            monthly_burn = 0
+        # Seasonal forecast of the next 3 months' burn (cached per org)
+        daily = daily_outflows(transactions)
+        model = forecast_outflows({org_id: daily})[org_id]
+        burn_forecast = burn_outlook(model, months=3)['monthly']
+        monthly_burn = burn_forecast[0]['burn']
         
         # Calculate receivables
         pending_invoices = [inv for inv in invoices if inv['status'] == 'pending']
@@ -77,7 +91,13 @@ class CashflowAgent(BaseAgent):
             'monthly_burn': monthly_burn,
             'monthly_income': receivables / 3,  # Assume 3 month average
             'net_flow': (receivables / 3) - monthly_burn,
-            'runway_months': 12 if monthly_burn == 0 else 100000 / monthly_burn,  # Assume 100k balance
+            'runway_months': 12 if monthly_burn == 0 else balance / monthly_burn,
             'receivables': receivables,
-            'overdue_count': len(overdue)
+            'overdue_count': len(overdue),
+            'cash_balance': balance,
+            'burn_forecast': burn_forecast,
+            # P10/P50/P90 runway over sampled spend and invoice collections
+            'runway_simulation': simulate_runway(
+                daily, invoices, balance, seed=simulation_seed(org_id, daily, balance)
+            ),
         }
\ No newline at end of file
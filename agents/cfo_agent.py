@@ -1,12 +1,37 @@
 from agents.base_agent import BaseAgent
+from agents.cfo_tools import build_cfo_tools
 from agents.router_agent import RouterAgent
+from config.enviroment import get_config
 from config.llm_config import get_llm
 from services.data_service import DataService
+from services.runway_simulator import format_runway
 from langchain_core.prompts import PromptTemplate
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import asyncio
+from utils.prompt_payload import estimate_tokens
+from utils import clock
 import json
 
 
+BUDGET_COLUMNS = ["department", "approved", "spent", "variance_percent", "status"]
+
+# Default questions for the "analyze everything" batch
+DEFAULT_ANALYSIS_QUERIES = {
+    "spending": "Analyze spending trends and patterns",
+    "budget": "Analyze budget performance",
+    "cashflow": "Forecast cashflow for next 3 months",
+}
+
+TOOL_SYSTEM_PROMPT = """You are a CFO assistant. Today is {today}.
+Use the tools to fetch only the figures the question needs, then answer
+concisely with the numbers you used. If no tool fits, say what data is missing."""
+
+
 class CFOAgent(BaseAgent):
+    budget_key = "cfo"
+
     def __init__(self):
         super().__init__(
             name="CFO Assistant", description="Financial analysis and insights"
@@ -15,30 +40,56 @@ class CFOAgent(BaseAgent):
         self.data_service = DataService()
         self.org_id = None
         self.router_agent = RouterAgent()
+        # Let the LLM fetch aggregates via tools instead of routing to sub-agents
+        self.tool_mode = get_config("CFO_TOOL_MODE", "0") in {"1", "true", "True"}
 
     def analyze_spending(self, query: str, org_id: str) -> str:
         """Analyze spending with AI insights"""
+        prompt = self._spending_prompt(query, org_id)
+        if prompt is None:
+            return "No spending data available"
+
+        # Get AI analysis
+        return self._ask(prompt, org_id)
+
+    def _spending_prompt(self, query: str, org_id: str) -> Optional[str]:
+        """Fetch spending data and build the analysis prompt"""
         # Get data from database
         spending_data = self.data_service.get_spending_summary(org_id)
 
         if not spending_data:
-            return "No spending data available"
+            return None
+
+        payload = (
+            self.new_payload()
+            .add_line(
+                f"Total Spent (90 days): ${spending_data['total_spent']:,.2f}\n"
+                f"Number of Transactions: {spending_data['transaction_count']}\n"
+                f"Average Transaction: ${spending_data['avg_transaction']:,.2f}"
+            )
+            .add_mapping(
+                "Spending by Category",
+                spending_data["by_category"],
+                "category",
+                "amount",
+            )
+            .add_mapping(
+                "Top Merchants",
+                spending_data.get("top_merchants", {}),
+                "merchant",
+                "amount",
+                top_k=5,
+            )
+            .add_line(
+                f"Fraud Alerts: {spending_data.get('fraud_flagged', 0)} transactions flagged"
+            )
+        )
 
         # Create prompt with real data
         prompt = f"""
         As a CFO, analyze this spending data from our database:
         
-        Total Spent (90 days): ${spending_data['total_spent']:,.2f}
-        Number of Transactions: {spending_data['transaction_count']}
-        Average Transaction: ${spending_data['avg_transaction']:,.2f}
-        
-        Spending by Category:
-        {json.dumps(spending_data['by_category'], indent=2)}
-        
-        Top Merchants:
-        {json.dumps(spending_data['top_merchants'], indent=2)}
-        
-        Fraud Alerts: {spending_data['fraud_flagged']} transactions flagged
+        {payload.render()}
         
         User Question: {query}
         
@@ -48,13 +99,14 @@ class CFOAgent(BaseAgent):
         3. Cost optimization recommendations
         4. Action items for the finance team
         """
-
-        # Get AI analysis
-        response = self.llm.invoke(prompt)
-        return response.content
+        return prompt
 
     def analyze_budget(self, query: str, org_id: str) -> str:
         """Analyze budget variance"""
+        return self._ask(self._budget_prompt(query, org_id), org_id)
+
+    def _budget_prompt(self, query: str, org_id: str) -> str:
+        """Fetch budget status and build the variance prompt"""
         budgets = self.data_service.get_budget_status(org_id)
 
         prompt = PromptTemplate(
@@ -72,19 +124,61 @@ class CFOAgent(BaseAgent):
             3. Action items
             """,
         )
-        filled = prompt.format(budgets=json.dumps(budgets[:10]), query=query)
-        response = self.llm.invoke(filled)
-        return getattr(response, "content", response)
+        payload = self.new_payload().add_table(
+            "Budgets",
+            budgets,
+            BUDGET_COLUMNS,
+            top_k=10,
+            sort_key=lambda b: abs(b["variance_percent"]),
+            sum_columns=["approved", "spent"],
+        )
+        return prompt.format(budgets=payload.render(), query=query)
 
     def forecast_cashflow(self, query: str, org_id: str) -> str:
         """Cashflow forecasting"""
+        prompt = self._cashflow_prompt(query, org_id)
+        if prompt is None:
+            return "Please select an organization to forecast cashflow."
+        return self._ask(prompt, org_id)
 
+    def _cashflow_prompt(self, query: str, org_id: str) -> Optional[str]:
+        """Fetch the cashflow forecast and build the analysis prompt"""
         org_id = org_id or self.org_id
 
         if not org_id:
-            return "Please select an organization to forecast cashflow."
+            return None
 
         forecast = self.data_service.get_cashflow_forecast(org_id)
+        if "error" in forecast:
+            payload = self.new_payload().add_line(
+                f"Forecast unavailable: {forecast['error']}"
+            )
+        else:
+            # Summary only: the daily series and simulation paths are for charts
+            runway = forecast.get("runway_months")
+            simulation = forecast.get("runway_simulation")
+            payload = (
+                self.new_payload()
+                .add_line(
+                    f"Cash balance: ${forecast['cash_balance']:,.2f}\n"
+                    f"Monthly burn (next month): ${forecast['monthly_burn_rate']:,.2f} "
+                    f"(${forecast['monthly_burn_low']:,.2f} - "
+                    f"${forecast['monthly_burn_high']:,.2f}, 80% interval)\n"
+                    f"Projected spend ({forecast['months']} months): "
+                    f"${forecast['projected_spend']:,.2f}\n"
+                    f"Pending receivables: ${forecast['pending_receivables']:,.2f}\n"
+                    f"Net position: ${forecast['net_position']:,.2f}\n"
+                    f"Runway: {f'{runway:.1f} months' if runway else 'not available'}\n"
+                    f"Runway simulation: "
+                    f"{format_runway(simulation) if simulation else 'not available'}"
+                )
+                .add_table(
+                    "Burn forecast by month",
+                    forecast["forecast"]["monthly"],
+                    ["month", "burn", "low", "high"],
+                    top_k=forecast["months"],
+                )
+            )
 
         prompt = PromptTemplate(
             input_variables=["forecast", "query"],
@@ -101,8 +195,72 @@ class CFOAgent(BaseAgent):
             3. Recommendations for improvement
             """,
         )
-        filled = prompt.format(forecast=json.dumps(forecast), query=query)
-        response = self.llm.invoke(filled)
+        return prompt.format(forecast=payload.render(), query=query)
+
+    def analyze_all(
+        self,
+        org_id: str,
+        queries: Optional[Dict[str, str]] = None,
+        max_concurrency: int = 3,
+    ) -> Dict[str, str]:
+        """Run spending, budget and cashflow analyses as one concurrent batch.
+
+        Data for the three prompts is fetched in parallel, then the prompts are
+        sent together via llm.batch, so the whole report takes roughly one LLM
+        round trip. Returns {"spending": ..., "budget": ..., "cashflow": ...}.
+        """
+        queries = {**DEFAULT_ANALYSIS_QUERIES, **(queries or {})}
+        builders = {
+            "spending": self._spending_prompt,
+            "budget": self._budget_prompt,
+            "cashflow": self._cashflow_prompt,
+        }
+        empty = {
+            "spending": "No spending data available",
+            "cashflow": "Please select an organization to forecast cashflow.",
+        }
+
+        results: Dict[str, str] = {}
+        prompts: Dict[str, str] = {}
+        with ThreadPoolExecutor(max_workers=len(builders)) as pool:
+            futures = {
+                key: pool.submit(build, queries[key], org_id)
+                for key, build in builders.items()
+            }
+            for key, future in futures.items():
+                try:
+                    prompt = future.result()
+                except Exception as e:
+                    results[key] = f"Error preparing {key} analysis: {e}"
+                    continue
+                if prompt is None:
+                    results[key] = empty.get(key, "No data available")
+                else:
+                    prompts[key] = prompt
+
+        if prompts:
+            keys = list(prompts)
+            self.last_prompt_tokens = sum(estimate_tokens(prompts[k]) for k in keys)
+            responses = self.llm.batch(
+                [prompts[k] for k in keys],
+                config={
+                    "max_concurrency": max_concurrency,
+                    **self.llm_config(org_id),
+                },
+                return_exceptions=True,
+            )
+            for key, response in zip(keys, responses):
+                if isinstance(response, Exception):
+                    results[key] = f"Error generating {key} analysis: {response}"
+                else:
+                    results[key] = getattr(response, "content", response)
+
+        return {key: results[key] for key in builders}
+
+    def _ask(self, prompt: str, org_id: Optional[str] = None) -> str:
+        """Send a single prompt to the LLM"""
+        self.count_prompt_tokens(prompt)
+        response = self.llm.invoke(prompt, config=self.llm_config(org_id))
         return getattr(response, "content", response)
 
     def check_budget_health(self, org_id: str) -> str:
@@ -110,19 +268,27 @@ class CFOAgent(BaseAgent):
         budget_data = self.data_service.get_budget_status(org_id)
 
         over_budget = [b for b in budget_data if b["status"] == "over"]
+        payload = self.new_payload().add_table(
+            "Details",
+            over_budget,
+            BUDGET_COLUMNS,
+            top_k=5,
+            sort_key=lambda b: b["variance_percent"],
+            sum_columns=["approved", "spent"],
+        )
 
         prompt = f"""
         Analyze our budget performance:
         
         Departments over budget: {len(over_budget)}
         
-        Details:
-        {json.dumps(over_budget[:5], indent=2)}
+        {payload.render()}
         
         Provide specific recommendations to get back on track.
         """
 
-        response = self.llm.invoke(prompt)
+        self.count_prompt_tokens(prompt)
+        response = self.llm.invoke(prompt, config=self.llm_config(org_id))
         return response.content
 
     def get_alerts_summary(self, org_id: str) -> str:
@@ -145,8 +311,91 @@ class CFOAgent(BaseAgent):
         {alerts[0]['message'] if alerts else 'None'}
         """
 
-    def chat(self, message: str, org_id: str = None) -> str:
-        """Main chat interface - routes to appropriate function"""
+    def answer_with_tools(
+        self, message: str, org_id: str, memory=None, max_steps: int = 4
+    ) -> str:
+        """Answer by letting the LLM call typed aggregate tools (see cfo_tools.py)"""
+        tools, llm, config, messages = self._tool_session(message, org_id, memory)
+        for _ in range(max_steps):
+            response = llm.invoke(messages, config=config)
+            messages.append(response)
+            if not response.tool_calls:
+                return response.content
+            messages += [self._call_tool(tools, call) for call in response.tool_calls]
+
+        # Out of tool steps: answer from what was fetched
+        messages.append(HumanMessage("Answer now using the data above."))
+        return self.llm.invoke(messages, config=config).content
+
+    async def aanswer_with_tools(
+        self, message: str, org_id: str, memory=None, max_steps: int = 4
+    ) -> str:
+        """Async answer_with_tools; a step's tool calls run concurrently"""
+        tools, llm, config, messages = self._tool_session(message, org_id, memory)
+        for _ in range(max_steps):
+            response = await llm.ainvoke(messages, config=config)
+            messages.append(response)
+            if not response.tool_calls:
+                return response.content
+            messages += await asyncio.gather(
+                *(self._acall_tool(tools, call) for call in response.tool_calls)
+            )
+
+        messages.append(HumanMessage("Answer now using the data above."))
+        return (await self.llm.ainvoke(messages, config=config)).content
+
+    def _tool_session(self, message: str, org_id: str, memory=None):
+        """Tools by name, the tool-bound LLM, its config and the opening messages"""
+        tools = {t.name: t for t in build_cfo_tools(self.data_service, org_id)}
+        messages = [
+            SystemMessage(
+                TOOL_SYSTEM_PROMPT.format(today=clock.now().date().isoformat())
+            ),
+            HumanMessage(self._with_context(message, memory)),
+        ]
+        return (
+            tools,
+            self.llm.bind_tools(list(tools.values())),
+            self.llm_config(org_id),
+            messages,
+        )
+
+    def _call_tool(self, tools: Dict, call: Dict) -> ToolMessage:
+        tool = tools.get(call["name"])
+        try:
+            result = (
+                tool.invoke(call["args"])
+                if tool
+                else {"error": f"Unknown tool {call['name']}"}
+            )
+        except Exception as e:
+            result = {"error": str(e)}
+        return self._tool_message(call, result)
+
+    async def _acall_tool(self, tools: Dict, call: Dict) -> ToolMessage:
+        tool = tools.get(call["name"])
+        try:
+            result = (
+                await tool.ainvoke(call["args"])
+                if tool
+                else {"error": f"Unknown tool {call['name']}"}
+            )
+        except Exception as e:
+            result = {"error": str(e)}
+        return self._tool_message(call, result)
+
+    @staticmethod
+    def _tool_message(call: Dict, result) -> ToolMessage:
+        return ToolMessage(
+            content=json.dumps(result, default=str), tool_call_id=call["id"]
+        )
+
+    def chat(self, message: str, org_id: str = None, memory=None) -> str:
+        """Main chat interface - routes to appropriate function.
+
+        With a ConversationMemory, agents see the conversation so far, reuse
+        data fetched earlier in it, and the turn is recorded afterwards.
+        """
 
         if org_id:
             self.org_id = org_id
@@ -157,9 +406,36 @@ class CFOAgent(BaseAgent):
         message_lower = message.lower()
 
         try:
-            response = self.router_agent.route_query(message_lower, self.org_id)
+            if self.tool_mode:
+                response = self.answer_with_tools(message, self.org_id, memory)
+            else:
+                response = self.router_agent.route_query(
+                    message_lower, self.org_id, memory
+                )
+
+        except Exception as e:
+            response = f"I encountered an error analyzing your request: {str(e)}"
 
-            return response
+        if memory is not None:
+            memory.add_turn(message, response)
+        return response
 
+    async def achat(self, message: str, org_id: str = None, memory=None) -> str:
+        """Async chat interface for API servers - same routing as chat()"""
+        org_id = org_id or self.org_id
+        if not org_id:
+            return "Please select an organization first."
+
+        try:
+            if self.tool_mode:
+                response = await self.aanswer_with_tools(message, org_id, memory)
+            else:
+                response = await self.router_agent.aroute_query(
+                    message.lower(), org_id, memory
+                )
         except Exception as e:
-            return f"I encountered an error analyzing your request: {str(e)}"
+            response = f"I encountered an error analyzing your request: {str(e)}"
+
+        if memory is not None:
+            memory.add_turn(message, response)
+        return response
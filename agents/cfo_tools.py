@@ -0,0 +1,76 @@
+# agents/cfo_tools.py
+from typing import List, Optional
+
+from langchain_core.tools import BaseTool, StructuredTool
+from pydantic import BaseModel, Field
+
+from services.data_service import DataService
+
+
+class DateRangeArgs(BaseModel):
+    start_date: Optional[str] = Field(
+        None, description="Start date YYYY-MM-DD (default: 30 days before end_date)"
+    )
+    end_date: Optional[str] = Field(
+        None, description="End date YYYY-MM-DD (default: today)"
+    )
+
+
+class TopMerchantsArgs(DateRangeArgs):
+    limit: int = Field(5, ge=1, le=25, description="How many merchants to return")
+    category: Optional[str] = Field(None, description="Only this spending category")
+
+
+class DepartmentArgs(BaseModel):
+    department: str = Field(..., description="Department name, e.g. 'Engineering'")
+
+
+class NoArgs(BaseModel):
+    pass
+
+
+def build_cfo_tools(data_service: DataService, org_id) -> List[BaseTool]:
+    """Typed aggregate tools for the CFO agent, scoped to one organization.
+
+    The org is bound here, never taken from the model's arguments.
+    """
+
+    def spend_by_category(start_date=None, end_date=None):
+        return data_service.get_spend_by_category(org_id, start_date, end_date)
+
+    def top_merchants(start_date=None, end_date=None, limit=5, category=None):
+        return data_service.get_top_merchants(
+            org_id, start_date, end_date, limit, category
+        )
+
+    def department_budget_variance(department):
+        return data_service.get_department_budget_variance(org_id, department)
+
+    def invoice_aging():
+        return data_service.get_invoice_aging(org_id)
+
+    return [
+        StructuredTool.from_function(
+            spend_by_category,
+            description="Total spend per category for a date range.",
+            args_schema=DateRangeArgs,
+        ),
+        StructuredTool.from_function(
+            top_merchants,
+            description="Merchants with the highest spend for a date range, "
+            "optionally within one category.",
+            args_schema=TopMerchantsArgs,
+        ),
+        StructuredTool.from_function(
+            department_budget_variance,
+            description="Approved vs spent and variance % for one department's "
+            "budget lines.",
+            args_schema=DepartmentArgs,
+        ),
+        StructuredTool.from_function(
+            invoice_aging,
+            description="Unpaid invoices grouped by days past due "
+            "(current, 1-30, 31-60, 61-90, 90+).",
+            args_schema=NoArgs,
+        ),
+    ]
@@ -0,0 +1,78 @@
+# agents/conversation_memory.py
+from typing import Dict, List
+
+from agents.data_context import AgentDataContext
+
+
+class ConversationMemory:
+    """Bounded chat memory for one conversation.
+
+    - Keeps the last `window` messages verbatim; older ones are folded into a
+      rolling extractive summary capped at `summary_chars`.
+    - Owns an AgentDataContext so follow-up questions reuse the tables the
+      agents already loaded. At most `max_data_entries` entries, each valid for
+      `data_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        window: int = 12,
+        summary_chars: int = 1500,
+        max_data_entries: int = 16,
+        data_ttl: int = 300,
+    ):
+        self.window = window
+        self.summary_chars = summary_chars
+
+        self.messages: List[Dict] = []
+        self.summary = ""
+        self.summarized_count = 0
+        self.data = AgentDataContext(ttl=data_ttl, max_entries=max_data_entries)
+
+    # ---------------- Messages ----------------
+    def add(self, role: str, content: str) -> None:
+        self.messages.append({"role": role, "content": content})
+        overflow = len(self.messages) - self.window
+        if overflow > 0:
+            evicted, self.messages = self.messages[:overflow], self.messages[overflow:]
+            self._summarize(evicted)
+
+    def add_turn(self, question: str, answer: str) -> None:
+        self.add("user", question)
+        self.add("assistant", answer)
+
+    def _summarize(self, evicted: List[Dict]) -> None:
+        """Fold evicted messages into the summary (first sentence of each)"""
+        lines = []
+        for m in evicted:
+            text = " ".join(str(m["content"]).split())
+            first = text.split(". ")[0][:160]
+            who = "User asked" if m["role"] == "user" else "Assistant said"
+            lines.append(f"- {who}: {first}")
+        self.summarized_count += len(evicted)
+
+        summary = "\n".join(filter(None, [self.summary] + lines))
+        if len(summary) > self.summary_chars:
+            # Drop the oldest summary lines first
+            summary = summary[-self.summary_chars :]
+            summary = summary[summary.find("\n") + 1 :]
+        self.summary = summary
+
+    def context_text(self, recent: int = 4, max_chars: int = 400) -> str:
+        """Conversation context to prepend to agent prompts ("" if none)"""
+        parts = []
+        if self.summary:
+            parts.append(f"Earlier in this conversation:\n{self.summary}")
+        if self.messages:
+            turns = [
+                f"{m['role']}: {' '.join(str(m['content']).split())[:max_chars]}"
+                for m in self.messages[-recent:]
+            ]
+            parts.append("Recent messages:\n" + "\n".join(turns))
+        return "\n\n".join(parts)
+
+    def clear(self) -> None:
+        self.messages = []
+        self.summary = ""
+        self.summarized_count = 0
+        self.data.invalidate()
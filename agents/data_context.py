@@ -0,0 +1,199 @@
+# agents/data_context.py
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, Hashable, List, Optional
+
+import pandas as pd
+from supabase import Client
+
+from config.database import get_db
+from config.enviroment import get_config
+from services.snapshot_store import SnapshotStore
+from utils import clock
+
+# Widest transaction window the agents use; shorter windows are sliced from it
+TRANSACTION_WINDOW_DAYS = 90
+
+# Shared by every session's prefetch so warming never floods the database
+_prefetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agent-prefetch")
+
+
+class AgentDataContext:
+    """Shared, lazily loaded table data for the agents handling one request.
+
+    Each table/window is read at most once per org while the context lives
+    (ttl=None) or for `ttl` seconds. Concurrent callers asking for the same
+    key wait for the single in-flight load instead of querying again.
+    With use_snapshots=False agents always compute from the live tables.
+    """
+
+    def __init__(
+        self,
+        db: Optional[Client] = None,
+        ttl: Optional[float] = None,
+        max_entries: int = 32,
+        use_snapshots: bool = True,
+    ):
+        self.db: Client = db or get_db()
+        self.ttl = ttl
+        self.use_snapshots = use_snapshots
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---------------- Tables ----------------
+    def transactions(self, org_id, days: int = TRANSACTION_WINDOW_DAYS) -> List[Dict]:
+        """Transactions dated within the last `days` days"""
+        window = max(days, TRANSACTION_WINDOW_DAYS)
+        rows = self.get(
+            ("transactions", org_id, window),
+            lambda: self._select(
+                "transactions",
+                org_id,
+                since=(clock.now() - timedelta(days=window)).date().isoformat(),
+            ),
+        )
+        if days >= window:
+            return rows
+        since = (clock.now() - timedelta(days=days)).date().isoformat()
+        return [r for r in rows if str(r.get("date") or "") >= since]
+
+    def transactions_df(
+        self, org_id, days: int = TRANSACTION_WINDOW_DAYS
+    ) -> pd.DataFrame:
+        """Transactions as a DataFrame, built once and shared between agents"""
+        return self.get(
+            ("transactions_df", org_id, days),
+            lambda: pd.DataFrame(self.transactions(org_id, days)),
+        )
+
+    def invoices(self, org_id) -> List[Dict]:
+        return self.get(("invoices", org_id), lambda: self._select("invoices", org_id))
+
+    def overdue_invoices(self, org_id) -> List[Dict]:
+        return [inv for inv in self.invoices(org_id) if inv.get("is_overdue")]
+
+    def budgets(self, org_id) -> List[Dict]:
+        return self.get(("budgets", org_id), lambda: self._select("budgets", org_id))
+
+    def organization(self, org_id) -> Dict:
+        """The organizations row (settings hold e.g. cash_balance)"""
+        return self.get(
+            ("organization", org_id),
+            lambda: (
+                self.db.table("organizations").select("*").eq("id", org_id).execute().data
+                or [{}]
+            )[0],
+        )
+
+    def alerts(self, org_id) -> List[Dict]:
+        """Unread alerts, newest first"""
+        return self.get(
+            ("alerts", org_id),
+            lambda: self.db.table("alerts")
+            .select("*")
+            .eq("organization_id", org_id)
+            .eq("is_read", False)
+            .order("created_at", desc=True)
+            .execute()
+            .data
+            or [],
+        )
+
+    def snapshot(self, org_id) -> Optional[Dict]:
+        """Fresh precomputed agent context for the org, if any"""
+        if not self.use_snapshots or get_config("SNAPSHOTS_ENABLED", "1") in {
+            "0",
+            "false",
+            "False",
+        }:
+            return None
+        return self.get(
+            ("snapshot", org_id), lambda: SnapshotStore(self.db).load(org_id)
+        )
+
+    def prefetch(self, org_id) -> None:
+        """Warm what the Quick Question agents read, in the background.
+
+        Non-blocking; entries already cached are not reloaded, and a question
+        asked mid-prefetch waits on the in-flight load instead of re-querying.
+        """
+        loaders = [
+            self.snapshot,
+            self.transactions_df,
+            self.budgets,
+            self.invoices,
+            self.alerts,
+        ]
+        for load in loaders:
+            _prefetch_pool.submit(self._warm, load, org_id)
+
+    def _warm(self, load: Callable, org_id) -> None:
+        try:
+            load(org_id)
+        except Exception as e:
+            print(f"Error prefetching agent data: {e}")
+
+    # ---------------- Cache ----------------
+    def get(self, key: Hashable, loader: Callable):
+        """Return the cached value for key, running loader once if missing/stale"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (self.ttl is None or now - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                future, owner = entry[1], False
+            else:
+                future, owner = Future(), True
+                self._entries[key] = (now, future)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        if owner:
+            try:
+                future.set_result(loader())
+            except Exception as e:
+                future.set_exception(e)
+                with self._lock:
+                    if self._entries.get(key, (None, None))[1] is future:
+                        del self._entries[key]
+        return future.result()
+
+    def invalidate(self, org_id=None) -> None:
+        """Drop cached data (for one org, or everything)"""
+        with self._lock:
+            if org_id is None:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if len(k) > 1 and k[1] == org_id]:
+                del self._entries[key]
+
+    def export(self) -> List[List]:
+        """Loaded entries as [key, value] pairs; DataFrames are derived, so skipped"""
+        with self._lock:
+            entries = list(self._entries.items())
+        return [
+            [list(key), future.result()]
+            for key, (_, future) in entries
+            if future.done()
+            and future.exception() is None
+            and not isinstance(future.result(), pd.DataFrame)
+        ]
+
+    def seed(self, entries: List[List]) -> None:
+        """Pre-populate the cache from export() output (offline replays)"""
+        now = time.time()
+        with self._lock:
+            for key, value in entries:
+                future = Future()
+                future.set_result(value)
+                self._entries[tuple(key)] = (now, future)
+
+    def _select(self, table: str, org_id, since: Optional[str] = None) -> List[Dict]:
+        q = self.db.table(table).select("*").eq("organization_id", org_id)
+        if since:
+            q = q.gte("date", since)
+        return q.execute().data or []
@@ -1,5 +1,7 @@
 # agents/policy_agent.py
 from agents.base_agent import BaseAgent
+from services.policy_index import get_policy_index
+from services.policy_vectors import get_policy_vector_index
 
 class PolicyAgent(BaseAgent):
     """📚 Policy & Compliance Agent - handles rules and compliance"""
@@ -10,13 +12,13 @@ class PolicyAgent(BaseAgent):
             description="Policy interpretation and compliance checking"
         )
     
-    def analyze(self, org_id: str, query: str):
-        """Answer policy-related questions"""
-        # Get policies
-        policies = self._get_policies(org_id)
-        
-        # Search relevant policies
-        relevant = self._search_policies(policies, query)
+    def build_prompt(self, org_id: str, query: str, data):
+        """Build prompt for policy-related questions"""
+        # Through the request's data context, so benchmark recordings capture
+        # the policies and replays never query the policy indexes
+        relevant = data.get(
+            ("policies", org_id, query), lambda: self._relevant(org_id, query)
+        )
         
         # Generate response
         prompt = f"""
@@ -28,28 +30,30 @@ class PolicyAgent(BaseAgent):
         Provide clear guidance based on company policies.
         If no specific policy exists, suggest best practices.
         """
-        
-        response = self.llm.invoke(prompt)
-        return response.content
+        return prompt
     
-    def _get_policies(self, org_id):
-        """Get policy documents"""
-        result = self.db.table('policy_documents')\
-            .select("*")\
-            .eq('organization_id', org_id)\
-            .execute()
-        return result.data
+    def _relevant(self, org_id, query):
+        """Relevant policy chunks (semantic), or whole documents via BM25"""
+        relevant = self._search_chunks(org_id, query)
+        if relevant is None:
+            relevant = self._search_policies(org_id, query)
+        return relevant
     
-    def _search_policies(self, policies, query):
-        """Search for relevant policies"""
-        query_lower = query.lower()
-        relevant = []
-        
-        for policy in policies:
-            if any(word in policy['content'].lower() for word in query_lower.split()):
-                relevant.append(policy)
-        
-        return relevant[:3]  # Top 3 most relevant
+    def _search_chunks(self, org_id, query, k=4):
+        """Top-k policy chunks by embedding similarity; None if vectors are unavailable"""
+        vectors = get_policy_vector_index(org_id)
+        if vectors is None:
+            return None
+        try:
+            chunks = vectors.search(query, k)
+        except Exception as e:
+            print(f"Error in policy vector search: {e}")
+            return None
+        return [{"category": c["category"], "content": c["text"]} for c in chunks]
+    
+    def _search_policies(self, org_id, query, k=3):
+        """Top-k policies ranked by relevance to the query"""
+        return get_policy_index(org_id).search(query, k)
     
     def _format_policies(self, policies):
         """Format policies for display"""
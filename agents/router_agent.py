@@ -25,37 +25,68 @@ class RouterAgent(BaseAgent):
             "policy": PolicyAgent(),
         }
 
-    def route_query(self, query: str, org_id: str):
-        """Analyze query and route to appropriate agent"""
+    def route_query(self, query: str, org_id: str, memory=None, data=None):
+        """Analyze query and route to appropriate agent.
+
+        `data` is the AgentDataContext shared by every agent in this request;
+        by default the conversation's (if any) or a fresh one.
+        """
+        data = self._data_context(memory, data)
+        agent_name = self._match_agent(query)
+        if agent_name:
+            return self.agents[agent_name].analyze(org_id, query, memory, data)
+
+        # Use LLM to determine best agent
+        return self._smart_route(query, org_id, memory, data)
+
+    async def aroute_query(self, query: str, org_id: str, memory=None, data=None):
+        """Async version of route_query"""
+        data = self._data_context(memory, data)
+        agent_name = self._match_agent(query)
+        if not agent_name:
+            response = await self.llm.ainvoke(
+                self._smart_route_prompt(query), config=self.llm_config(org_id)
+            )
+            agent_name = self._resolve_agent(response.content)
+
+        return await self.agents[agent_name].aanalyze(org_id, query, memory, data)
+
+    def _match_agent(self, query: str):
+        """Pick an agent by keywords; None if nothing matches"""
         query_lower = query.lower()
 
         # Determine which agent to use based on keywords
         if any(word in query_lower for word in ["cash", "flow", "runway", "forecast"]):
-            return self.agents["cashflow"].analyze(org_id, query)
+            return "cashflow"
 
         elif any(
             word in query_lower for word in ["spend", "expense", "cost", "purchase"]
         ):
-            return self.agents["spending"].analyze(org_id, query)
+            return "spending"
 
         elif any(word in query_lower for word in ["alert", "warning", "risk", "fraud"]):
-            return self.agents["alert"].analyze(org_id, query)
+            return "alert"
 
         elif any(word in query_lower for word in ["budget", "variance", "allocation"]):
-            return self.agents["budget"].analyze(org_id, query)
+            return "budget"
 
         elif any(
             word in query_lower for word in ["policy", "rule", "compliance", "approval"]
         ):
-            return self.agents["policy"].analyze(org_id, query)
+            return "policy"
 
-        else:
-            # Use LLM to determine best agent
-            return self._smart_route(query, org_id)
+        return None
 
-    def _smart_route(self, query: str, org_id: str):
+    def _smart_route(self, query: str, org_id: str, memory=None, data=None):
         """Use AI to determine best agent"""
-        prompt = f"""
+        response = self.llm.invoke(
+            self._smart_route_prompt(query), config=self.llm_config(org_id)
+        )
+        agent_name = self._resolve_agent(response.content)
+        return self.agents[agent_name].analyze(org_id, query, memory, data)
+
+    def _smart_route_prompt(self, query: str) -> str:
+        return f"""
         User query: {query}
         
         Available agents:
@@ -68,11 +99,9 @@ class RouterAgent(BaseAgent):
         Which agent should handle this? Return only the agent name.
         """
 
-        response = self.llm.invoke(prompt)
-        agent_name = response.content.strip().lower()
-
+    def _resolve_agent(self, answer: str) -> str:
+        agent_name = answer.strip().lower()
         if agent_name in self.agents:
-            return self.agents[agent_name].analyze(org_id, query)
-        else:
-            # Default to spending agent
-            return self.agents["spending"].analyze(org_id, query)
+            return agent_name
+        # Default to spending agent
+        return "spending"
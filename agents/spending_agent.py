@@ -1,38 +1,64 @@
 # agents/spending_agent.py
-from datetime import datetime, timedelta
 from agents.base_agent import BaseAgent
+from services.anomaly_detector import detect_anomalies
+from services.cashflow_forecast import spend_rows
 import pandas as pd
-import json
 
 
 class SpendingAgent(BaseAgent):
     """💸 Spending Analyzer - analyzes expenses and finds savings"""
 
+    budget_key = "spending"
+    snapshot_key = "spending"
+    empty_response = "No transaction data available for analysis."
+
     def __init__(self):
         super().__init__(
             name="Spending Analyzer Agent",
             description="Analyzes spending patterns and optimization",
         )
 
-    def analyze(self, org_id: str, query: str):
-        """Analyze spending patterns"""
-        # Get data
-        transactions = self._get_recent_transactions(org_id)
+    def build_prompt(self, org_id: str, query: str, data):
+        """Build the spending analysis prompt"""
+        analysis = self.load_context(org_id, data)
+
+        if analysis is None:
+            return None
 
-        if not transactions:
-            return "No transaction data available for analysis."
+        anomalies = analysis["anomalies"]
+        if not isinstance(anomalies, dict):
+            # Snapshot built before the anomaly engine: just a fraud-flag count
+            anomalies = {"count": anomalies, "by_reason": {}, "top": []}
+        reasons = ", ".join(f"{r}: {c}" for r, c in anomalies["by_reason"].items())
 
-        # Analyze
-        analysis = self._analyze_spending(transactions)
+        payload = (
+            self.new_payload()
+            .add_line(f"Total spent (90 days): ${analysis['total']:,.2f}")
+            .add_mapping("Categories", analysis["by_category"], "category", "amount")
+            .add_mapping(
+                "Top merchants",
+                analysis["top_merchants"],
+                "merchant",
+                "amount",
+                top_k=5,
+            )
+            .add_line(
+                f"Unusual transactions: {anomalies['count']}"
+                + (f" ({reasons})" if reasons else "")
+            )
+            .add_table(
+                "Most unusual",
+                anomalies["top"],
+                ["date", "merchant", "category", "amount", "reasons"],
+                top_k=5,
+            )
+        )
 
         # Generate insights
         prompt = f"""
         Analyze this spending data and answer the user's question:
         
-        Total spent (90 days): ${analysis['total']:,.2f}
-        Categories: {json.dumps(analysis['by_category'], indent=2)}
-        Top merchants: {json.dumps(analysis['top_merchants'], indent=2)}
-        Unusual transactions: {analysis['anomalies']}
+        {payload.render()}
         
         User question: {query}
         
@@ -42,34 +68,25 @@ class SpendingAgent(BaseAgent):
         3. Cost saving opportunities
         4. Specific recommendations
         """
+        return prompt
 
-        response = self.llm.invoke(prompt)
-        return response.content
-
-    def _get_recent_transactions(self, org_id):
-        """Get recent transactions"""
-        result = (
-            self.db.table("transactions")
-            .select("*")
-            .eq("organization_id", org_id)
-            .gte(
-                "date",
-                (datetime.now() - timedelta(days=90)).date().isoformat(),
-            )
-            .execute()
-        )
-        return result.data
+    @classmethod
+    def compute_context(cls, org_id: str, data):
+        """Spending analysis over the shared 90-day frame (None if no data)"""
+        df = spend_rows(data.transactions_df(org_id, days=90))
+        if df.empty:
+            return None
+        return cls._analyze_spending(df)
 
-    def _analyze_spending(self, transactions):
+    @staticmethod
+    def _analyze_spending(df: pd.DataFrame):
         """Analyze spending patterns"""
-        df = pd.DataFrame(transactions)
 
         return {
             "total": float(df["amount"].sum()),
             "by_category": df.groupby("category")["amount"].sum().to_dict(),
-            "top_merchants": df.groupby("merchant")["amount"]
-            .sum()
-            .nlargest(5)
-            .to_dict(),
-            "anomalies": len(df[df["fraud_flag"] == 1]),
+            # Full merchant totals; the payload keeps the top few plus "other"
+            "top_merchants": df.groupby("merchant")["amount"].sum().to_dict(),
+            # Statistical outliers, spikes, new merchants, duplicates, fraud flags
+            "anomalies": detect_anomalies(df),
         }
@@ -2,8 +2,16 @@
 import streamlit as st
 import os
 from agents.cfo_agent import CFOAgent
+from agents.conversation_memory import ConversationMemory
 from config.enviroment import get_config
 from services.data_service import DataService
+from services.llm_gateway import get_llm_meter
+from services.runway_simulator import runway_label
+from services.quick_answers import (
+    QUICK_QUESTIONS,
+    freshness_label,
+    get_quick_answer_store,
+)
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
@@ -31,8 +39,8 @@ if "agent" not in st.session_state:
     st.session_state.agent = CFOAgent()
     st.session_state.data_service = DataService()
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
 
 # Header
 st.title("💼 AI CFO Assistant")
@@ -49,15 +57,55 @@ tab_labels = [
 tabs = st.tabs(tab_labels)
 tab1, tab2, tab3, tab_tx, tab4 = tabs[0], tabs[1], tabs[2], tabs[3], tabs[4]
 
+QUICK_ANSWERS_ENABLED = get_config("QUICK_ANSWERS_ENABLED", "1") in {
+    "1",
+    "true",
+    "True",
+}
+
+
 # Tab 1: Chat Interface
-with tab1:
-    org_id = current_user["organization_id"]
+@st.fragment
+def render_chat(org_id):
+    """Chat tab as a fragment: sending a message reruns only the chat, not the
+    dashboard queries, and only the bounded memory window is re-rendered."""
+    memory = st.session_state.memory
+    quick_answers = get_quick_answer_store() if QUICK_ANSWERS_ENABLED else None
+    if org_id:
+        # Quick Questions then only wait on the LLM
+        memory.data.prefetch(org_id)
+        if quick_answers:
+            quick_answers.refresh(org_id)
+
+    def ask(question):
+        with st.spinner("Analyzing..."):
+            st.session_state.agent.chat(question, org_id, memory=memory)
+        st.rerun(scope="fragment")
+
+    def ask_quick(question):
+        """Precomputed answer for the current data, generated only if missing"""
+        if not (quick_answers and org_id):
+            ask(question)
+            return
+        with st.spinner("Analyzing..."):
+            entry = quick_answers.answer(org_id, question)
+        note = freshness_label(entry)
+        memory.add_turn(
+            question, f"{entry['answer']}\n\n_{note}_" if note else entry["answer"]
+        )
+        st.rerun(scope="fragment")
 
     col1, col2 = st.columns([2, 1])
 
     with col1:
+        if memory.summary:
+            with st.expander(
+                f"Earlier conversation ({memory.summarized_count} messages summarized)"
+            ):
+                st.markdown(memory.summary)
+
         # Render chat history (no border/rectangle)
-        for message in st.session_state.messages:
+        for message in memory.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
 
@@ -75,38 +123,19 @@ with tab1:
     with col2:
         st.subheader("💡 Quick Questions")
 
-        questions = [
-            "What's our spending trend?",
-            "Which departments are over budget?",
-            "How can we reduce costs?",
-            "What's our cash runway?",
-            "Find unusual transactions",
-        ]
-
-        for q in questions:
+        for q in QUICK_QUESTIONS:
             if st.button(q, key=f"q_{q}"):
-                # Show user bubble and assistant spinner immediately
-
-                with st.chat_message("user"):
-                    st.markdown(q)
-                with st.chat_message("assistant"):
-                    with st.spinner("Analyzing..."):
-                        resp = st.session_state.agent.chat(q, org_id)
-                    st.markdown(resp)
-                st.session_state.messages.append({"role": "user", "content": q})
-                st.session_state.messages.append({"role": "assistant", "content": resp})
-                st.rerun()
+                ask_quick(q)
 
     if prompt := st.chat_input("Ask about finances, budgets, or spending..."):
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        with st.chat_message("assistant"):
-            with st.spinner("Analyzing..."):
-                response = st.session_state.agent.chat(prompt, org_id)
-            st.markdown(response)
-        st.session_state.messages.append({"role": "assistant", "content": response})
-        st.rerun()
+        with col1:
+            with st.chat_message("user"):
+                st.markdown(prompt)
+        ask(prompt)
+
+
+with tab1:
+    render_chat(current_user["organization_id"])
 
 # Tab 2: Dashboard
 with tab2:
@@ -191,6 +220,59 @@ with tab2:
                 f"${net:,.0f}",
             )
 
+        low, high = cf.get("monthly_burn_low"), cf.get("monthly_burn_high")
+        if low is not None and high is not None:
+            st.caption(
+                f"Next month's burn: ${low:,.0f} – ${high:,.0f} "
+                f"({cf['forecast']['coverage']:.0%} interval, weekly-seasonal forecast)"
+            )
+
+        sim = cf.get("runway_simulation")
+        if sim:
+            r1, r2, r3, r4 = st.columns(4)
+            with r1:
+                st.metric("Cash Balance", f"${cf.get('cash_balance', 0):,.0f}")
+            for col, p in zip((r2, r3, r4), ("p10", "p50", "p90")):
+                with col:
+                    st.metric(
+                        f"Runway {p.upper()}",
+                        f"{runway_label(sim, sim[p + '_months'])} mo",
+                        help=f"{p.upper()} of {sim['paths']:,} simulated cash paths "
+                        "(historical spend weeks, invoice collection odds by age)",
+                    )
+            if sim.get("prob_out_of_cash_6m", 0) >= 0.1:
+                st.warning(
+                    f"{sim['prob_out_of_cash_6m']:.0%} of simulated paths run out of cash within 6 months."
+                )
+
+        # Daily spend forecast with its prediction band
+        forecast = cf.get("forecast") or {}
+        if forecast.get("dates"):
+            fig = go.Figure()
+            fig.add_trace(
+                go.Scatter(
+                    x=forecast["dates"] + forecast["dates"][::-1],
+                    y=forecast["daily_high"] + forecast["daily_low"][::-1],
+                    fill="toself",
+                    fillcolor="rgba(99, 110, 250, 0.2)",
+                    line=dict(width=0),
+                    name=f"{forecast['coverage']:.0%} interval",
+                    hoverinfo="skip",
+                )
+            )
+            fig.add_trace(
+                go.Scatter(
+                    x=forecast["dates"],
+                    y=forecast["daily_mean"],
+                    mode="lines",
+                    name="Forecast daily spend",
+                )
+            )
+            fig.update_layout(
+                title="Spend Forecast (Next 3 Months)", yaxis_title="USD"
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
         # Visualize components
         try:
             chart_df = pd.DataFrame(
@@ -326,12 +408,23 @@ with tab3:
             "Budget Analysis",
             "Cashflow Forecast",
             "Cost Optimization",
+            "Full Report (all analyses)",
         ],
     )
-    org_id = (current_user.get("organization_id"),)
+    org_id = current_user.get("organization_id")
     if st.button("Generate Analysis"):
         with st.spinner("Generating insights..."):
-            if analysis_type == "Spending Trends":
+            if analysis_type == "Full Report (all analyses)":
+                # One batched LLM round trip for spending, budget and cashflow
+                report = st.session_state.agent.analyze_all(org_id)
+                response = "\n\n".join(
+                    [
+                        "### 💸 Spending Trends\n" + report["spending"],
+                        "### 🧾 Budget Analysis\n" + report["budget"],
+                        "### 📊 Cashflow Forecast\n" + report["cashflow"],
+                    ]
+                )
+            elif analysis_type == "Spending Trends":
                 response = st.session_state.agent.analyze_spending(
                     "Analyze spending trends and patterns",
                     org_id,
@@ -1289,9 +1382,17 @@ with st.sidebar:
 
     st.subheader("🔧 Settings")
     if st.button("Clear Chat History"):
-        st.session_state.messages = []
+        st.session_state.memory.clear()
         st.rerun()
 
     st.subheader("📊 Data Status")
     st.success("✅ Database Connected")
     st.success("✅ AI Model Ready")
+
+    if is_admin(current_user):
+        with st.expander("🧮 AI Usage (this server)"):
+            usage = get_llm_meter().summary()
+            if usage:
+                st.dataframe(pd.DataFrame(usage), hide_index=True)
+            else:
+                st.caption("No AI calls yet")
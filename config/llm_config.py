@@ -4,6 +4,8 @@ import os
 from dotenv import load_dotenv
 
 from config.enviroment import get_config
+from services.llm_gateway import LLMGateway, llm_timeout
+from services.llm_replay import get_replay_llm, replay_mode
 
 load_dotenv()
 
@@ -17,14 +19,31 @@ except Exception:
 
 
 def get_llm(temperature=0.1):
-    """Initialize DeepSeek LLM with OpenAI-compatible API"""
-    return ChatOpenAI(
-        model="deepseek-chat",
-        api_key=get_config("DEEPSEEK_API_KEY"),
-        base_url=get_config("DEEPSEEK_BASE_URL"),
-        temperature=temperature,
-        max_tokens=2000,
-    )
+    """Initialize DeepSeek LLM with OpenAI-compatible API.
+
+    Wrapped in LLMGateway (concurrency limits, retries, per-org metering)
+    unless LLM_GATEWAY_ENABLED=0; the gateway owns retries, so the client's
+    own are disabled. LLM_REPLAY_MODE=record|replay puts a cassette model
+    in front (services/llm_replay.py); replay needs no API key.
+    """
+    mode = replay_mode()
+    if mode == "replay":
+        llm = get_replay_llm()
+    else:
+        llm = ChatOpenAI(
+            model="deepseek-chat",
+            api_key=get_config("DEEPSEEK_API_KEY"),
+            base_url=get_config("DEEPSEEK_BASE_URL"),
+            temperature=temperature,
+            max_tokens=2000,
+            timeout=llm_timeout(),
+            max_retries=0,
+        )
+        if mode == "record":
+            llm = get_replay_llm(inner=llm)
+    if get_config("LLM_GATEWAY_ENABLED", "1") in {"0", "false", "False"}:
+        return llm
+    return LLMGateway(llm)
 
 
 def test_connection():
@@ -0,0 +1,141 @@
+"""
+scripts/benchmark_agents.py
+
+Benchmarks the full CFOAgent.chat path against a recorded LLM cassette, so it
+runs offline on any box (no DeepSeek endpoint, no Supabase reads).
+
+1. Record once with live services; this writes the cassette (LLM_CASSETTE)
+   and the table data the agents read to <cassette>.data.json:
+     LLM_REPLAY_MODE=record BENCH_ORGANIZATION_ID=... python -m scripts.benchmark_agents
+2. Replay as often as needed:
+     LLM_REPLAY_MODE=replay BENCH_ORGANIZATION_ID=... python -m scripts.benchmark_agents
+
+Prompts must match the recording byte for byte, so the recording's clock time
+is stored in the cassette and pinned during replay (date windows, "today" in
+prompts). Replay is strict: a prompt with no recorded completion fails that
+reply, and the run exits non-zero.
+
+Env:
+- BENCH_ORGANIZATION_ID (required)
+- BENCH_QUESTIONS: file with one question per line (default: the Quick Questions)
+- BENCH_RUNS (default 3), BENCH_CONCURRENCY (default 4)
+- LLM_REPLAY_LATENCY: seconds per call, or "recorded" (default)
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from config.enviroment import get_config
+from services.quick_answers import QUICK_QUESTIONS
+from utils import clock
+
+# CFOAgent.chat's reply when the turn failed (including a replay miss)
+ERROR_REPLY = "I encountered an error"
+
+
+def load_questions():
+    path = get_config("BENCH_QUESTIONS")
+    if not path:
+        return QUICK_QUESTIONS
+    lines = Path(path).read_text(encoding="utf-8").splitlines()
+    return [q.strip() for q in lines if q.strip()]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    os.environ.setdefault("LLM_REPLAY_MODE", "replay")
+    os.environ.setdefault("LLM_REPLAY_STRICT", "1")
+
+    # Imported after the mode is set so get_llm builds the replay model
+    from agents.cfo_agent import CFOAgent
+    from agents.conversation_memory import ConversationMemory
+    from services.llm_gateway import get_llm_meter
+    from services.llm_replay import DEFAULT_CASSETTE, get_cassette
+
+    org_id = get_config("BENCH_ORGANIZATION_ID")
+    if not org_id:
+        raise SystemExit("BENCH_ORGANIZATION_ID must be set")
+
+    mode = get_config("LLM_REPLAY_MODE")
+    cassette_path = get_config("LLM_CASSETTE", DEFAULT_CASSETTE)
+    fixture_path = Path(cassette_path).with_suffix(".data.json")
+    questions = load_questions()
+    agent = CFOAgent()
+    cassette = get_cassette(cassette_path)
+
+    if mode == "record":
+        started_at = clock.now()
+        clock.pin(started_at)
+        cassette.set_meta("now", started_at.isoformat())
+        memory = ConversationMemory()
+        recorded = {}
+        for q in questions:
+            print(f"Recording: {q}")
+            memory.clear()
+            agent.chat(q, org_id, memory=memory)
+            for key, value in memory.data.export():
+                recorded[json.dumps(key)] = [key, value]
+
+        fixtures = {}
+        if fixture_path.exists():
+            fixtures = json.loads(fixture_path.read_text(encoding="utf-8"))
+        fixtures[org_id] = list(recorded.values())
+        fixture_path.write_text(json.dumps(fixtures, default=str), encoding="utf-8")
+        cassette.flush()
+        print(f"Recorded {cassette.stats['recorded']} completions")
+        return
+
+    if not fixture_path.exists():
+        raise SystemExit(
+            f"No recorded data at {fixture_path}; run with LLM_REPLAY_MODE=record first"
+        )
+    entries = json.loads(fixture_path.read_text(encoding="utf-8")).get(org_id, [])
+    if not cassette.meta.get("now"):
+        raise SystemExit(f"{cassette_path} has no recording time; record it again")
+    clock.pin(datetime.fromisoformat(cassette.meta["now"]))
+
+    def run(q):
+        memory = ConversationMemory()
+        memory.data.seed(entries)
+        started = time.perf_counter()
+        reply = agent.chat(q, org_id, memory=memory)
+        return time.perf_counter() - started, not reply.startswith(ERROR_REPLY)
+
+    calls = questions * int(get_config("BENCH_RUNS", "3"))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(
+        max_workers=int(get_config("BENCH_CONCURRENCY", "4"))
+    ) as pool:
+        results = list(pool.map(run, calls))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+    failed = sum(1 for _, ok in results if not ok)
+
+    stats = cassette.stats
+    tokens = sum(
+        r["prompt_tokens"] + r["completion_tokens"] for r in get_llm_meter().summary()
+    )
+    print(f"Calls: {len(calls)} in {elapsed:.2f}s ({len(calls) / elapsed:.1f}/s)")
+    print(
+        f"Latency p50={percentile(latencies, 50) * 1000:.0f}ms "
+        f"p95={percentile(latencies, 95) * 1000:.0f}ms "
+        f"max={max(latencies) * 1000:.0f}ms"
+    )
+    print(f"Cassette hits={stats['hits']} misses={stats['misses']}; tokens={tokens}")
+    if failed or stats["misses"]:
+        print(
+            f"FAILED: {failed} of {len(calls)} replies (replay misses count as failures)"
+        )
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
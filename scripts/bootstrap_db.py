@@ -3,6 +3,8 @@ scripts/bootstrap_db.py
 
 Bootstraps the Supabase database for local development.
 It checks for required tables and if missing, applies db/schema.sql using the SQL RPC endpoint.
+It then checks for columns added after the original schema (REQUIRED_COLUMNS) and adds
+the missing ones the same way; StripeService skips them on databases without them.
 
 Requirements:
 - SUPABASE_URL
@@ -22,6 +24,14 @@ REQUIRED_TABLES = [
     "chat_history",
 ]
 
+# Columns added after the original schema: (table, column, type)
+REQUIRED_COLUMNS = [
+    # Stripe fee/net from the balance transaction behind each charge
+    ("transactions", "fee", "numeric"),
+    ("transactions", "net", "numeric"),
+    ("transactions", "balance_transaction_id", "text"),
+]
+
 
 def main():
     load_dotenv()
@@ -61,6 +71,37 @@ def main():
                 )
                 return
 
+    # Columns newer code writes; older databases get them added
+    missing_columns = []
+    for table, column, col_type in REQUIRED_COLUMNS:
+        try:
+            client.table(table).select(column).limit(1).execute()
+        except Exception:
+            missing_columns.append((table, column, col_type))
+
+    if missing_columns:
+        print(
+            "Missing columns: "
+            + ", ".join(f"{t}.{c}" for t, c, _ in missing_columns)
+            + ". Adding them ..."
+        )
+        migration = "\n".join(
+            f"alter table {t} add column if not exists {c} {col_type};"
+            for t, c, col_type in missing_columns
+        )
+        try:
+            client.rpc("pg_exec", {"sql": migration}).execute()
+            print("Columns added via pg_exec RPC.")
+        except Exception:
+            try:
+                client.rpc("sql", {"query": migration}).execute()
+                print("Columns added via sql RPC.")
+            except Exception:
+                print(
+                    "Could not add columns via RPC. Run this in the Supabase SQL editor:\n"
+                    + migration
+                )
+
     # Optionally seed
     if os.getenv("SEED") == "1":
         seed_path = Path(__file__).resolve().parents[1] / "db" / "seed.sql"
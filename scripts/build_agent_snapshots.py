@@ -0,0 +1,143 @@
+"""
+scripts/build_agent_snapshots.py
+
+Nightly job that precomputes the pre-LLM agent context (spending breakdown,
+cashflow metrics, budget variance, risk list) for each organization and
+stores it in agent_context_snapshots. Agents read the snapshot while it is
+fresh (SNAPSHOT_MAX_AGE_HOURS) and fall back to live queries otherwise.
+Schedule after daily_sync via cron or Windows Task Scheduler.
+
+Env:
+- SNAPSHOT_ORGANIZATION_ID: only build this org (default: all organizations)
+- SNAPSHOT_STORE / SNAPSHOT_DIR: see services/snapshot_store.py
+- SNAPSHOT_WRITE_ALERTS=0: don't raise alerts for new transaction anomalies
+"""
+
+import time
+from datetime import datetime
+
+from agents.alert_agent import AlertAgent
+from agents.budget_agent import BudgetAgent
+from agents.cashflow_agent import CashflowAgent
+from agents.data_context import AgentDataContext
+from agents.spending_agent import SpendingAgent
+from config.database import get_db
+from config.enviroment import get_config
+from services.anomaly_detector import anomaly_alert_rows
+from services.cashflow_forecast import daily_outflows, forecast_outflows
+from services.risk_rules import get_risk_engine, risk_frames
+from services.snapshot_store import SnapshotStore
+
+SNAPSHOT_AGENTS = [SpendingAgent, CashflowAgent, BudgetAgent, AlertAgent]
+
+
+def build_snapshot(org_id, db, data=None, precomputed=None) -> dict:
+    """Compute every agent's snapshot section from one shared data context.
+
+    Sections in `precomputed` (e.g. batch-evaluated risks) are used as-is.
+    """
+    data = data or AgentDataContext(db)
+    precomputed = precomputed or {}
+    return {
+        agent.snapshot_key: (
+            precomputed[agent.snapshot_key]
+            if agent.snapshot_key in precomputed
+            else agent.compute_context(org_id, data)
+        )
+        for agent in SNAPSHOT_AGENTS
+    }
+
+
+def write_anomaly_alerts(org_id, snapshot: dict, db) -> int:
+    """Insert alerts for anomalies not already alerted on; returns how many"""
+    spending = snapshot.get("spending") or {}
+    rows = anomaly_alert_rows(org_id, spending.get("anomalies") or {})
+    if not rows:
+        return 0
+
+    existing = (
+        db.table("alerts")
+        .select("data")
+        .eq("organization_id", org_id)
+        .eq("alert_type", "transaction_anomaly")
+        .execute()
+        .data
+        or []
+    )
+    seen = {str((a.get("data") or {}).get("transaction_id")) for a in existing}
+    rows = [r for r in rows if str(r["data"]["transaction_id"]) not in seen]
+    if rows:
+        db.table("alerts").insert(rows).execute()
+    return len(rows)
+
+
+def prefit_forecasts(org_ids, data) -> None:
+    """Fit every org's cashflow forecast in one vectorized batch.
+
+    The fits are cached, so CashflowAgent reuses them while building snapshots.
+    """
+    series = {}
+    for org_id in org_ids:
+        try:
+            series[org_id] = daily_outflows(data.transactions_df(org_id, days=90))
+        except Exception as e:
+            print(
+                f"[{datetime.utcnow().isoformat()}] Forecast data error for {org_id}: {e}"
+            )
+    forecast_outflows(series)
+
+
+def evaluate_risks(org_ids, data) -> dict:
+    """Every risk rule over every org in one batch: {org_id: alert section}"""
+    engine = get_risk_engine()
+    fired = engine.evaluate(risk_frames(data, org_ids, engine.tables))
+    return {org_id: {"risks": fired.get(org_id, [])} for org_id in org_ids}
+
+
+def main():
+    db = get_db()
+    store = SnapshotStore(db)
+
+    org_id = get_config("SNAPSHOT_ORGANIZATION_ID")
+    if org_id:
+        org_ids = [org_id]
+    else:
+        org_ids = [
+            o["id"] for o in db.table("organizations").select("id").execute().data or []
+        ]
+
+    write_alerts = get_config("SNAPSHOT_WRITE_ALERTS", "1") in {"1", "true", "True"}
+
+    started = time.time()
+    data = AgentDataContext(db, max_entries=max(32, 8 * len(org_ids)))
+    prefit_forecasts(org_ids, data)
+    try:
+        risks = evaluate_risks(org_ids, data)
+    except Exception as e:
+        # Per-org AlertAgent evaluation below still covers it
+        print(f"[{datetime.utcnow().isoformat()}] Batch risk evaluation error: {e}")
+        risks = {}
+
+    built, failed = 0, 0
+    for org_id in org_ids:
+        try:
+            precomputed = {"alert": risks[org_id]} if org_id in risks else None
+            snapshot = build_snapshot(org_id, db, data, precomputed)
+            where = store.save(org_id, snapshot)
+            built += 1
+            alerted = write_anomaly_alerts(org_id, snapshot, db) if write_alerts else 0
+            print(
+                f"[{datetime.utcnow().isoformat()}] Snapshot for {org_id} -> {where}"
+                f" ({alerted} new anomaly alerts)"
+            )
+        except Exception as e:
+            failed += 1
+            print(f"[{datetime.utcnow().isoformat()}] Snapshot error for {org_id}: {e}")
+        finally:
+            data.invalidate(org_id)
+
+    print(f"Built {built} snapshots ({failed} failed) in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,211 @@
 """
-Run daily to sync recent Stripe transactions. Intended to be scheduled via Windows Task Scheduler or cron.
+Run daily to sync recent Stripe transactions into each organization.
+Intended to be scheduled via Windows Task Scheduler or cron.
 Requires STRIPE_API_KEY and Supabase env vars.
+
+Orgs are the ones in SYNC_ORGANIZATION_ID, or every organization. All of
+them share the platform Stripe account. A single configured org owns
+everything on it, as before. With several orgs, each one only gets the
+objects tagged with its id in metadata.organization_id (top-ups and
+payouts set it); untagged objects are left out rather than assigned to
+whichever org syncs first. Each org runs StripeService.sync_incremental,
+so only what's new since its cursor is fetched.
+
+Orgs sync in parallel on a thread pool. Threads share the process's Stripe
+rate limiter, so the pool can't push the API key over its limit. Each org
+syncs at most once at a time: a run lock keeps overlapping runs out.
+Progress is checkpointed to <SYNC_CHECKPOINT_DIR>/<SYNC_RUN_ID>.json after
+every org, so rerunning a crashed run skips orgs already done and retries
+the failed ones.
+
+Env:
+- SYNC_ORGANIZATION_ID: only these orgs (comma-separated)
+- SYNC_WORKERS: orgs synced at once (default 8)
+- SYNC_RUN_ID: checkpoint name (default: today's UTC date)
+- SYNC_CHECKPOINT_DIR (default .cache/daily_sync)
+- SYNC_LOCK_SECONDS: age after which a crashed run's lock is taken over
+  (default 3600); a live run touches its lock every quarter of that
+- SYNC_DAYS: backfill for an org's first sync (default 7)
 """
 
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from config.database import get_db
 from config.enviroment import get_config
 from services.stripe_service import StripeService
 
 
-# def main():
-# org_id = get_config("SYNC_ORGANIZATION_ID")
-# if not org_id:
-#     raise SystemExit("SYNC_ORGANIZATION_ID must be set")
-# svc = StripeService()
-# res = svc.sync_recent(org_id, days=int(get_config("SYNC_DAYS", "1")))
-# if res.get("success"):
-#     print(
-#         f"[{datetime.utcnow().isoformat()}] Synced {res.get('synced',0)} transactions"
-#     )
-# else:
-#     print(f"[{datetime.utcnow().isoformat()}] Sync error: {res.get('error')}")
+class SyncCheckpoint:
+    """Per-org outcomes of one run, rewritten atomically after each org"""
+
+    def __init__(self, directory: Path, run_id: str):
+        self.path = directory / f"{run_id}.json"
+        self._lock = threading.Lock()
+        self.state = {"run_id": run_id, "orgs": {}}
+        if self.path.exists():
+            try:
+                self.state = json.loads(self.path.read_text(encoding="utf-8"))
+            except ValueError:
+                print(f"Ignoring unreadable checkpoint {self.path}")
+
+    def done(self, org_id) -> bool:
+        return self.state["orgs"].get(str(org_id), {}).get("status") == "done"
+
+    def record(self, org_id, outcome: Dict) -> None:
+        with self._lock:
+            self.state["orgs"][str(org_id)] = {
+                **outcome,
+                "finished_at": datetime.utcnow().isoformat(),
+            }
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.state), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def acquire_run_lock(directory: Path) -> Path:
+    """Exclusive lock file for the run; a stale one (crashed run) is taken over"""
+    lock = directory / "daily_sync.lock"
+    max_age = float(get_config("SYNC_LOCK_SECONDS", "3600"))
+    for _ in range(2):
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, "w") as f:
+                f.write(f"{os.getpid()} {datetime.utcnow().isoformat()}")
+            return lock
+        except FileExistsError:
+            if time.time() - lock.stat().st_mtime < max_age:
+                raise SystemExit(f"Another daily sync holds {lock}")
+            print(f"Taking over stale lock {lock}")
+            lock.unlink()
+    raise SystemExit(f"Could not acquire {lock}")
+
+
+def heartbeat(lock: Path, stop: threading.Event) -> None:
+    """Touch the lock until stopped, so a long healthy run never looks stale"""
+    interval = max(1.0, float(get_config("SYNC_LOCK_SECONDS", "3600")) / 4)
+    while not stop.wait(interval):
+        try:
+            os.utime(lock)
+        except OSError as e:
+            print(f"Error touching {lock}: {e}")
+
+
+def sync_orgs(db) -> List[Dict]:
+    """[{id, owned_only}] for the orgs to sync"""
+    only = get_config("SYNC_ORGANIZATION_ID")
+    if only:
+        org_ids = list(dict.fromkeys(o.strip() for o in only.split(",") if o.strip()))
+    else:
+        rows = db.table("organizations").select("id").execute().data or []
+        org_ids = [str(o["id"]) for o in rows]
+    # Several orgs share the platform account: each keeps only its own objects
+    return [{"id": org_id, "owned_only": len(org_ids) > 1} for org_id in org_ids]
+
+
+def sync_org(svc: StripeService, org: Dict) -> Dict:
+    started = time.time()
+    try:
+        res = svc.sync_incremental(org["id"], owned_only=org["owned_only"])
+    except Exception as e:
+        res = {"success": False, "error": str(e)}
+    return {
+        "status": "done" if res.get("success") else "failed",
+        "synced": res.get("synced", 0),
+        "updated": res.get("updated", 0),
+        "failed": res.get("failed", 0),
+        "seconds": round(time.time() - started, 3),
+        "error": res.get("error"),
+    }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def print_summary(results: Dict, skipped: int, elapsed: float, svc) -> None:
+    done = [r for r in results.values() if r["status"] == "done"]
+    failed = {org_id: r for org_id, r in results.items() if r["status"] == "failed"}
+    synced = sum(r["synced"] for r in results.values())
+    updated = sum(r["updated"] for r in results.values())
+    print(
+        f"Synced {len(done)} orgs ({len(failed)} failed, {skipped} already done) "
+        f"in {elapsed:.1f}s"
+    )
+    if elapsed and results:
+        print(
+            f"  rows: {synced:,} written, {updated:,} updated -> "
+            f"{synced / elapsed:,.1f} rows/s, {len(results) / elapsed * 60:.1f} orgs/min"
+        )
+        seconds = {org_id: r["seconds"] for org_id, r in results.items()}
+        slowest = max(seconds, key=seconds.get)
+        print(
+            f"  per org: p50 {percentile(seconds.values(), 50):.2f}s, "
+            f"p95 {percentile(seconds.values(), 95):.2f}s, "
+            f"max {seconds[slowest]:.2f}s ({slowest})"
+        )
+    stats = svc.scheduler.stats().values()
+    print(
+        f"  Stripe: {sum(s['requests'] for s in stats):,} requests, "
+        f"{sum(s['throttled'] for s in stats)} rate limited"
+    )
+    for org_id, r in failed.items():
+        print(f"  failed {org_id}: {r['error']}")
+
+
+def main():
+    directory = Path(get_config("SYNC_CHECKPOINT_DIR", ".cache/daily_sync"))
+    directory.mkdir(parents=True, exist_ok=True)
+    run_id = get_config("SYNC_RUN_ID") or datetime.utcnow().date().isoformat()
+    workers = int(get_config("SYNC_WORKERS", "8"))
+
+    lock = acquire_run_lock(directory)
+    stop = threading.Event()
+    threading.Thread(target=heartbeat, args=(lock, stop), daemon=True).start()
+    try:
+        svc = StripeService()
+        checkpoint = SyncCheckpoint(directory, run_id)
+        orgs = sync_orgs(get_db())
+        pending = [o for o in orgs if not checkpoint.done(o["id"])]
+        print(
+            f"[{datetime.utcnow().isoformat()}] Run {run_id}: {len(pending)} orgs "
+            f"to sync ({len(orgs) - len(pending)} already done), {workers} workers"
+        )
+
+        started = time.time()
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(sync_org, svc, org): org["id"] for org in pending}
+            for future in as_completed(futures):
+                org_id = futures[future]
+                outcome = future.result()
+                results[org_id] = outcome
+                checkpoint.record(org_id, outcome)
+                if outcome["status"] == "done":
+                    print(
+                        f"[{datetime.utcnow().isoformat()}] Synced {outcome['synced']} "
+                        f"transactions for {org_id} in {outcome['seconds']:.1f}s"
+                    )
+                else:
+                    print(
+                        f"[{datetime.utcnow().isoformat()}] Sync error for {org_id}: "
+                        f"{outcome['error']}"
+                    )
+
+        print_summary(results, len(orgs) - len(pending), time.time() - started, svc)
+        if any(r["status"] == "failed" for r in results.values()):
+            raise SystemExit(1)
+    finally:
+        stop.set()
+        lock.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+scripts/stripe_stub_server.py
+
+Local stand-in for the Stripe API, for offline sync and payout load tests.
+Serves the endpoints StripeService uses: charge/payout/balance transaction
+lists (created filters and pagination), transfer and payout creates, and
+account retrieve. Objects are generated on the fly, so millions of them cost
+no memory.
+
+Run it, then point the SDK at it:
+  STRIPE_STUB_CHARGES=1000000 python -m scripts.stripe_stub_server
+  STRIPE_API_BASE=http://localhost:12111 STRIPE_API_KEY=sk_test_stub ...
+
+Connected accounts are payout-ready unless their id contains "restricted".
+The scheduler throttles to Stripe's test-mode rate for sk_test_ keys; set
+STRIPE_RATE_LIMIT (or STRIPE_SCHEDULER_ENABLED=0) to benchmark beyond it.
+
+Env:
+- STRIPE_STUB_HOST (default 127.0.0.1), STRIPE_STUB_PORT (default 12111)
+- STRIPE_STUB_CHARGES (default 10000), STRIPE_STUB_PAYOUTS (default 500)
+- STRIPE_STUB_DAYS: days the objects are spread over (default 30)
+- STRIPE_STUB_LATENCY_MS: mean delay per response (default 0)
+- STRIPE_STUB_RATE_LIMIT: requests/second before 429s (default 0, off)
+- STRIPE_STUB_VERBOSE=1 to log every request
+"""
+
+import time
+
+from config.enviroment import get_config
+from services.stripe_stub import StripeStubServer
+
+
+def main():
+    host = get_config("STRIPE_STUB_HOST", "127.0.0.1")
+    port = int(get_config("STRIPE_STUB_PORT", "12111"))
+    verbose = get_config("STRIPE_STUB_VERBOSE", "0") in {"1", "true", "True"}
+
+    server = StripeStubServer((host, port), verbose=verbose)
+    counts = server.stub.counts
+    print(
+        f"Stripe stub on {server.url}: {counts['charge']} charges, "
+        f"{counts['payout']} payouts, {counts['balance_transaction']} balance "
+        f"transactions over {server.stub.days} days"
+    )
+    started = time.time()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        elapsed = time.time() - started
+        total = sum(server.requests.values())
+        print(f"Served {total} requests in {elapsed:.1f}s ({total / elapsed:.1f}/s)")
+        for key, count in sorted(server.requests.items()):
+            print(f"  {key}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ from fastapi.responses import JSONResponse
 import stripe
 from config.database import get_db
 from config.enviroment import get_config
+from services.alert_pipeline import get_alert_pipeline
+from services.snapshot_store import invalidate_snapshot
 
 app = FastAPI()
 
@@ -89,6 +91,14 @@ async def stripe_webhook(request: Request):
                             db.table("budgets").update({"actual_spent": new_spent}).eq(
                                 "id", b["id"]
                             ).execute()
+                            get_alert_pipeline().on_budget(
+                                {
+                                    "id": b["id"],
+                                    "organization_id": org_id,
+                                    "actual_spent": new_spent,
+                                }
+                            )
+                            invalidate_snapshot(org_id, db)
                 except Exception:
                     pass
         elif evt_type == "payout.failed":
@@ -98,6 +108,10 @@ async def stripe_webhook(request: Request):
                     "transaction_id", payout_id
                 ).execute()
                 meta = data.get("metadata") or {}
+                get_alert_pipeline().on_transaction_status(
+                    meta.get("organization_id"), payout_id, "failed"
+                )
+                invalidate_snapshot(meta.get("organization_id"), db)
                 proposal_id = meta.get("proposal_id")
                 if proposal_id:
                     try:
@@ -0,0 +1,450 @@
+# services/alert_pipeline.py
+import atexit
+import heapq
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from supabase import Client
+
+from config.database import get_db
+from config.enviroment import get_config
+from services.cashflow_forecast import is_spend
+
+# Budget usage thresholds, lowest first: (fraction of approved, severity, text)
+BUDGET_THRESHOLDS = [
+    (0.9, "medium", "has used 90% of its budget"),
+    (1.0, "high", "is over budget"),
+    (1.2, "critical", "is 20%+ over budget"),
+]
+
+ALERT_TYPES = [
+    "budget_threshold",
+    "spend_velocity",
+    "overdue_invoices",
+    "fraud_flag",
+    "payout_failed",
+]
+
+
+class AlertPipeline:
+    """Incremental alert generation from write events.
+
+    The on_* hooks only queue the event; one background worker applies
+    events in order, so writers never wait on seeding or evaluation. Each
+    org's running state (budget usage, daily spend, unpaid invoices, alerts
+    already raised) is seeded by the worker on the org's first event, then
+    updated only by events. An alert is emitted when an update crosses a
+    threshold. Spend velocity counts outflows only (see
+    cashflow_forecast.is_spend) and is checked once per batch of
+    transactions, per day touched.
+    Time-driven changes (spend days leaving the window, invoices passing
+    their due date) are applied on the org's first event after midnight.
+    Alert keys are deduplicated and stored in alerts.data.dedupe_key, so
+    restarts don't repeat alerts. Rows are inserted in batches
+    (ALERT_BATCH_SIZE or every ALERT_FLUSH_SECONDS).
+    """
+
+    def __init__(self, db: Optional[Client] = None):
+        self._db = db
+        self.enabled = get_config("ALERT_PIPELINE_ENABLED", "1") not in {
+            "0",
+            "false",
+            "False",
+        }
+        self.batch_size = int(get_config("ALERT_BATCH_SIZE", "50"))
+        self.flush_seconds = float(get_config("ALERT_FLUSH_SECONDS", "5"))
+        self.window_days = int(get_config("ALERT_VELOCITY_WINDOW_DAYS", "30"))
+        self.velocity_ratio = float(get_config("ALERT_VELOCITY_RATIO", "3"))
+        self.velocity_min = float(get_config("ALERT_VELOCITY_MIN_AMOUNT", "1000"))
+        self.overdue_count = int(get_config("ALERT_OVERDUE_COUNT", "5"))
+        self._state: Dict = {}
+        self._pending: List[Dict] = []
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+        self._events: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def db(self) -> Client:
+        if self._db is None:
+            self._db = get_db()
+        return self._db
+
+    # ---------------- Event hooks ----------------
+    def on_transaction(self, tx: Dict) -> None:
+        """A transaction row was inserted or upserted"""
+        self.on_transactions([tx])
+
+    def on_transactions(self, txs: List[Dict], evaluate: bool = True) -> None:
+        """A batch of transaction rows was written (one bulk upsert).
+
+        evaluate=False only updates the running totals, for rows that were
+        already known and merely re-synced (status rechecks).
+        """
+        txs = [tx for tx in txs or [] if tx and tx.get("organization_id")]
+        if txs:
+            self._submit(self._apply_transactions, txs, evaluate)
+
+    def on_transaction_status(self, org_id, transaction_id, status: str) -> None:
+        """A transaction/payout changed status (Stripe webhook)"""
+        if org_id and status == "failed":
+            self._submit(self._apply_status, org_id, transaction_id)
+
+    def on_budget(self, budget: Dict) -> None:
+        """A budget was created or updated (partial rows are merged by id)"""
+        if (budget or {}).get("organization_id") and budget.get("id") is not None:
+            self._submit(self._apply_budget, budget)
+
+    def on_invoice(self, invoice: Dict) -> None:
+        """An invoice was created or changed status (partial rows are merged by id)"""
+        if (invoice or {}).get("organization_id") and invoice.get("id") is not None:
+            self._submit(self._apply_invoice, invoice)
+
+    # ---------------- Worker ----------------
+    def _submit(self, apply, *args) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._work, name="alert-pipeline", daemon=True
+                )
+                self._worker.start()
+        self._events.put((apply, args))
+
+    def _work(self) -> None:
+        while True:
+            apply, args = self._events.get()
+            try:
+                apply(*args)
+                self._maybe_flush()
+            except Exception as e:
+                print(f"Error in alert pipeline ({apply.__name__}): {e}")
+            finally:
+                self._events.task_done()
+
+    def _apply_transactions(self, txs: List[Dict], evaluate: bool) -> None:
+        by_org: Dict = {}
+        for tx in txs:
+            by_org.setdefault(tx["organization_id"], []).append(tx)
+        for org_id, rows in by_org.items():
+            state = self._org(org_id)
+            days = set()
+            with self._lock:
+                for tx in rows:
+                    if evaluate and int(tx.get("fraud_flag") or 0) == 1:
+                        key = tx.get("transaction_id") or tx.get("id")
+                        self._emit(
+                            state,
+                            f"fraud:{key}",
+                            "fraud_flag",
+                            "critical",
+                            f"Transaction ${float(tx.get('amount') or 0):,.2f} at "
+                            f"{tx.get('merchant') or 'unknown'} was flagged as "
+                            "fraudulent",
+                            {"transaction_id": key},
+                        )
+                    self._add_spend(state, tx)
+                    days.add(str(tx.get("date") or "")[:10])
+                if evaluate:
+                    for day in sorted(days):
+                        self._check_velocity(state, day)
+
+    def _apply_status(self, org_id, transaction_id) -> None:
+        state = self._org(org_id)
+        with self._lock:
+            self._emit(
+                state,
+                f"payout_failed:{transaction_id}",
+                "payout_failed",
+                "high",
+                f"Payout {transaction_id} failed",
+                {"transaction_id": transaction_id},
+            )
+
+    def _apply_budget(self, budget: Dict) -> None:
+        state = self._org(budget["organization_id"])
+        with self._lock:
+            known = state["budgets"].setdefault(str(budget["id"]), {})
+            known.update(budget)
+            self._check_budget(state, known)
+
+    def _apply_invoice(self, invoice: Dict) -> None:
+        state = self._org(invoice["organization_id"])
+        with self._lock:
+            known = {**state["unpaid"].get(str(invoice["id"]), {}), **invoice}
+            self._track_invoice(state, known)
+            self._check_overdue(state)
+
+    # ---------------- Batching ----------------
+    def flush(self) -> int:
+        """Apply queued events, then insert queued alerts; returns how many"""
+        with self._lock:
+            started = self._worker is not None
+        if started:
+            self._events.join()
+        return self._insert_pending()
+
+    def _insert_pending(self) -> int:
+        with self._lock:
+            rows, self._pending = self._pending, []
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        if not rows:
+            return 0
+        try:
+            self.db.table("alerts").insert(rows).execute()
+            return len(rows)
+        except Exception as e:
+            print(f"Error inserting alerts: {e}")
+            with self._lock:
+                # Keep them for the next flush
+                self._pending = rows + self._pending
+            return 0
+
+    def _maybe_flush(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            if len(self._pending) < self.batch_size:
+                if self._timer is None:
+                    self._timer = threading.Timer(
+                        self.flush_seconds, self._insert_pending
+                    )
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self._insert_pending()
+
+    # ---------------- Running state ----------------
+    def _org(self, org_id) -> Dict:
+        """Running state for an org, seeded from the database on first use.
+
+        Only the worker thread calls this, so seeding needs no lock and
+        never runs on a writer's request path.
+        """
+        state = self._state.get(org_id)
+        if state is None:
+            state = self._state[org_id] = self._seed(org_id)
+        with self._lock:
+            self._roll(state)
+        return state
+
+    def _seed(self, org_id) -> Dict:
+        today = datetime.now().date().isoformat()
+        budgets = self._select(
+            "budgets", "id,dept,approved_amount,actual_spent,organization_id", org_id
+        )
+        invoices = self._select(
+            "invoices", "id,amount,status,is_overdue,due_date", org_id
+        )
+        txs = self._select(
+            "transactions",
+            "id,transaction_id,date,amount,category",
+            org_id,
+            since=self._cutoff(),
+        )
+        raised = (
+            self.db.table("alerts")
+            .select("data")
+            .eq("organization_id", org_id)
+            .in_("alert_type", ALERT_TYPES)
+            .execute()
+            .data
+            or []
+        )
+
+        state = {
+            "org_id": org_id,
+            "today": today,
+            "budgets": {str(b["id"]): b for b in budgets},
+            "unpaid": {},
+            "overdue": {},
+            # Spend per day in the window, the days as a min-heap, and each
+            # transaction's (day, amount) with the keys booked on each day
+            "daily": {},
+            "days": [],
+            "spend": {},
+            "day_keys": {},
+            "seen": {(a.get("data") or {}).get("dedupe_key") for a in raised},
+        }
+        for inv in invoices:
+            self._track_invoice(state, inv)
+        for tx in txs:
+            self._add_spend(state, tx)
+
+        # Conditions already true when seeded were crossed before; don't alert
+        for budget in state["budgets"].values():
+            state["seen"].update(self._budget_keys(budget))
+        if len(state["overdue"]) > self.overdue_count:
+            state["seen"].add(self._overdue_key(state))
+        if self._velocity_exceeded(state, today):
+            state["seen"].add(f"velocity:{today}")
+        return state
+
+    def _roll(self, state: Dict) -> None:
+        """Apply the passage of time since the org's last event"""
+        today = datetime.now().date().isoformat()
+        if state["today"] == today:
+            return
+        state["today"] = today
+        self._evict_days(state)
+        for invoice in state["unpaid"].values():
+            self._track_invoice(state, invoice)
+        self._check_overdue(state)
+
+    def _track_invoice(self, state: Dict, invoice: Dict) -> None:
+        key = str(invoice["id"])
+        if invoice.get("status") == "paid":
+            state["unpaid"].pop(key, None)
+            state["overdue"].pop(key, None)
+            return
+        state["unpaid"][key] = invoice
+        due = str(invoice.get("due_date") or "")[:10]
+        if invoice.get("is_overdue") or (due and due < state["today"]):
+            state["overdue"][key] = float(invoice.get("amount") or 0)
+        else:
+            state["overdue"].pop(key, None)
+
+    def _add_spend(self, state: Dict, tx: Dict) -> None:
+        day = str(tx.get("date") or "")[:10]
+        key = str(tx.get("transaction_id") or tx.get("id") or "")
+        if not day:
+            return
+        # Income, refunds and the like are booked as no spend on their day
+        amount = float(tx.get("amount") or 0) if is_spend(tx) else 0.0
+        if key:
+            # Upserts of a known transaction only apply the change
+            old = state["spend"].pop(key, None)
+            if old:
+                state["daily"][old[0]] -= old[1]
+                state["day_keys"][old[0]].discard(key)
+        if day < self._cutoff():
+            return
+        if day not in state["daily"]:
+            state["daily"][day] = 0.0
+            state["day_keys"][day] = set()
+            heapq.heappush(state["days"], day)
+        state["daily"][day] += amount
+        if key:
+            state["spend"][key] = (day, amount)
+            state["day_keys"][day].add(key)
+
+    def _evict_days(self, state: Dict) -> None:
+        """Drop days that fell out of the window, oldest first"""
+        cutoff = self._cutoff()
+        while state["days"] and state["days"][0] < cutoff:
+            day = heapq.heappop(state["days"])
+            del state["daily"][day]
+            for key in state["day_keys"].pop(day):
+                del state["spend"][key]
+
+    def _cutoff(self) -> str:
+        return (datetime.now() - timedelta(days=self.window_days)).date().isoformat()
+
+    # ---------------- Thresholds ----------------
+    def _check_budget(self, state: Dict, budget: Dict) -> None:
+        crossed = self._budget_keys(budget)
+        for threshold, severity, text in BUDGET_THRESHOLDS:
+            key = f"budget:{budget['id']}:{threshold}"
+            if key not in crossed:
+                # Usage fell back below: alert again if it re-crosses
+                state["seen"].discard(key)
+                continue
+            self._emit(
+                state,
+                key,
+                "budget_threshold",
+                severity,
+                f"{budget.get('dept') or 'Budget'} {text} "
+                f"(${float(budget.get('actual_spent') or 0):,.2f} of "
+                f"${float(budget.get('approved_amount') or 0):,.2f})",
+                {"budget_id": budget["id"], "threshold": threshold},
+            )
+
+    def _budget_keys(self, budget: Dict) -> set:
+        approved = float(budget.get("approved_amount") or 0)
+        spent = float(budget.get("actual_spent") or 0)
+        if approved <= 0:
+            return set()
+        return {
+            f"budget:{budget['id']}:{threshold}"
+            for threshold, _, _ in BUDGET_THRESHOLDS
+            if spent >= approved * threshold
+        }
+
+    def _check_velocity(self, state: Dict, day: str) -> None:
+        if day and self._velocity_exceeded(state, day):
+            spent = state["daily"][day]
+            self._emit(
+                state,
+                f"velocity:{day}",
+                "spend_velocity",
+                "high",
+                f"Spend on {day} is ${spent:,.2f}, over {self.velocity_ratio:g}x the "
+                f"{self.window_days}-day daily average",
+                {"date": day, "amount": round(spent, 2)},
+            )
+
+    def _velocity_exceeded(self, state: Dict, day: str) -> bool:
+        spent = state["daily"].get(day, 0.0)
+        if spent < self.velocity_min:
+            return False
+        baseline = (sum(state["daily"].values()) - spent) / self.window_days
+        return baseline > 0 and spent > self.velocity_ratio * baseline
+
+    def _check_overdue(self, state: Dict) -> None:
+        if len(state["overdue"]) <= self.overdue_count:
+            return
+        count, total = len(state["overdue"]), sum(state["overdue"].values())
+        self._emit(
+            state,
+            self._overdue_key(state),
+            "overdue_invoices",
+            "medium",
+            f"{count} overdue invoices totaling ${total:,.2f}",
+            {"count": count, "total": round(total, 2)},
+        )
+
+    def _overdue_key(self, state: Dict) -> str:
+        # One alert per count band of 5 above the threshold
+        band = (len(state["overdue"]) - self.overdue_count - 1) // 5
+        return f"overdue:{band}"
+
+    def _emit(self, state, key, alert_type, severity, message, data) -> None:
+        if key in state["seen"]:
+            return
+        state["seen"].add(key)
+        self._pending.append(
+            {
+                "organization_id": state["org_id"],
+                "alert_type": alert_type,
+                "severity": severity,
+                "message": message,
+                "data": {**data, "dedupe_key": key},
+            }
+        )
+
+    def _select(self, table, columns, org_id, since: Optional[str] = None):
+        q = self.db.table(table).select(columns).eq("organization_id", org_id)
+        if since:
+            q = q.gte("date", since)
+        return q.execute().data or []
+
+
+_pipeline: Optional[AlertPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_alert_pipeline() -> AlertPipeline:
+    """Process-wide pipeline fed by every writer in the process"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = AlertPipeline()
+            # Don't lose queued alerts when a script exits
+            atexit.register(_pipeline.flush)
+        return _pipeline
@@ -0,0 +1,217 @@
+# services/anomaly_detector.py
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from config.enviroment import get_config
+from utils.helper import to_plain
+
+# Reason -> weight added to a flagged transaction's score (outliers add their z)
+REASON_WEIGHTS = {
+    "merchant_outlier": 0.0,
+    "category_outlier": 0.0,
+    "category_spike": 1.0,
+    "new_merchant": 1.0,
+    "duplicate": 2.0,
+    "stripe_fraud_flag": 5.0,
+}
+
+# Severity for the alerts table by strongest reason
+ALERT_SEVERITY = {
+    "stripe_fraud_flag": "critical",
+    "duplicate": "high",
+    "merchant_outlier": "high",
+    "category_outlier": "medium",
+    "category_spike": "medium",
+    "new_merchant": "low",
+}
+
+
+def detect_anomalies(
+    df: pd.DataFrame,
+    z_threshold: float = 3.5,
+    min_group: int = 5,
+    spike_ratio: float = 3.0,
+    new_merchant_days: int = 14,
+    duplicate_days: int = 3,
+    top_k: int = 10,
+) -> Dict:
+    """Flag unusual transactions in a frame (vectorized, no per-row Python).
+
+    - merchant/category outliers: robust z-score (median/MAD) of the amount
+      within the merchant or category, for groups with >= min_group rows
+    - category spikes: a day's category total > spike_ratio x the category's
+      median active-day total
+    - new merchants: first seen in the last new_merchant_days of the frame
+    - duplicates: same merchant and amount within duplicate_days
+    - Stripe fraud flags
+
+    Returns a JSON-serializable report: count, flagged_amount, by_reason,
+    top (highest scoring transactions) and spikes.
+    """
+    report = {
+        "count": 0,
+        "flagged_amount": 0.0,
+        "by_reason": {},
+        "top": [],
+        "spikes": [],
+    }
+    if df is None or df.empty or "amount" not in df:
+        return report
+
+    n = len(df)
+    amount = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0).to_numpy(float)
+    dates = pd.to_datetime(df.get("date"), errors="coerce")
+    merchant = _labels(df, "merchant", n)
+    category = _labels(df, "category", n)
+
+    z_merchant = _robust_z(amount, merchant, min_group)
+    z_category = _robust_z(amount, category, min_group)
+
+    flags = {
+        "merchant_outlier": z_merchant > z_threshold,
+        "category_outlier": z_category > z_threshold,
+        "category_spike": np.zeros(n, dtype=bool),
+        "new_merchant": np.zeros(n, dtype=bool),
+        "duplicate": np.zeros(n, dtype=bool),
+        "stripe_fraud_flag": (
+            pd.to_numeric(df["fraud_flag"], errors="coerce").fillna(0).to_numpy() == 1
+            if "fraud_flag" in df
+            else np.zeros(n, dtype=bool)
+        ),
+    }
+
+    valid = dates.notna().to_numpy()
+    if valid.any():
+        day = dates.dt.normalize()
+
+        # Category spikes on daily totals
+        daily = (
+            pd.DataFrame({"category": category, "day": day, "amount": amount})[valid]
+            .groupby(["category", "day"], sort=False)["amount"]
+            .sum()
+        )
+        by_cat = daily.groupby(level=0)
+        baseline = by_cat.transform("median")
+        spiking = (daily > spike_ratio * baseline) & (
+            by_cat.transform("size") >= min_group
+        )
+        spikes = daily[spiking]
+        if len(spikes):
+            row_keys = pd.MultiIndex.from_arrays([category, day])
+            flags["category_spike"] = row_keys.isin(spikes.index) & valid
+            report["spikes"] = [
+                {
+                    "category": cat,
+                    "date": d.date().isoformat(),
+                    "amount": round(float(total), 2),
+                    "baseline": round(float(baseline[(cat, d)]), 2),
+                }
+                for (cat, d), total in spikes.nlargest(5).items()
+            ]
+
+        # First-seen merchants (only meaningful with older history in the frame)
+        horizon = dates.max() - pd.Timedelta(days=new_merchant_days)
+        if dates.min() < horizon:
+            first_seen = dates.groupby(merchant).transform("min")
+            flags["new_merchant"] = (first_seen >= horizon).to_numpy() & valid
+
+        # Same merchant + amount within duplicate_days of the previous one
+        cents = np.round(amount * 100).astype(np.int64)
+        days_num = day.to_numpy("datetime64[D]").astype("int64")
+        codes = pd.factorize(merchant)[0]
+        order = np.lexsort((days_num, cents, codes))
+        same = (
+            (codes[order][1:] == codes[order][:-1])
+            & (cents[order][1:] == cents[order][:-1])
+            & (days_num[order][1:] - days_num[order][:-1] <= duplicate_days)
+            & valid[order][1:]
+            & valid[order][:-1]
+            & (cents[order][1:] > 0)
+        )
+        flags["duplicate"][order[1:][same]] = True
+
+    flagged = np.zeros(n, dtype=bool)
+    score = np.maximum(np.maximum(z_merchant, z_category), 0.0)
+    for reason, mask in flags.items():
+        flagged |= mask
+        score = score + REASON_WEIGHTS[reason] * mask
+    score = np.where(flagged, score, 0.0)
+
+    report["count"] = int(flagged.sum())
+    report["flagged_amount"] = round(float(amount[flagged].sum()), 2)
+    report["by_reason"] = {r: int(m.sum()) for r, m in flags.items() if m.any()}
+
+    top = np.argsort(-score, kind="stable")[: min(top_k, report["count"])]
+    ids = df["id"].to_numpy() if "id" in df else np.full(n, None)
+    report["top"] = [
+        {
+            "id": to_plain(ids[i]),
+            "date": dates.iloc[i].date().isoformat() if valid[i] else None,
+            "merchant": merchant[i],
+            "category": category[i],
+            "amount": round(float(amount[i]), 2),
+            "reasons": ", ".join(r for r, m in flags.items() if m[i]),
+            "score": round(float(score[i]), 2),
+        }
+        for i in top
+    ]
+    return report
+
+
+def anomaly_alert_rows(org_id, report: Dict, min_score: float = None) -> List[Dict]:
+    """alerts table rows for the report's top anomalies"""
+    min_score = float(
+        min_score
+        if min_score is not None
+        else get_config("ANOMALY_ALERT_MIN_SCORE", "4")
+    )
+    rows = []
+    for a in report.get("top", []):
+        if a["score"] < min_score:
+            continue
+        reasons = a["reasons"].split(", ")
+        severity = min(
+            (ALERT_SEVERITY[r] for r in reasons),
+            key=["critical", "high", "medium", "low"].index,
+        )
+        rows.append(
+            {
+                "organization_id": org_id,
+                "alert_type": "transaction_anomaly",
+                "severity": severity,
+                "message": f"Unusual transaction: ${a['amount']:,.2f} at {a['merchant']} "
+                f"on {a['date']} ({a['reasons']})",
+                "data": {
+                    "transaction_id": a["id"],
+                    "reasons": reasons,
+                    "score": a["score"],
+                },
+            }
+        )
+    return rows
+
+
+def _labels(df: pd.DataFrame, column: str, n: int) -> np.ndarray:
+    if column not in df:
+        return np.full(n, "unknown", dtype=object)
+    return df[column].fillna("unknown").astype(str).to_numpy()
+
+
+def _robust_z(values: np.ndarray, keys: np.ndarray, min_group: int) -> np.ndarray:
+    """Per-group robust z-score 0.6745 * (x - median) / MAD.
+
+    The MAD is floored at 5% of the median (and $1), so groups of identical
+    recurring charges still flag a charge that is clearly different.
+    """
+    grouped = pd.Series(values).groupby(keys)
+    median = grouped.transform("median").to_numpy()
+    size = grouped.transform("size").to_numpy()
+    mad = (
+        pd.Series(np.abs(values - median)).groupby(keys).transform("median").to_numpy()
+    )
+    mad = np.maximum(mad, np.maximum(0.05 * np.abs(median), 1.0))
+    z = 0.6745 * (values - median) / mad
+    z[size < min_group] = 0.0
+    return z
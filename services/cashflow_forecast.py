@@ -0,0 +1,282 @@
+# services/cashflow_forecast.py
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from statistics import NormalDist
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config.enviroment import get_config
+from utils import clock
+
+# Smoothing parameter grid searched per series (all combinations in one pass)
+ALPHAS = np.array([0.05, 0.15, 0.3, 0.5, 0.7])
+BETAS = np.array([0.0, 0.02, 0.1])
+GAMMAS = np.array([0.0, 0.1, 0.3])
+
+# Trend damping: a daily trend fades out instead of compounding over months
+PHI = 0.9
+
+DAYS_PER_MONTH = 30
+
+# Season lengths: a weekly cycle in daily series, a monthly one in weekly series
+DAILY_PERIOD = 7
+WEEKS_PER_MONTH = 4
+
+# Transaction categories that aren't spend: income (Stripe charges, manual
+# income) and the refunds/adjustments that reverse or correct it
+NON_SPEND_CATEGORIES = {"income", "refund", "adjustment"}
+
+
+class SeasonalForecast:
+    """Fitted damped additive Holt-Winters state (level, trend, season) for one series"""
+
+    def __init__(
+        self, level, trend, season, alpha, beta, gamma, sigma, steps, step_days=1
+    ):
+        self.level = float(level)
+        self.trend = float(trend)
+        self.season = np.asarray(season, dtype=float)
+        self.alpha, self.beta, self.gamma = float(alpha), float(beta), float(gamma)
+        self.sigma = float(sigma)
+        # Observations consumed; the next season index is steps % period
+        self.steps = int(steps)
+        # Days per observation: 1 for daily series, 7 for weekly ones
+        self.step_days = int(step_days)
+
+    @property
+    def period(self) -> int:
+        return len(self.season)
+
+    def predict(self, horizon: int, coverage: float = 0.8) -> Dict[str, np.ndarray]:
+        """Point forecast and prediction interval for the next `horizon` steps"""
+        h = np.arange(1, horizon + 1)
+        damped = np.cumsum(PHI**h)
+        mean = (
+            self.level
+            + damped * self.trend
+            + self.season[(self.steps + h - 1) % self.period]
+        )
+
+        # ETS(A,Ad,A) h-step variance: sigma^2 * (1 + sum_{j<h} c_j^2)
+        j = np.arange(1, horizon)
+        c = self.alpha * (1 + self.beta * damped[: horizon - 1]) + self.gamma * (
+            j % self.period == 0
+        )
+        var = self.sigma**2 * (1 + np.concatenate([[0.0], np.cumsum(c**2)]))
+        z = NormalDist().inv_cdf(0.5 + coverage / 2)
+        spread = z * np.sqrt(var)
+
+        # Spend can't go negative
+        return {
+            "mean": np.maximum(mean, 0.0),
+            "lower": np.maximum(mean - spread, 0.0),
+            "upper": np.maximum(mean + spread, 0.0),
+        }
+
+
+def fit_seasonal(
+    series: np.ndarray, period: int = DAILY_PERIOD
+) -> List[SeasonalForecast]:
+    """Fit damped additive Holt-Winters to many equal-length series at once.
+
+    `series` is (n_series, T): daily spend with period=7 (weekly cycle), or
+    weekly spend with period=WEEKS_PER_MONTH (monthly cycle).
+    Every (alpha, beta, gamma) in the grid is run for every series
+    simultaneously; each series keeps its lowest-SSE fit.
+    Series shorter than two periods are fitted without seasonality.
+    """
+    Y = np.atleast_2d(np.asarray(series, dtype=float))
+    n, T = Y.shape
+    if T < 2 * period:
+        period = 1
+
+    a, b, g = (m.ravel() for m in np.meshgrid(ALPHAS, BETAS, GAMMAS, indexing="ij"))
+    if period == 1:
+        g = np.zeros_like(g)
+    k = len(a)
+
+    # Initial state from the first two seasons
+    first = Y[:, :period].mean(axis=1)
+    second = Y[:, period : 2 * period].mean(axis=1) if T >= 2 * period else first
+    level = np.repeat(first[:, None], k, axis=1)
+    trend = np.repeat(((second - first) / period)[:, None], k, axis=1)
+    season = np.repeat((Y[:, :period] - first[:, None])[:, None, :], k, axis=1)
+    if period == 1:
+        season[:] = 0.0
+
+    sse = np.zeros((n, k))
+    for t in range(period, T):
+        s = t % period
+        err = Y[:, t, None] - (level + PHI * trend + season[:, :, s])
+        sse += err**2
+        level = level + PHI * trend + a * err
+        trend = PHI * trend + a * b * err
+        season[:, :, s] += g * err
+
+    best = sse.argmin(axis=1)
+    rows = np.arange(n)
+    dof = max(T - period, 1)
+    return [
+        SeasonalForecast(
+            level[i, best[i]],
+            trend[i, best[i]],
+            season[i, best[i]],
+            a[best[i]],
+            b[best[i]],
+            g[best[i]],
+            np.sqrt(sse[i, best[i]] / dof),
+            T,
+        )
+        for i in rows
+    ]
+
+
+_fit_cache: Dict = {}
+_fit_cache_lock = threading.Lock()
+
+
+def forecast_many(
+    series_by_org: Dict, period: int = DAILY_PERIOD, step_days: int = 1
+) -> Dict[str, SeasonalForecast]:
+    """Fitted models per org, reusing cached fits for unchanged series.
+
+    `step_days` is the spacing of the series (7 for weekly). Uncached series
+    are fitted together in one vectorized batch per length.
+    """
+    fitted, pending = {}, {}
+    with _fit_cache_lock:
+        for org_id, y in series_by_org.items():
+            y = np.asarray(y, dtype=float)
+            key = (period, step_days, hashlib.sha1(y.tobytes()).hexdigest())
+            cached = _fit_cache.get((org_id, step_days))
+            if cached and cached[0] == key:
+                fitted[org_id] = cached[1]
+            else:
+                pending[org_id] = (key, y)
+
+    by_length: Dict[int, List] = {}
+    for org_id, (key, y) in pending.items():
+        by_length.setdefault(len(y), []).append(org_id)
+    for orgs in by_length.values():
+        models = fit_seasonal(np.vstack([pending[o][1] for o in orgs]), period)
+        with _fit_cache_lock:
+            for org_id, model in zip(orgs, models):
+                model.step_days = step_days
+                _fit_cache[(org_id, step_days)] = (pending[org_id][0], model)
+                fitted[org_id] = model
+    return fitted
+
+
+def weekly_totals(daily: np.ndarray) -> np.ndarray:
+    """Sum a daily series into whole weeks ending on its last day"""
+    daily = np.asarray(daily, dtype=float)
+    weeks = len(daily) // 7
+    return daily[len(daily) - 7 * weeks :].reshape(weeks, 7).sum(axis=1)
+
+
+def forecast_outflows(daily_by_org: Dict) -> Dict[str, SeasonalForecast]:
+    """Spend models per org from daily outflows, at FORECAST_GRANULARITY.
+
+    "daily" (default) fits the days with a weekly cycle; "weekly" fits
+    weekly totals with a monthly cycle, which is steadier for orgs whose
+    spend clusters around month boundaries (payroll, rent, subscriptions).
+    """
+    if get_config("FORECAST_GRANULARITY", "daily") == "weekly":
+        weekly = {org_id: weekly_totals(y) for org_id, y in daily_by_org.items()}
+        return forecast_many(weekly, WEEKS_PER_MONTH, step_days=7)
+    return forecast_many(daily_by_org, DAILY_PERIOD)
+
+
+def is_spend(tx: Dict) -> bool:
+    """Whether a transaction row is an outflow (counts toward spend and burn)"""
+    return (
+        str(tx.get("category") or "").lower() not in NON_SPEND_CATEGORIES
+        and float(tx.get("amount") or 0) > 0
+    )
+
+
+def spend_rows(transactions: pd.DataFrame) -> pd.DataFrame:
+    """The outflow rows of a transactions frame (see is_spend)"""
+    if transactions is None or transactions.empty:
+        return transactions
+    mask = pd.to_numeric(transactions["amount"], errors="coerce").fillna(0.0) > 0
+    if "category" in transactions:
+        category = transactions["category"].fillna("").astype(str).str.lower()
+        mask &= ~category.isin(NON_SPEND_CATEGORIES)
+    return transactions[mask]
+
+
+def daily_outflows(
+    transactions: pd.DataFrame, days: int = 90, end: Optional[datetime] = None
+) -> np.ndarray:
+    """Spend per day for the last `days` days (zeros on days without spend).
+
+    Only outflows count: income, refunds and adjustments are left out.
+    """
+    end_day = pd.Timestamp((end or clock.now()).date())
+    index = pd.date_range(end=end_day, periods=days, freq="D")
+    transactions = spend_rows(transactions)
+    if transactions is None or transactions.empty:
+        return np.zeros(days)
+    dates = pd.to_datetime(transactions["date"], errors="coerce").dt.normalize()
+    amounts = pd.to_numeric(transactions["amount"], errors="coerce").fillna(0.0)
+    daily = amounts.groupby(dates).sum()
+    return daily.reindex(index, fill_value=0.0).to_numpy(float)
+
+
+def cash_balance(organization: Optional[Dict]) -> float:
+    """Cash on hand from organizations.settings.cash_balance, else DEFAULT_CASH_BALANCE"""
+    settings = (organization or {}).get("settings") or {}
+    value = settings.get("cash_balance")
+    if value is None:
+        value = get_config("DEFAULT_CASH_BALANCE", "100000")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def burn_outlook(
+    model: SeasonalForecast, months: int = 3, coverage: float = 0.8
+) -> Dict:
+    """Monthly burn forecast with intervals from a fitted daily or weekly model.
+
+    Weekly steps are spread evenly over their days. Month bounds add the
+    daily bounds, which is conservative (it assumes forecast errors within a
+    month move together).
+    """
+    days = months * DAYS_PER_MONTH
+    step = model.step_days
+    pred = {
+        k: np.repeat(v / step, step)[:days]
+        for k, v in model.predict(-(-days // step), coverage).items()
+    }
+    monthly = []
+    for m in range(months):
+        window = slice(m * DAYS_PER_MONTH, (m + 1) * DAYS_PER_MONTH)
+        monthly.append(
+            {
+                "month": m + 1,
+                "burn": round(float(pred["mean"][window].sum()), 2),
+                "low": round(float(pred["lower"][window].sum()), 2),
+                "high": round(float(pred["upper"][window].sum()), 2),
+            }
+        )
+    return {
+        "method": "holt-winters-damped",
+        "seasonality_days": model.period * model.step_days,
+        "coverage": coverage,
+        "monthly": monthly,
+        "daily_mean": [round(float(v), 2) for v in pred["mean"]],
+        "daily_low": [round(float(v), 2) for v in pred["lower"]],
+        "daily_high": [round(float(v), 2) for v in pred["upper"]],
+    }
+
+
+def forecast_dates(horizon: int, start: Optional[datetime] = None) -> List[str]:
+    """ISO dates for the forecast horizon, starting tomorrow"""
+    day = (start or clock.now()).date()
+    return [(day + timedelta(days=i)).isoformat() for i in range(1, horizon + 1)]
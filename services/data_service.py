@@ -10,7 +10,26 @@ import re
 import os
 from supabase import Client
 from config.enviroment import get_config
+from utils import clock
 from services.stripe_service import StripeService
+from services.alert_pipeline import get_alert_pipeline
+from services.quick_answers import invalidate_quick_answers
+from services.snapshot_store import invalidate_snapshot
+from services.cashflow_forecast import (
+    burn_outlook,
+    cash_balance,
+    daily_outflows,
+    forecast_dates,
+    forecast_outflows,
+    is_spend,
+)
+from services.runway_simulator import (
+    AGING_BUCKETS,
+    aging_bucket,
+    days_past_due,
+    simulate_runway,
+    simulation_seed,
+)
 
 
 class DataService:
@@ -393,6 +412,9 @@ class DataService:
                 res = self.db.table("transactions").insert(data2).execute()
 
             tx_row = res.data[0] if res.data else None
+            get_alert_pipeline().on_transaction(tx_row or data)
+            invalidate_quick_answers(org_id)
+            invalidate_snapshot(org_id, self.db)
 
             # Side-effects: card_transactions/invoices link if provided
             if card_id and tx_row:
@@ -424,6 +446,15 @@ class DataService:
                         self.db.table("invoices").update({"status": "paid"}).eq(
                             "id", inv.data[0]["id"]
                         ).execute()
+                        get_alert_pipeline().on_invoice(
+                            {
+                                "id": inv.data[0]["id"],
+                                "organization_id": org_id,
+                                "status": "paid",
+                            }
+                        )
+                        invalidate_quick_answers(org_id)
+                        invalidate_snapshot(org_id, self.db)
                 except Exception:
                     pass
 
@@ -550,7 +581,7 @@ class DataService:
     ) -> Dict:
         """Get spending summary for last N days"""
         try:
-            end_date = datetime.now()
+            end_date = clock.now()
             start_date = end_date - timedelta(days=days)
 
             q = self.db.table("transactions").select("*")
@@ -560,8 +591,9 @@ class DataService:
                 "date", end_date.date().isoformat()
             )
             result = q.execute()
+            rows = [r for r in result.data or [] if is_spend(r)]
 
-            if not result.data:
+            if not rows:
                 return {
                     "total_spent": 0,
                     "transaction_count": 0,
@@ -570,7 +602,7 @@ class DataService:
                     "by_status": {},
                 }
 
-            df = pd.DataFrame(result.data)
+            df = pd.DataFrame(rows)
 
             return {
                 "total_spent": float(df["amount"].sum()),
@@ -650,7 +682,7 @@ class DataService:
                 "total_amount": float(df["amount"].sum()),
                 "by_vendor": df.groupby("vendor")["amount"].sum().to_dict(),
                 "oldest_days": (
-                    datetime.now() - pd.to_datetime(df["due_date"]).min()
+                    clock.now() - pd.to_datetime(df["due_date"]).min()
                 ).days,
             }
         except Exception as e:
@@ -658,37 +690,230 @@ class DataService:
             return {"error": str(e)}
 
     def get_cashflow_forecast(self, org_id: int, months: int = 3) -> Dict:
-        """Simple cashflow forecast"""
+        """Cashflow forecast from a seasonal model of spend (see forecast_outflows)"""
         try:
-            # Get historical spending
-            # pass org_id into spending summary so historical spend is scoped to org
-            spending_90d = self.get_spending_summary(org_id=org_id, days=90)
-            monthly_burn = float(spending_90d.get("total_spent", 0)) / 3
+            # Daily spend over the last 90 days, scoped to the org
+            since = (clock.now() - timedelta(days=90)).date().isoformat()
+            spend = (
+                self.db.table("transactions")
+                .select("date,amount,category")
+                .eq("organization_id", org_id)
+                .gte("date", since)
+                .execute()
+            )
+            daily = daily_outflows(pd.DataFrame(spend.data or []))
+            model = forecast_outflows({org_id: daily})[org_id]
+            outlook = burn_outlook(model, months=months)
+            monthly_burn = outlook["monthly"][0]["burn"] if months else 0.0
+            projected_spend = sum(m["burn"] for m in outlook["monthly"])
+
+            org = (
+                self.db.table("organizations")
+                .select("settings")
+                .eq("id", org_id)
+                .execute()
+            )
+            balance = cash_balance((org.data or [{}])[0])
 
-            # Get pending invoices (receivables)
+            # Unpaid invoices (pending ones are the receivables)
             invoices = (
                 self.db.table("invoices")
                 .select("*")
                 .eq("organization_id", org_id)
-                .eq("status", "pending")
+                .neq("status", "paid")
                 .execute()
             )
 
             pending_receivables = sum(
-                inv["amount"] for inv in invoices.data if inv["amount"]
+                inv["amount"]
+                for inv in invoices.data
+                if inv["amount"] and inv.get("status") == "pending"
             )
 
             return {
                 "monthly_burn_rate": monthly_burn,
-                "projected_spend": monthly_burn * months,
+                "monthly_burn_low": outlook["monthly"][0]["low"] if months else 0.0,
+                "monthly_burn_high": outlook["monthly"][0]["high"] if months else 0.0,
+                "projected_spend": projected_spend,
                 "pending_receivables": pending_receivables,
-                "net_position": pending_receivables - (monthly_burn * months),
+                "net_position": pending_receivables - projected_spend,
+                "cash_balance": balance,
+                "runway_months": balance / monthly_burn if monthly_burn else None,
+                "runway_simulation": simulate_runway(
+                    daily,
+                    invoices.data,
+                    balance,
+                    seed=simulation_seed(org_id, daily, balance),
+                ),
                 "months": months,
+                "forecast": {
+                    **outlook,
+                    "dates": forecast_dates(len(outlook["daily_mean"])),
+                },
             }
         except Exception as e:
             print(f"Error in get_cashflow_forecast: {e}")
             return {"error": str(e)}
 
+    # ---------------- Narrow aggregates (CFO agent tools) ----------------
+    def _date_range(self, start_date: Optional[str], end_date: Optional[str]):
+        end = end_date or clock.now().date().isoformat()
+        start = start_date or (
+            datetime.fromisoformat(end) - timedelta(days=30)
+        ).date().isoformat()
+        return start, end
+
+    def get_spend_by_category(
+        self,
+        org_id,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+    ) -> Dict:
+        """Total spend per category between two ISO dates (default: last 30 days)"""
+        try:
+            start, end = self._date_range(start_date, end_date)
+            rows = (
+                self.db.table("transactions")
+                .select("category,amount")
+                .eq("organization_id", org_id)
+                .gte("date", start)
+                .lte("date", end)
+                .execute()
+                .data
+                or []
+            )
+            by_category: Dict[str, float] = {}
+            for r in filter(is_spend, rows):
+                key = r.get("category") or "uncategorized"
+                by_category[key] = by_category.get(key, 0.0) + float(r.get("amount") or 0)
+            return {
+                "start_date": start,
+                "end_date": end,
+                "total": round(sum(by_category.values()), 2),
+                "by_category": {
+                    k: round(v, 2)
+                    for k, v in sorted(
+                        by_category.items(), key=lambda kv: kv[1], reverse=True
+                    )
+                },
+            }
+        except Exception as e:
+            print(f"Error in get_spend_by_category: {e}")
+            return {"error": str(e)}
+
+    def get_top_merchants(
+        self,
+        org_id,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        limit: int = 5,
+        category: Optional[str] = None,
+    ) -> Dict:
+        """Merchants with the highest spend in a date range"""
+        try:
+            start, end = self._date_range(start_date, end_date)
+            q = (
+                self.db.table("transactions")
+                .select("merchant,amount")
+                .eq("organization_id", org_id)
+                .gte("date", start)
+                .lte("date", end)
+            )
+            if category:
+                q = q.eq("category", category)
+            totals: Dict[str, List[float]] = {}
+            for r in q.execute().data or []:
+                t = totals.setdefault(r.get("merchant") or "unknown", [0.0, 0])
+                t[0] += float(r.get("amount") or 0)
+                t[1] += 1
+            top = sorted(totals.items(), key=lambda kv: kv[1][0], reverse=True)
+            return {
+                "start_date": start,
+                "end_date": end,
+                "merchants": [
+                    {"merchant": m, "amount": round(t[0], 2), "transactions": t[1]}
+                    for m, t in top[: max(1, limit)]
+                ],
+                "other_merchants": max(0, len(top) - limit),
+            }
+        except Exception as e:
+            print(f"Error in get_top_merchants: {e}")
+            return {"error": str(e)}
+
+    def get_department_budget_variance(self, org_id, department: str) -> Dict:
+        """Budget vs actual for one department's budget lines"""
+        try:
+            rows = (
+                self.db.table("budgets")
+                .select("dept,category,approved_amount,actual_spent,quarter,year")
+                .eq("organization_id", org_id)
+                .eq("dept", department)
+                .execute()
+                .data
+                or []
+            )
+            lines = []
+            for b in rows:
+                approved = float(b.get("approved_amount") or 0)
+                spent = float(b.get("actual_spent") or 0)
+                lines.append(
+                    {
+                        "category": b.get("category", "N/A"),
+                        "quarter": b.get("quarter", "N/A"),
+                        "year": b.get("year"),
+                        "approved": round(approved, 2),
+                        "spent": round(spent, 2),
+                        "variance_percent": (
+                            round((spent - approved) / approved * 100, 2)
+                            if approved > 0
+                            else None
+                        ),
+                    }
+                )
+            approved = sum(line["approved"] for line in lines)
+            spent = sum(line["spent"] for line in lines)
+            return {
+                "department": department,
+                "approved": round(approved, 2),
+                "spent": round(spent, 2),
+                "variance_percent": (
+                    round((spent - approved) / approved * 100, 2) if approved else None
+                ),
+                "lines": lines,
+            }
+        except Exception as e:
+            print(f"Error in get_department_budget_variance: {e}")
+            return {"error": str(e)}
+
+    def get_invoice_aging(self, org_id) -> Dict:
+        """Unpaid invoice amounts in days-past-due buckets"""
+        try:
+            rows = (
+                self.db.table("invoices")
+                .select("amount,due_date,status")
+                .eq("organization_id", org_id)
+                .neq("status", "paid")
+                .execute()
+                .data
+                or []
+            )
+            today = clock.now().date()
+            aging = {b: {"count": 0, "amount": 0.0} for b in AGING_BUCKETS}
+            for inv in rows:
+                bucket = aging_bucket(days_past_due(inv, today))
+                aging[bucket]["count"] += 1
+                aging[bucket]["amount"] += float(inv.get("amount") or 0)
+            for b in aging.values():
+                b["amount"] = round(b["amount"], 2)
+            return {
+                "as_of": today.isoformat(),
+                "total_unpaid": round(sum(b["amount"] for b in aging.values()), 2),
+                "buckets": aging,
+            }
+        except Exception as e:
+            print(f"Error in get_invoice_aging: {e}")
+            return {"error": str(e)}
+
     # ----------------------------- BUDGET------------------------------#
     def get_budget_filter_options(
         self, current_user: Optional[Dict] = None
@@ -898,6 +1123,10 @@ class DataService:
             }
             # ...existing insert with project_id fallback if needed...
             result = self.db.table("budgets").insert(data).execute()
+            if result.data:
+                get_alert_pipeline().on_budget(result.data[0])
+                invalidate_quick_answers(current_user["organization_id"])
+                invalidate_snapshot(current_user["organization_id"], self.db)
             return {"success": True, "data": result.data[0] if result.data else None}
         except Exception as e:
             print(f"Error in create_budget: {e}")
@@ -950,6 +1179,9 @@ class DataService:
                 data["year"] = year
 
             result = self.db.table("budgets").update(data).eq("id", budget_id).execute()
+            get_alert_pipeline().on_budget({**target, **data})
+            invalidate_quick_answers(target.get("organization_id"))
+            invalidate_snapshot(target.get("organization_id"), self.db)
             return {"success": True, "data": result.data[0] if result.data else None}
         except Exception as e:
             print(f"Error in update_budget: {e}")
@@ -0,0 +1,383 @@
+# services/llm_gateway.py
+import asyncio
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import openai
+
+from config.enviroment import get_config
+from utils.prompt_payload import estimate_tokens
+
+# Transient provider errors worth retrying; anything else fails immediately
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+
+class LLMOverloadedError(RuntimeError):
+    """The gateway queue is full, or a call waited too long for a slot"""
+
+
+class LLMLimiter:
+    """Global and per-org concurrency slots with a bounded wait queue.
+
+    At most `max_concurrency` calls run at once, and at most `per_org` for
+    any one org. Callers wait up to `queue_timeout` seconds for a slot; when
+    `max_queue` callers are already waiting, new ones are rejected at once.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        per_org: int = 3,
+        max_queue: int = 32,
+        queue_timeout: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_org = per_org
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.active_by_org: Dict[Any, int] = {}
+        self.waiting = 0
+        self._cond = threading.Condition()
+        # One wake-up event per event loop with async waiters
+        self._loop_events: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def acquire(self, org_id=None) -> None:
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            if not self._free(org_id):
+                self._enqueue()
+                try:
+                    while not self._free(org_id):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._timed_out()
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self._take(org_id)
+
+    def release(self, org_id=None) -> None:
+        with self._cond:
+            self.active -= 1
+            left = self.active_by_org.get(org_id, 1) - 1
+            if left:
+                self.active_by_org[org_id] = left
+            else:
+                self.active_by_org.pop(org_id, None)
+            self._cond.notify_all()
+            loops = list(self._loop_events.items())
+        # Async waiters may be on other threads' loops
+        for loop, event in loops:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+
+    async def aacquire(self, org_id=None) -> None:
+        """acquire() for coroutines: waits on the event loop, not a thread.
+
+        The slot is taken synchronously once free, so cancelling a waiter
+        never leaks one.
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            if self._free(org_id):
+                self._take(org_id)
+                return
+            self._enqueue()
+            event = self._loop_events.setdefault(
+                asyncio.get_running_loop(), asyncio.Event()
+            )
+        try:
+            while True:
+                with self._cond:
+                    if self._free(org_id):
+                        self._take(org_id)
+                        return
+                    # A release after this point sets it again via the loop
+                    event.clear()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._timed_out()
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def _enqueue(self) -> None:
+        if self.waiting >= self.max_queue:
+            raise LLMOverloadedError(
+                "The AI service is busy right now, please try again shortly."
+            )
+        self.waiting += 1
+
+    def _take(self, org_id) -> None:
+        self.active += 1
+        self.active_by_org[org_id] = self.active_by_org.get(org_id, 0) + 1
+
+    def _timed_out(self) -> LLMOverloadedError:
+        return LLMOverloadedError(
+            "Timed out waiting for the AI service, please try again."
+        )
+
+    def _free(self, org_id) -> bool:
+        return (
+            self.active < self.max_concurrency
+            and self.active_by_org.get(org_id, 0) < self.per_org
+        )
+
+
+class LLMMeter:
+    """Per (org, agent) call counts, token usage and latency"""
+
+    def __init__(self):
+        self._stats: Dict[Tuple, Dict] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        org_id,
+        agent,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency: float = 0.0,
+        error: bool = False,
+    ) -> None:
+        with self._lock:
+            s = self._stats.setdefault(
+                (org_id, agent),
+                {
+                    "calls": 0,
+                    "errors": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "latency_total": 0.0,
+                    "latency_max": 0.0,
+                },
+            )
+            s["calls"] += 1
+            s["errors"] += int(error)
+            s["prompt_tokens"] += prompt_tokens
+            s["completion_tokens"] += completion_tokens
+            s["latency_total"] += latency
+            s["latency_max"] = max(s["latency_max"], latency)
+
+    def summary(self) -> List[Dict]:
+        """One row per (org, agent), busiest first"""
+        with self._lock:
+            rows = [
+                {
+                    "org_id": org_id,
+                    "agent": agent,
+                    "calls": s["calls"],
+                    "errors": s["errors"],
+                    "prompt_tokens": s["prompt_tokens"],
+                    "completion_tokens": s["completion_tokens"],
+                    "avg_latency": round(s["latency_total"] / s["calls"], 3),
+                    "max_latency": round(s["latency_max"], 3),
+                }
+                for (org_id, agent), s in self._stats.items()
+            ]
+        return sorted(
+            rows,
+            key=lambda r: r["prompt_tokens"] + r["completion_tokens"],
+            reverse=True,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class LLMGateway:
+    """Wraps a chat model with concurrency limits, timeouts, retries and metering.
+
+    Drop-in for the invoke/ainvoke/batch/abatch/bind_tools calls the agents
+    make. Calls are attributed to config["metadata"]["org_id"] / ["agent"].
+    """
+
+    def __init__(
+        self,
+        llm,
+        limiter: Optional[LLMLimiter] = None,
+        meter: Optional[LLMMeter] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ):
+        self.llm = llm
+        self.limiter = limiter or get_llm_limiter()
+        self.meter = meter or get_llm_meter()
+        self.timeout = timeout if timeout is not None else llm_timeout()
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else int(get_config("LLM_MAX_RETRIES", "2"))
+        )
+
+    # ---------------- Calls ----------------
+    def invoke(self, input, config: Optional[Dict] = None, **kwargs):
+        org_id, agent = self._labels(config)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(org_id)
+            started = time.monotonic()
+            try:
+                response = self.llm.invoke(input, config=config, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                self._record_error(org_id, agent, started)
+                if attempt >= self.max_retries:
+                    raise
+                print(f"LLM call failed ({e!r}), retrying")
+            except Exception:
+                self._record_error(org_id, agent, started)
+                raise
+            else:
+                self._record(org_id, agent, input, response, started)
+                return response
+            finally:
+                self.limiter.release(org_id)
+            time.sleep(self._backoff(attempt))
+
+    async def ainvoke(self, input, config: Optional[Dict] = None, **kwargs):
+        org_id, agent = self._labels(config)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire(org_id)
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    self.llm.ainvoke(input, config=config, **kwargs), self.timeout
+                )
+            except RETRYABLE_ERRORS as e:
+                self._record_error(org_id, agent, started)
+                if attempt >= self.max_retries:
+                    raise
+                print(f"LLM call failed ({e!r}), retrying")
+            except Exception:
+                self._record_error(org_id, agent, started)
+                raise
+            else:
+                self._record(org_id, agent, input, response, started)
+                return response
+            finally:
+                self.limiter.release(org_id)
+            await asyncio.sleep(self._backoff(attempt))
+
+    def batch(self, inputs: List, config=None, *, return_exceptions=False, **kwargs):
+        """Concurrent invoke() per input, bounded by config["max_concurrency"]"""
+        if not inputs:
+            return []
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        workers = (configs[0] or {}).get("max_concurrency") or len(inputs)
+
+        def run(i):
+            try:
+                return self.invoke(inputs[i], configs[i], **kwargs)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(inputs))) as pool:
+            return list(pool.map(run, range(len(inputs))))
+
+    async def abatch(
+        self, inputs: List, config=None, *, return_exceptions=False, **kwargs
+    ):
+        if not inputs:
+            return []
+        configs = config if isinstance(config, list) else [config] * len(inputs)
+        workers = asyncio.Semaphore(
+            (configs[0] or {}).get("max_concurrency") or len(inputs)
+        )
+
+        async def run(i):
+            async with workers:
+                return await self.ainvoke(inputs[i], configs[i], **kwargs)
+
+        return await asyncio.gather(
+            *(run(i) for i in range(len(inputs))), return_exceptions=return_exceptions
+        )
+
+    def bind_tools(self, tools, **kwargs) -> "LLMGateway":
+        """Tool-bound model behind the same limits and meter"""
+        return LLMGateway(
+            self.llm.bind_tools(tools, **kwargs),
+            self.limiter,
+            self.meter,
+            self.timeout,
+            self.max_retries,
+        )
+
+    def __getattr__(self, name):
+        # Model attributes (model_name, temperature, ...) come from the wrapped LLM
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    # ---------------- Helpers ----------------
+    def _labels(self, config: Optional[Dict]) -> Tuple:
+        metadata = (config or {}).get("metadata") or {}
+        return metadata.get("org_id"), metadata.get("agent", "unknown")
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        base = float(get_config("LLM_RETRY_BASE_SECONDS", "0.5"))
+        return random.uniform(0, min(8.0, base * 2**attempt))
+
+    def _record(self, org_id, agent, input, response, started) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(str(input))
+        completion_tokens = usage.get("output_tokens")
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(str(getattr(response, "content", "")))
+        self.meter.record(
+            org_id,
+            agent,
+            prompt_tokens,
+            completion_tokens,
+            time.monotonic() - started,
+        )
+
+    def _record_error(self, org_id, agent, started) -> None:
+        self.meter.record(org_id, agent, latency=time.monotonic() - started, error=True)
+
+
+def llm_timeout() -> float:
+    """Per-request timeout in seconds"""
+    return float(get_config("LLM_TIMEOUT_SECONDS", "60"))
+
+
+_limiter: Optional[LLMLimiter] = None
+_meter = LLMMeter()
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter() -> LLMLimiter:
+    """Process-wide limiter shared by every gateway"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = LLMLimiter(
+                max_concurrency=int(get_config("LLM_MAX_CONCURRENCY", "8")),
+                per_org=int(get_config("LLM_MAX_CONCURRENCY_PER_ORG", "3")),
+                max_queue=int(get_config("LLM_MAX_QUEUE", "32")),
+                queue_timeout=float(get_config("LLM_QUEUE_TIMEOUT_SECONDS", "30")),
+            )
+        return _limiter
+
+
+def get_llm_meter() -> LLMMeter:
+    """Process-wide token/latency meter"""
+    return _meter
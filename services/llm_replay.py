@@ -0,0 +1,207 @@
+# services/llm_replay.py
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from config.enviroment import get_config
+
+DEFAULT_CASSETTE = ".cache/llm_cassette.json"
+
+
+class ReplayMissError(KeyError):
+    """Strict replay found no recorded completion for a prompt"""
+
+
+class Cassette:
+    """Recorded prompt -> completion pairs in one JSON file, shared per process.
+
+    `meta` (stored under "_meta") holds run-wide facts a replay must
+    reproduce, such as the recording's clock time.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict] = {}
+        self.meta: Dict[str, Any] = {}
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+                self.meta = self.entries.pop("_meta", {})
+            except Exception as e:
+                print(f"Error reading LLM cassette {self.path}: {e}")
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        entry = self.entries.get(key)
+        with self._lock:
+            self.stats["hits" if entry else "misses"] += 1
+        return entry
+
+    def record(self, key: str, messages, message: BaseMessage, latency: float):
+        with self._lock:
+            self.entries[key] = {
+                "prompt": [message_to_dict(m) for m in messages],
+                "response": message_to_dict(message),
+                "latency": round(latency, 3),
+            }
+            self.stats["recorded"] += 1
+            self._dirty = True
+
+    def set_meta(self, key: str, value) -> None:
+        with self._lock:
+            self.meta[key] = value
+            self._dirty = True
+
+    def flush(self) -> None:
+        """Write recorded entries to disk (once per run, not per call)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(
+                json.dumps({"_meta": self.meta, **self.entries}, indent=1),
+                encoding="utf-8",
+            )
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model that records real completions to a cassette or replays them.
+
+    mode="record": forwards to `inner` (the real model) and stores each
+    prompt -> completion with its latency. mode="replay": answers from the
+    cassette only, sleeping `latency` seconds per call (None = the recorded
+    latency). Prompts are keyed by a hash of the messages and bound tools.
+    """
+
+    mode: str = "replay"
+    cassette_path: str = DEFAULT_CASSETTE
+    latency: Optional[float] = None
+    strict: bool = False
+    inner: Optional[Any] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay-chat"
+
+    @property
+    def cassette(self) -> Cassette:
+        return get_cassette(self.cassette_path)
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    # ---------------- Generation ----------------
+    def _generate(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        key = self._key(messages, kwargs)
+        if self.mode == "record":
+            started = time.monotonic()
+            message = self.inner.invoke(messages, stop=stop, **kwargs)
+            self.cassette.record(key, messages, message, time.monotonic() - started)
+            return _result(message)
+
+        entry = self._lookup(key)
+        time.sleep(self._delay(entry))
+        return _result(self._message(entry))
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        key = self._key(messages, kwargs)
+        if self.mode == "record":
+            started = time.monotonic()
+            message = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+            self.cassette.record(key, messages, message, time.monotonic() - started)
+            return _result(message)
+
+        entry = self._lookup(key)
+        await asyncio.sleep(self._delay(entry))
+        return _result(self._message(entry))
+
+    # ---------------- Helpers ----------------
+    def _key(self, messages: List[BaseMessage], kwargs: Dict) -> str:
+        parts = [f"{m.type}:{' '.join(str(m.content).split())}" for m in messages]
+        for m in messages:
+            # Tool-call turns are identified by the calls, not the (empty) content
+            for call in getattr(m, "tool_calls", None) or []:
+                parts.append(
+                    f"call:{call['name']}:{json.dumps(call['args'], sort_keys=True)}"
+                )
+        tools = sorted(t["function"]["name"] for t in kwargs.get("tools") or [])
+        parts.append("tools:" + ",".join(tools))
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        entry = self.cassette.lookup(key)
+        if entry is None and self.strict:
+            raise ReplayMissError(f"No recorded completion for prompt {key[:12]}")
+        return entry
+
+    def _delay(self, entry: Optional[Dict]) -> float:
+        if self.latency is not None:
+            return self.latency
+        return (entry or {}).get("latency", 0.0)
+
+    def _message(self, entry: Optional[Dict]) -> AIMessage:
+        if entry is None:
+            return AIMessage(content="[replay] No recorded response for this prompt.")
+        return messages_from_dict([entry["response"]])[0]
+
+
+def _result(message: BaseMessage) -> ChatResult:
+    return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def replay_mode() -> Optional[str]:
+    """LLM_REPLAY_MODE ("record" or "replay"), or None for live calls"""
+    mode = (get_config("LLM_REPLAY_MODE") or "").lower()
+    return mode if mode in {"record", "replay"} else None
+
+
+def get_replay_llm(inner=None) -> ReplayChatModel:
+    """Replay model configured from LLM_CASSETTE / LLM_REPLAY_LATENCY / LLM_REPLAY_STRICT"""
+    latency = get_config("LLM_REPLAY_LATENCY", "recorded")
+    return ReplayChatModel(
+        mode=replay_mode() or "replay",
+        cassette_path=get_config("LLM_CASSETTE", DEFAULT_CASSETTE),
+        latency=None if latency == "recorded" else float(latency),
+        strict=get_config("LLM_REPLAY_STRICT", "0") in {"1", "true", "True"},
+        inner=inner,
+    )
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str = DEFAULT_CASSETTE) -> Cassette:
+    """Process-wide cassette for a file, so every agent records into one place"""
+    key = str(Path(path).resolve())
+    with _cassettes_lock:
+        if key not in _cassettes:
+            _cassettes[key] = Cassette(path)
+            # Recordings are only written on flush; don't lose them on exit
+            atexit.register(_cassettes[key].flush)
+        return _cassettes[key]
@@ -0,0 +1,221 @@
+# services/policy_index.py
+import hashlib
+import heapq
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from supabase import Client
+
+from config.database import get_db
+from config.enviroment import get_config
+
+STOPWORDS = set(
+    """
+    a about above after all also am an and any are as at be been being but by
+    can could did do does for from had has have how i if in into is it its me
+    my no not of on or our ours should so such than that the their them then
+    there these they this those to up us was we were what when where which who
+    whom why will with would you your
+    """.split()
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9$]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with naive plural folding"""
+    tokens = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        if tok in STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 ranking; documents can be added/removed incrementally"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_len: Dict[str, int] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._total_len = 0
+        # Per-document length normalization, recomputed after any change
+        self._norms: Optional[Dict[str, float]] = None
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, doc_id: str, text: str) -> None:
+        if doc_id in self.doc_len:
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+        length = sum(counts.values())
+        self.doc_len[doc_id] = length
+        self._doc_terms[doc_id] = list(counts)
+        self._total_len += length
+        self._norms = None
+
+    def remove(self, doc_id: str) -> None:
+        length = self.doc_len.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_len -= length
+        self._norms = None
+        for term in self._doc_terms.pop(doc_id, []):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[str, float]]:
+        n = len(self.doc_len)
+        if not n:
+            return []
+        if self._norms is None:
+            avgdl = self._total_len / n or 1.0
+            self._norms = {
+                d: self.k1 * (1 - self.b + self.b * length / avgdl)
+                for d, length in self.doc_len.items()
+            }
+        norms = self._norms
+
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            weight = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            weight *= self.k1 + 1
+            for doc_id, tf in docs.items():
+                scores[doc_id] += weight * tf / (tf + norms[doc_id])
+
+        return heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+
+
+class PolicyIndex:
+    """BM25 index over one organization's policy_documents, kept in memory.
+
+    Every POLICY_INDEX_REFRESH_SECONDS it checks document versions (id +
+    updated_at, or a content hash when that column is missing) and re-indexes
+    only the documents that were added, changed or deleted.
+    """
+
+    def __init__(self, org_id: str, db: Optional[Client] = None):
+        self.org_id = org_id
+        self.db: Client = db or get_db()
+        self.refresh_seconds = float(get_config("POLICY_INDEX_REFRESH_SECONDS", "300"))
+        self.index = BM25Index()
+        self.docs: Dict[str, Dict] = {}
+        self.versions: Dict[str, str] = {}
+        # Set once a refresh succeeds; until then versions is not the real set
+        self.loaded = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def search(self, query: str, k: int = 3) -> List[Dict]:
+        """Top-k policy rows for the query, most relevant first"""
+        self.ensure_fresh()
+        return [self.docs[doc_id] for doc_id, _ in self.index.search(query, k)]
+
+    def ensure_fresh(self) -> None:
+        if time.time() - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if time.time() - self._checked_at < self.refresh_seconds:
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the last good index
+                print(f"Error refreshing policy index for {self.org_id}: {e}")
+            self._checked_at = time.time()
+
+    def refresh(self) -> None:
+        versions, full_rows = self._load_versions()
+
+        removed = set(self.versions) - set(versions)
+        changed = [d for d, v in versions.items() if self.versions.get(d) != v]
+
+        for doc_id in removed:
+            self.index.remove(doc_id)
+            self.docs.pop(doc_id, None)
+
+        if changed:
+            rows = full_rows
+            if rows is None:
+                rows = []
+                # Chunked so the id filter stays within URL limits
+                for i in range(0, len(changed), 200):
+                    rows.extend(
+                        self.db.table("policy_documents")
+                        .select("*")
+                        .in_("id", changed[i : i + 200])
+                        .execute()
+                        .data
+                        or []
+                    )
+            by_id = {str(r["id"]): r for r in rows}
+            for doc_id in changed:
+                row = by_id.get(doc_id)
+                if row is None:
+                    continue
+                self.docs[doc_id] = row
+                self.index.add(
+                    doc_id, f"{row.get('category') or ''} {row.get('content') or ''}"
+                )
+
+        self.versions = versions
+        self.loaded = True
+
+    def _load_versions(self) -> Tuple[Dict[str, str], Optional[List[Dict]]]:
+        """Return ({doc_id: version}, full rows if they had to be loaded anyway)"""
+        try:
+            rows = (
+                self.db.table("policy_documents")
+                .select("id, updated_at")
+                .eq("organization_id", self.org_id)
+                .execute()
+                .data
+                or []
+            )
+            return {str(r["id"]): str(r.get("updated_at")) for r in rows}, None
+        except Exception:
+            # No updated_at column: fall back to hashing content
+            rows = (
+                self.db.table("policy_documents")
+                .select("*")
+                .eq("organization_id", self.org_id)
+                .execute()
+                .data
+                or []
+            )
+            versions = {
+                str(r["id"]): hashlib.sha1(
+                    f"{r.get('category')}|{r.get('content')}".encode("utf-8")
+                ).hexdigest()
+                for r in rows
+            }
+            return versions, rows
+
+
+_indexes: Dict[str, PolicyIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_policy_index(org_id: str) -> PolicyIndex:
+    """Process-wide PolicyIndex for an organization"""
+    key = str(org_id)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = PolicyIndex(key)
+        return _indexes[key]
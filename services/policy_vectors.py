@@ -0,0 +1,194 @@
+# services/policy_vectors.py
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.enviroment import get_config
+from services.policy_index import PolicyIndex, get_policy_index
+
+# Optional dependency (opt-in, see requirements.txt): without
+# sentence-transformers the vector index is disabled and PolicyAgent falls
+# back to BM25 over whole documents.
+try:
+    from sentence_transformers import SentenceTransformer
+except Exception:
+    SentenceTransformer = None
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def vectors_available() -> bool:
+    return SentenceTransformer is not None and get_config(
+        "POLICY_VECTORS_ENABLED", "1"
+    ) not in {"0", "false", "False"}
+
+
+def embed(texts: List[str]) -> np.ndarray:
+    """L2-normalized float32 embeddings from the local CPU model"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = SentenceTransformer(
+                get_config("POLICY_EMBED_MODEL", DEFAULT_MODEL), device="cpu"
+            )
+    vecs = _model.encode(
+        texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True
+    )
+    return np.asarray(vecs, dtype=np.float32)
+
+
+def chunk_text(text: str, max_words: int = 120, overlap: int = 30) -> List[str]:
+    """Split a document into overlapping word windows along paragraph boundaries"""
+    chunks: List[str] = []
+    for para in re.split(r"\n\s*\n", text or ""):
+        words = para.split()
+        if not words:
+            continue
+        step = max(1, max_words - overlap)
+        for start in range(0, len(words), step):
+            chunks.append(" ".join(words[start : start + max_words]))
+            if start + max_words >= len(words):
+                break
+    return chunks
+
+
+class PolicyVectorIndex:
+    """Chunk embeddings for one organization's policies.
+
+    The matrix lives in <POLICY_VECTOR_DIR>/<org>.npy (memory-mapped on load)
+    with chunk metadata in <org>.json. Document versions come from the org's
+    PolicyIndex, so only added/changed documents are re-embedded. The
+    matrix and its chunks are swapped together as one tuple, so a search
+    running during a sync never pairs rows with the wrong chunks.
+    """
+
+    def __init__(self, org_id: str, policy_index: Optional[PolicyIndex] = None):
+        self.org_id = str(org_id)
+        self.policy_index = policy_index or get_policy_index(org_id)
+        base = Path(get_config("POLICY_VECTOR_DIR", ".cache/policy_vectors"))
+        self.matrix_path = base / f"{self.org_id}.npy"
+        self.meta_path = base / f"{self.org_id}.json"
+        self._data: Tuple[np.ndarray, List[Dict]] = (
+            np.zeros((0, 0), dtype=np.float32),
+            [],
+        )
+        self.doc_versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._data[0]
+
+    @property
+    def chunks(self) -> List[Dict]:
+        return self._data[1]
+
+    def search(self, query: str, k: int = 4) -> List[Dict]:
+        """Top-k chunks by cosine similarity: {doc_id, category, text, score}"""
+        self.sync()
+        matrix, chunks = self._data
+        if not len(chunks):
+            return []
+        q = embed([query])[0]
+        scores = np.asarray(matrix @ q)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{**chunks[i], "score": float(scores[i])} for i in top]
+
+    def sync(self) -> None:
+        """Re-embed changed documents and drop deleted ones"""
+        self.policy_index.ensure_fresh()
+        if not self.policy_index.loaded:
+            # Versions unknown (refresh failed): keep serving persisted chunks
+            # rather than treating every document as deleted
+            return
+        versions = dict(self.policy_index.versions)
+        if versions == self.doc_versions:
+            return
+
+        with self._lock:
+            changed = {d for d, v in versions.items() if self.doc_versions.get(d) != v}
+            keep = [
+                i
+                for i, c in enumerate(self.chunks)
+                if c["doc_id"] in versions and c["doc_id"] not in changed
+            ]
+
+            new_chunks: List[Dict] = []
+            for doc_id in changed:
+                doc = self.policy_index.docs.get(doc_id) or {}
+                for text in chunk_text(doc.get("content") or ""):
+                    new_chunks.append(
+                        {
+                            "doc_id": doc_id,
+                            "category": doc.get("category"),
+                            "text": text,
+                        }
+                    )
+
+            parts = []
+            if keep:
+                parts.append(np.asarray(self.matrix[keep]))
+            if new_chunks:
+                parts.append(embed([c["text"] for c in new_chunks]))
+
+            self._data = (
+                np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32),
+                [self.chunks[i] for i in keep] + new_chunks,
+            )
+            self.doc_versions = versions
+            self._save()
+
+    def _load(self) -> None:
+        if not (self.matrix_path.exists() and self.meta_path.exists()):
+            return
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            self._data = (np.load(self.matrix_path, mmap_mode="r"), meta["chunks"])
+            self.doc_versions = meta["doc_versions"]
+        except Exception as e:
+            print(f"Error loading policy vectors for {self.org_id}: {e}")
+            self._data = (np.zeros((0, 0), dtype=np.float32), [])
+            self.doc_versions = {}
+
+    def _save(self) -> None:
+        try:
+            self.matrix_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.matrix_path.with_suffix(".tmp.npy")
+            np.save(tmp, np.ascontiguousarray(self.matrix, dtype=np.float32))
+            os.replace(tmp, self.matrix_path)
+            tmp_meta = self.meta_path.with_suffix(".tmp.json")
+            tmp_meta.write_text(
+                json.dumps({"chunks": self.chunks, "doc_versions": self.doc_versions}),
+                encoding="utf-8",
+            )
+            os.replace(tmp_meta, self.meta_path)
+            self._data = (np.load(self.matrix_path, mmap_mode="r"), self.chunks)
+        except Exception as e:
+            # Still usable from memory; it will be rebuilt next process start
+            print(f"Error saving policy vectors for {self.org_id}: {e}")
+
+
+_vector_indexes: Dict[str, PolicyVectorIndex] = {}
+_vector_indexes_lock = threading.Lock()
+
+
+def get_policy_vector_index(org_id: str) -> Optional[PolicyVectorIndex]:
+    """Process-wide vector index for an organization (None when unavailable)"""
+    if not vectors_available():
+        return None
+    key = str(org_id)
+    with _vector_indexes_lock:
+        if key not in _vector_indexes:
+            _vector_indexes[key] = PolicyVectorIndex(key)
+        return _vector_indexes[key]
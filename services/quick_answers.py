@@ -0,0 +1,256 @@
+# services/quick_answers.py
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from supabase import Client
+
+from agents.data_context import AgentDataContext
+from config.database import get_db
+from config.enviroment import get_config
+
+QUICK_QUESTIONS = [
+    "What's our spending trend?",
+    "Which departments are over budget?",
+    "How can we reduce costs?",
+    "What's our cash runway?",
+    "Find unusual transactions",
+]
+
+QUICK_ANSWERS_TABLE = "quick_answers"
+
+# Tables whose changes make a precomputed answer stale
+VERSION_TABLES = ["transactions", "budgets", "invoices"]
+
+
+class QuickAnswerStore:
+    """Precomputed Quick Question answers per org, tagged with a data version.
+
+    The version is a cheap fingerprint of the tables the answers depend on:
+    per table, the row count and the newest row (by updated_at, or by id when
+    that column is missing). It is re-checked in the background at most every
+    `version_ttl` seconds, and right after writes through invalidate(); the
+    click path only reads the cached one. Stale answers are still served
+    (marked not fresh) while the refresh regenerates them. Answers persist to
+    the quick_answers table when present.
+    """
+
+    def __init__(self, db: Optional[Client] = None, agent=None):
+        self.db: Client = db or get_db()
+        self._agent = agent
+        self.version_ttl = float(get_config("QUICK_ANSWER_VERSION_TTL", "30"))
+        self._answers: Dict[tuple, Dict] = {}
+        self._versions: Dict = {}
+        self._no_updated_at = set()
+        self._loaded = set()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="quick-answers"
+        )
+
+    @property
+    def agent(self):
+        if self._agent is None:
+            from agents.cfo_agent import CFOAgent
+
+            self._agent = CFOAgent()
+        return self._agent
+
+    # ---------------- Public ----------------
+    def answer(self, org_id, question: str) -> Dict:
+        """{answer, data_version, computed_at, fresh} for a question.
+
+        fresh is None when the data version hasn't been checked yet.
+        """
+        entry = self._entry(org_id, question)
+        if entry is None:
+            entry = self._generate(org_id, question, self.data_version(org_id))
+            self.refresh(org_id)
+            return {**entry, "fresh": entry["data_version"] is not None}
+
+        cached = self._versions.get(org_id)
+        if not cached or time.time() - cached[0] >= self.version_ttl:
+            # Re-check off the click path; regenerates if the data moved
+            self.refresh(org_id)
+        if not cached:
+            return {**entry, "fresh": None}
+        fresh = entry["data_version"] == cached[1]
+        if not fresh:
+            # Serve the previous answer while the refresh regenerates it
+            self.refresh(org_id)
+        return {**entry, "fresh": fresh}
+
+    def refresh(self, org_id) -> None:
+        """Regenerate stale answers for the org in the background (non-blocking)"""
+        with self._lock:
+            if org_id in self._refreshing:
+                return
+            self._refreshing.add(org_id)
+        self._pool.submit(self._refresh, org_id)
+
+    def data_version(self, org_id, max_age: Optional[float] = None) -> str:
+        """Fingerprint of the org's answer-relevant data (cached for version_ttl)"""
+        max_age = self.version_ttl if max_age is None else max_age
+        cached = self._versions.get(org_id)
+        if cached and time.time() - cached[0] < max_age:
+            return cached[1]
+
+        digest = hashlib.sha1()
+        for table in VERSION_TABLES:
+            digest.update(f"{table}:{self._table_signal(table, org_id)};".encode())
+        version = digest.hexdigest()[:12]
+        self._versions[org_id] = (time.time(), version)
+        return version
+
+    def invalidate(self, org_id) -> None:
+        """The org's data was just written: answers are stale until re-checked"""
+        if org_id in self._versions:
+            # A version no answer carries, expired, so the next access serves
+            # answers as not fresh and re-checks in the background
+            self._versions[org_id] = (0.0, "")
+
+    # ---------------- Internals ----------------
+    def _refresh(self, org_id) -> None:
+        try:
+            version = self.data_version(org_id)
+            # Live tables: the answer must reflect the version it is tagged with,
+            # not a snapshot from before the change
+            data = AgentDataContext(self.db, use_snapshots=False)
+            for question in QUICK_QUESTIONS:
+                entry = self._entry(org_id, question)
+                if not entry or entry["data_version"] != version:
+                    self._generate(org_id, question, version, data)
+        except Exception as e:
+            print(f"Error refreshing quick answers: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(org_id)
+
+    def _table_signal(self, table: str, org_id) -> str:
+        """Row count plus the newest row's id/updated_at, from a one-row query"""
+        since = (datetime.now() - timedelta(days=90)).date().isoformat()
+        while True:
+            column = "id" if table in self._no_updated_at else "updated_at"
+            q = (
+                self.db.table(table)
+                .select("id" if column == "id" else "id,updated_at", count="exact")
+                .eq("organization_id", org_id)
+            )
+            if table == "transactions":
+                q = q.gte("date", since)
+            try:
+                res = q.order(column, desc=True).limit(1).execute()
+            except Exception:
+                if column == "id":
+                    raise
+                # No updated_at column: inserts and deletes still show up
+                self._no_updated_at.add(table)
+                continue
+            top = (res.data or [{}])[0]
+            return f"{res.count}:{top.get('id')}:{top.get(column)}"
+
+    def _generate(self, org_id, question, version, data=None) -> Dict:
+        data = data or AgentDataContext(self.db, use_snapshots=False)
+        try:
+            answer = self.agent.router_agent.route_query(
+                question.lower(), org_id, data=data
+            )
+        except Exception as e:
+            # Not stored, so the next access tries again
+            return {
+                "answer": f"I encountered an error analyzing your request: {e}",
+                "data_version": None,
+                "computed_at": datetime.utcnow().isoformat(),
+            }
+
+        entry = {
+            "answer": answer,
+            "data_version": version,
+            "computed_at": datetime.utcnow().isoformat(),
+        }
+        self._answers[(org_id, question)] = entry
+        self._persist(org_id, question, entry)
+        return entry
+
+    def _entry(self, org_id, question) -> Optional[Dict]:
+        if org_id not in self._loaded:
+            self._load_persisted(org_id)
+        return self._answers.get((org_id, question))
+
+    def _persist(self, org_id, question, entry) -> None:
+        try:
+            self.db.table(QUICK_ANSWERS_TABLE).upsert(
+                {"organization_id": org_id, "question": question, **entry},
+                on_conflict="organization_id,question",
+            ).execute()
+        except Exception as e:
+            print(f"Error saving quick answer: {e}")
+
+    def _load_persisted(self, org_id) -> None:
+        self._loaded.add(org_id)
+        try:
+            rows = (
+                self.db.table(QUICK_ANSWERS_TABLE)
+                .select("*")
+                .eq("organization_id", org_id)
+                .execute()
+                .data
+                or []
+            )
+        except Exception:
+            return
+        for row in rows:
+            self._answers.setdefault(
+                (org_id, row["question"]),
+                {
+                    "answer": row["answer"],
+                    "data_version": row.get("data_version"),
+                    "computed_at": row.get("computed_at"),
+                },
+            )
+
+
+def freshness_label(entry: Dict) -> str:
+    """Human-readable age/freshness note for a quick answer"""
+    if entry.get("data_version") is None:
+        return ""
+    try:
+        computed = datetime.fromisoformat(
+            str(entry["computed_at"]).replace("Z", "+00:00")
+        ).replace(tzinfo=None)
+        minutes = int((datetime.utcnow() - computed).total_seconds() // 60)
+    except (KeyError, TypeError, ValueError):
+        return ""
+    age = (
+        "just now"
+        if minutes < 1
+        else (f"{minutes} min ago" if minutes < 60 else f"{minutes // 60} h ago")
+    )
+    if entry.get("fresh") is None:
+        return f"Precomputed {age}"
+    if entry.get("fresh"):
+        return f"Precomputed {age} · up to date with current data"
+    return f"Precomputed {age} · data has changed since, refreshing in the background"
+
+
+_store: Optional[QuickAnswerStore] = None
+_store_lock = threading.Lock()
+
+
+def get_quick_answer_store() -> QuickAnswerStore:
+    """Process-wide store shared by every session"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = QuickAnswerStore()
+        return _store
+
+
+def invalidate_quick_answers(org_id) -> None:
+    """Write hook: mark the org's answers stale (no-op until the store exists)"""
+    if _store is not None and org_id:
+        _store.invalidate(org_id)
@@ -0,0 +1,234 @@
+# services/risk_rules.py
+import json
+import string
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from config.enviroment import get_config
+from utils import clock
+from utils.helper import to_plain
+
+SEVERITIES = ["critical", "high", "medium", "low"]
+
+# Risk rules as data. Each rule reads one table frame:
+# - "row" rules fire once per row matching `where` (a pandas eval expression)
+# - "aggregate" rules filter with `where`, aggregate per org, then fire when
+#   `when` holds on the aggregates
+# `message` is formatted with the row's columns or the aggregates; `numbers`
+# lists the row columns reported with a fired row rule.
+DEFAULT_RISK_RULES = [
+    {
+        "id": "budget_overrun_20",
+        "table": "budgets",
+        "kind": "row",
+        "where": "actual_spent > approved_amount * 1.2",
+        "severity": "high",
+        "message": "{dept} is 20%+ over budget",
+        "numbers": ["actual_spent", "approved_amount"],
+    },
+    {
+        "id": "overdue_invoices",
+        "table": "invoices",
+        "kind": "aggregate",
+        "where": "is_overdue == True",
+        "aggregate": {"count": ["amount", "size"], "total": ["amount", "sum"]},
+        "when": "count > 5",
+        "severity": "medium",
+        "message": "{count} overdue invoices totaling ${total:,.2f}",
+    },
+    {
+        "id": "invoices_90_days_past_due",
+        "table": "invoices",
+        "kind": "aggregate",
+        "where": "status != 'paid' and days_past_due > 90",
+        "aggregate": {"count": ["amount", "size"], "total": ["amount", "sum"]},
+        "when": "count >= 1",
+        "severity": "high",
+        "message": "{count} unpaid invoices are 90+ days past due (${total:,.2f})",
+    },
+    {
+        "id": "fraud_flagged_transactions",
+        "table": "transactions",
+        "kind": "aggregate",
+        "where": "fraud_flag == 1",
+        "aggregate": {"count": ["amount", "size"], "total": ["amount", "sum"]},
+        "when": "count >= 1",
+        "severity": "critical",
+        "message": "{count} transactions flagged as fraudulent by Stripe (${total:,.2f})",
+    },
+]
+
+# Coerced to numbers before evaluation (Supabase may return numerics as text)
+NUMERIC_COLUMNS = {
+    "budgets": ["approved_amount", "actual_spent"],
+    "invoices": ["amount"],
+    "transactions": ["amount", "fraud_flag"],
+}
+
+
+class RiskRuleEngine:
+    """Evaluates declarative risk rules over per-table frames in one pass.
+
+    Frames may hold any number of orgs (organization_id column). Each rule's
+    filter is a vectorized mask; rules sharing a filter share the mask, and
+    aggregate rules sharing a filter share one groupby across all orgs.
+    """
+
+    def __init__(self, rules: Optional[List[Dict]] = None):
+        self.rules = [self._validate(r) for r in (rules or load_rules())]
+
+    @property
+    def tables(self) -> List[str]:
+        """Tables the rules read (the only ones worth loading)"""
+        return sorted({r["table"] for r in self.rules})
+
+    def evaluate(self, frames: Dict[str, pd.DataFrame]) -> Dict[object, List[Dict]]:
+        """{org_id: [fired rule results, most severe first]}"""
+        frames = {t: prepare_frame(t, df) for t, df in frames.items()}
+        masks: Dict[tuple, pd.Series] = {}
+        grouped: Dict[tuple, pd.DataFrame] = {}
+        fired: Dict[object, List[Dict]] = {}
+
+        for rule in self.rules:
+            frame = frames.get(rule["table"])
+            if frame is None or frame.empty:
+                continue
+            try:
+                key = (rule["table"], rule["where"])
+                if key not in masks:
+                    masks[key] = _mask(frame, rule["where"])
+                matched = frame[masks[key]]
+                if matched.empty:
+                    continue
+
+                if rule["kind"] == "row":
+                    columns = ["organization_id", *rule["fields"], *rule["numbers"]]
+                    rows = matched[list(dict.fromkeys(columns))].to_dict("records")
+                    for row in rows:
+                        fired.setdefault(row["organization_id"], []).append(
+                            _result(
+                                rule,
+                                rule["message"].format(**row),
+                                {f: to_plain(row.get(f)) for f in rule["numbers"]},
+                            )
+                        )
+                    continue
+
+                agg_key = key + (json.dumps(rule["aggregate"], sort_keys=True),)
+                if agg_key not in grouped:
+                    grouped[agg_key] = matched.groupby("organization_id").agg(
+                        **{k: tuple(v) for k, v in rule["aggregate"].items()}
+                    )
+                stats = grouped[agg_key]
+                hits = stats[_mask(stats, rule["when"])]
+                for org_id, *values in hits.itertuples(name=None):
+                    numbers = {k: to_plain(v) for k, v in zip(hits.columns, values)}
+                    fired.setdefault(org_id, []).append(
+                        _result(rule, rule["message"].format(**numbers), numbers)
+                    )
+            except Exception as e:
+                print(f"Error evaluating risk rule {rule['id']}: {e}")
+
+        for results in fired.values():
+            results.sort(key=lambda r: SEVERITIES.index(r["severity"]))
+        return fired
+
+    @staticmethod
+    def _validate(rule: Dict) -> Dict:
+        rule = {"kind": "row", "numbers": [], **rule}
+        # Columns the message template reads
+        rule["fields"] = [
+            name.split(".")[0].split("[")[0]
+            for _, name, _, _ in string.Formatter().parse(rule["message"])
+            if name
+        ]
+        if rule["kind"] not in {"row", "aggregate"}:
+            raise ValueError(f"Risk rule {rule.get('id')}: unknown kind {rule['kind']}")
+        if rule["severity"] not in SEVERITIES:
+            raise ValueError(
+                f"Risk rule {rule.get('id')}: unknown severity {rule['severity']}"
+            )
+        if rule["kind"] == "aggregate" and not (
+            rule.get("aggregate") and rule.get("when")
+        ):
+            raise ValueError(f"Risk rule {rule.get('id')}: needs aggregate and when")
+        return rule
+
+
+def load_rules() -> List[Dict]:
+    """Default rules, merged by id with RISK_RULES_PATH (JSON list) if set.
+
+    A rule in the file replaces the default with the same id; set
+    "enabled": false to drop one.
+    """
+    rules = {r["id"]: r for r in DEFAULT_RISK_RULES}
+    path = get_config("RISK_RULES_PATH")
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for rule in json.load(f):
+                rules[rule["id"]] = rule
+    return [r for r in rules.values() if r.get("enabled", True)]
+
+
+def prepare_frame(table: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Numeric coercion and derived columns the rules can reference"""
+    if df is None or df.empty:
+        return pd.DataFrame()
+    df = df.copy()
+    for column in NUMERIC_COLUMNS.get(table, []):
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0.0)
+    if table == "invoices" and "due_date" in df:
+        due = pd.to_datetime(df["due_date"], errors="coerce")
+        df["days_past_due"] = (pd.Timestamp(clock.now().date()) - due).dt.days
+        df["days_past_due"] = df["days_past_due"].fillna(0)
+    return df
+
+
+def risk_frames(
+    data, org_ids: Iterable, tables: Iterable[str]
+) -> Dict[str, pd.DataFrame]:
+    """Frames for the given orgs from an AgentDataContext (one load per table/org)"""
+    loaders = {
+        "budgets": data.budgets,
+        "invoices": data.invoices,
+        "transactions": data.transactions,
+    }
+    return {
+        table: pd.DataFrame(
+            [row for org_id in org_ids for row in loaders[table](org_id)]
+        )
+        for table in tables
+    }
+
+
+def _mask(frame: pd.DataFrame, expression: str) -> pd.Series:
+    mask = frame.eval(expression)
+    if not isinstance(mask, pd.Series):
+        # Constant expressions ("True") evaluate to a scalar
+        mask = pd.Series(bool(mask), index=frame.index)
+    return mask.fillna(False).astype(bool)
+
+
+def _result(rule: Dict, message: str, numbers: Dict) -> Dict:
+    return {
+        "rule": rule["id"],
+        "severity": rule["severity"],
+        "message": message,
+        "numbers": numbers,
+    }
+
+
+_engine: Optional[RiskRuleEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_risk_engine() -> RiskRuleEngine:
+    """Process-wide engine with the configured rules"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RiskRuleEngine()
+        return _engine
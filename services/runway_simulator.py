@@ -0,0 +1,168 @@
+# services/runway_simulator.py
+import hashlib
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from config.enviroment import get_config
+from utils import clock
+
+AGING_BUCKETS = ["current", "1-30", "31-60", "61-90", "90+"]
+
+# Chance an unpaid invoice is ever collected, and the mean days until it is
+# (counted from the due date for current invoices, from today otherwise)
+COLLECTION_PROBABILITY = {
+    "current": 0.95,
+    "1-30": 0.85,
+    "31-60": 0.65,
+    "61-90": 0.45,
+    "90+": 0.2,
+}
+COLLECTION_DELAY_DAYS = {
+    "current": 7,
+    "1-30": 20,
+    "31-60": 35,
+    "61-90": 50,
+    "90+": 75,
+}
+
+DAYS_PER_MONTH = 30
+
+
+def aging_bucket(days_past_due: int) -> str:
+    """Aging bucket label for an invoice this many days past due"""
+    if days_past_due <= 0:
+        return "current"
+    if days_past_due <= 30:
+        return "1-30"
+    if days_past_due <= 60:
+        return "31-60"
+    if days_past_due <= 90:
+        return "61-90"
+    return "90+"
+
+
+def days_past_due(invoice: Dict, today: Optional[date] = None) -> int:
+    today = today or clock.now().date()
+    try:
+        due = datetime.fromisoformat(str(invoice["due_date"])[:10]).date()
+    except (KeyError, ValueError):
+        return 0
+    return (today - due).days
+
+
+def simulation_seed(org_id, daily_outflows: np.ndarray, cash_balance: float) -> int:
+    """Seed derived from the org and its spend history: unchanged data gives
+    the same percentiles, so prompts (and LLM replays) stay stable"""
+    digest = hashlib.sha1(f"{org_id}:{float(cash_balance)}".encode("utf-8"))
+    digest.update(np.asarray(daily_outflows, dtype=np.float64).tobytes())
+    return int.from_bytes(digest.digest()[:8], "big")
+
+
+def simulate_runway(
+    daily_outflows: np.ndarray,
+    invoices: Iterable[Dict],
+    cash_balance: float,
+    n_paths: Optional[int] = None,
+    horizon_days: int = 720,
+    seed: Optional[int] = None,
+    today: Optional[date] = None,
+) -> Dict:
+    """Percentile runway from Monte Carlo cash paths (all paths at once).
+
+    Each path's future spend is a sequence of whole historical weeks drawn
+    with replacement (a block bootstrap, so the weekly pattern carries
+    over), and each unpaid invoice is collected with its aging bucket's
+    probability after a random delay. Runway is the first day the balance
+    goes negative; paths still solvent at the horizon count as horizon_days.
+
+    `daily_outflows` is the history oldest-to-newest ending today (see
+    cashflow_forecast.daily_outflows).
+    """
+    n_paths = int(n_paths or get_config("RUNWAY_SIMULATION_PATHS", "5000"))
+    rng = np.random.default_rng(seed)
+    today = today or clock.now().date()
+    history = np.asarray(daily_outflows, dtype=np.float32)
+    n_weeks = -(-horizon_days // 7)
+
+    # Complete historical weeks; ending today, each starts on tomorrow's weekday
+    weeks = history.size // 7
+    if weeks:
+        blocks = history[history.size - weeks * 7 :].reshape(weeks, 7)
+    else:
+        blocks = np.full((1, 7), history.mean() if history.size else 0.0)
+    blocks = blocks.astype(np.float32)
+    pick = rng.integers(0, len(blocks), (n_paths, n_weeks))
+    flow = blocks.sum(axis=1)[pick]
+
+    income = np.zeros((n_paths, n_weeks), dtype=np.float32)
+    unpaid = [
+        inv
+        for inv in invoices
+        if inv.get("status") != "paid" and float(inv.get("amount") or 0) > 0
+    ]
+    if unpaid:
+        past_due = np.array([days_past_due(inv, today) for inv in unpaid])
+        buckets = [aging_bucket(d) for d in past_due]
+        amounts = np.array([float(inv["amount"]) for inv in unpaid])
+        prob = np.array([COLLECTION_PROBABILITY[b] for b in buckets])
+        delay = np.array([COLLECTION_DELAY_DAYS[b] for b in buckets], dtype=float)
+
+        shape = (n_paths, len(unpaid))
+        day = np.maximum(-past_due, 0) + rng.exponential(delay, shape).astype(int)
+        collected = (rng.random(shape) < prob) & (day < horizon_days)
+        paths = np.broadcast_to(np.arange(n_paths)[:, None], shape)
+        income = np.bincount(
+            (paths * n_weeks + day // 7)[collected],
+            weights=np.broadcast_to(amounts, shape)[collected],
+            minlength=n_paths * n_weeks,
+        ).reshape(n_paths, n_weeks)
+        flow -= income.astype(np.float32)
+
+    # Week-end balances, then the exact day inside the first negative week
+    cash = np.float32(cash_balance) - np.cumsum(flow, axis=1)
+    broke = cash < 0
+    runway_days = np.full(n_paths, horizon_days)
+    hit = np.flatnonzero(broke.any(axis=1))
+    if hit.size:
+        week = broke[hit].argmax(axis=1)
+        opening = np.where(week > 0, cash[hit, week - 1], np.float32(cash_balance))
+        # That week's collections are credited up front (slightly optimistic)
+        daily = opening[:, None] + income[hit, week][:, None]
+        daily = daily - np.cumsum(blocks[pick[hit, week]], axis=1)
+        runway_days[hit] = np.minimum(
+            week * 7 + (daily < 0).argmax(axis=1), horizon_days
+        )
+    p10, p50, p90 = np.percentile(runway_days, [10, 50, 90]) / DAYS_PER_MONTH
+
+    return {
+        "method": "monte-carlo",
+        "paths": n_paths,
+        "horizon_months": round(horizon_days / DAYS_PER_MONTH, 1),
+        "p10_months": round(float(p10), 1),
+        "p50_months": round(float(p50), 1),
+        "p90_months": round(float(p90), 1),
+        "prob_out_of_cash": round(float((runway_days < horizon_days).mean()), 3),
+        "prob_out_of_cash_6m": round(
+            float((runway_days < 6 * DAYS_PER_MONTH).mean()), 3
+        ),
+    }
+
+
+def runway_label(sim: Dict, months: float) -> str:
+    """Months as text, '>N' when the paths outlast the simulated horizon"""
+    if months >= sim["horizon_months"]:
+        return f">{sim['horizon_months']:.0f}"
+    return f"{months:.1f}"
+
+
+def format_runway(sim: Dict) -> str:
+    """'P10 x / P50 y / P90 z months'"""
+    return (
+        " / ".join(
+            f"{p.upper()} {runway_label(sim, sim[p + '_months'])}"
+            for p in ("p10", "p50", "p90")
+        )
+        + " months"
+    )
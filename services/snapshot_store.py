@@ -0,0 +1,118 @@
+# services/snapshot_store.py
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+from supabase import Client
+
+from config.database import get_db
+from config.enviroment import get_config
+
+SNAPSHOT_TABLE = "agent_context_snapshots"
+
+
+class SnapshotStore:
+    """Precomputed per-org agent context (see scripts/build_agent_snapshots.py).
+
+    Rows live in the agent_context_snapshots table
+    (organization_id, computed_at, payload). If the table is unavailable, or
+    SNAPSHOT_STORE=file, they go to <SNAPSHOT_DIR>/<org>.json instead.
+    """
+
+    def __init__(self, db: Optional[Client] = None):
+        self.db: Client = db or get_db()
+        self.use_file = get_config("SNAPSHOT_STORE", "db") == "file"
+        self.dir = Path(get_config("SNAPSHOT_DIR", ".cache/agent_snapshots"))
+        self.max_age = timedelta(
+            hours=float(get_config("SNAPSHOT_MAX_AGE_HOURS", "26"))
+        )
+
+    def load(self, org_id) -> Optional[Dict]:
+        """Snapshot payload for the org, or None if missing or stale"""
+        row = None if self.use_file else self._load_db(org_id)
+        if row is None:
+            row = self._load_file(org_id)
+        if not row:
+            return None
+
+        try:
+            computed_at = datetime.fromisoformat(
+                str(row["computed_at"]).replace("Z", "+00:00")
+            ).replace(tzinfo=None)
+        except (KeyError, ValueError):
+            return None
+        if datetime.utcnow() - computed_at > self.max_age:
+            return None
+
+        payload = row.get("payload")
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        return payload
+
+    def save(self, org_id, payload: Dict) -> str:
+        """Persist a snapshot; returns where it was written ("db" or "file")"""
+        row = {
+            "organization_id": org_id,
+            "computed_at": datetime.utcnow().isoformat(),
+            "payload": json.loads(json.dumps(payload, default=_json_default)),
+        }
+        if not self.use_file:
+            try:
+                self.db.table(SNAPSHOT_TABLE).upsert(
+                    row, on_conflict="organization_id"
+                ).execute()
+                return "db"
+            except Exception as e:
+                print(f"Error saving snapshot to {SNAPSHOT_TABLE}, using file: {e}")
+
+        self.dir.mkdir(parents=True, exist_ok=True)
+        (self.dir / f"{org_id}.json").write_text(json.dumps(row), encoding="utf-8")
+        return "file"
+
+    def invalidate(self, org_id) -> None:
+        """Drop the org's snapshot; agents compute live until the next build"""
+        if not self.use_file:
+            try:
+                self.db.table(SNAPSHOT_TABLE).delete().eq(
+                    "organization_id", org_id
+                ).execute()
+            except Exception as e:
+                print(f"Error deleting snapshot from {SNAPSHOT_TABLE}: {e}")
+        (self.dir / f"{org_id}.json").unlink(missing_ok=True)
+
+    def _load_db(self, org_id) -> Optional[Dict]:
+        try:
+            res = (
+                self.db.table(SNAPSHOT_TABLE)
+                .select("*")
+                .eq("organization_id", org_id)
+                .limit(1)
+                .execute()
+            )
+            return res.data[0] if res.data else None
+        except Exception:
+            return None
+
+    def _load_file(self, org_id) -> Optional[Dict]:
+        path = self.dir / f"{org_id}.json"
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"Error reading snapshot file {path}: {e}")
+            return None
+
+
+def invalidate_snapshot(org_id, db: Optional[Client] = None) -> None:
+    """Write hook: the org's data changed, so its snapshot is out of date"""
+    if org_id:
+        SnapshotStore(db).invalidate(org_id)
+
+
+def _json_default(value):
+    # numpy / pandas scalars
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
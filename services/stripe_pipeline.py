@@ -0,0 +1,214 @@
+# services/stripe_pipeline.py
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config.enviroment import get_config
+from services.stripe_scheduler import stripe_lane
+
+# End-of-stream marker passed between stages
+_DONE = object()
+
+
+class _Depth:
+    """Max/mean depth of a queue, sampled on every put"""
+
+    def __init__(self, q: queue.Queue):
+        self.q = q
+        self.max = 0
+        self.total = 0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def put(self, item) -> None:
+        self.q.put(item)
+        depth = self.q.qsize()
+        with self._lock:
+            self.max = max(self.max, depth)
+            self.total += depth
+            self.samples += 1
+
+    def summary(self) -> Dict:
+        return {
+            "max": self.max,
+            "mean": round(self.total / self.samples, 1) if self.samples else 0,
+            "capacity": self.q.maxsize,
+        }
+
+
+class StripeSyncPipeline:
+    """Producer/consumer Stripe -> transactions sync for one org.
+
+    One paginator thread per object type feeds a bounded queue of raw
+    objects. Normalizer threads turn them into transaction rows on a second
+    bounded queue. A single writer upserts them in chunks via
+    StripeService._upsert_transactions. Stripe paging, normalization and
+    database writes overlap. The bounded queues hold paginators back when
+    writes fall behind.
+    """
+
+    def __init__(
+        self,
+        service,
+        organization_id,
+        normalizers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+    ):
+        self.service = service
+        self.organization_id = organization_id
+        self.normalizers = int(
+            normalizers or get_config("STRIPE_PIPELINE_NORMALIZERS", "2")
+        )
+        size = int(queue_size or get_config("STRIPE_PIPELINE_QUEUE_SIZE", "1000"))
+        self.raw = _Depth(queue.Queue(maxsize=size))
+        self.rows = _Depth(queue.Queue(maxsize=size))
+
+    def run(self, sources: List[Dict]) -> Dict:
+        """Sync every source concurrently; returns per-type counts and metrics.
+
+        A source is {"object_type", "resource" (e.g. stripe.Charge),
+        "normalize" (obj, org_id) -> row, "params" for resource.list, and
+        optional "skip_ids"}. Each type reports the newest created timestamp
+        and the ids in that second, for incremental cursors.
+        """
+        started = time.time()
+        self.stats = {
+            s["object_type"]: {
+                "fetched": 0,
+                "written": 0,
+                "failed": 0,
+                "errors": [],
+                "fetch_seconds": 0.0,
+                "newest": None,
+            }
+            for s in sources
+        }
+        self.write_seconds = 0.0
+
+        producers = [
+            threading.Thread(target=self._paginate, args=(s,), daemon=True)
+            for s in sources
+        ]
+        normalizers = [
+            threading.Thread(target=self._normalize, daemon=True)
+            for _ in range(self.normalizers)
+        ]
+        writer = threading.Thread(target=self._write, daemon=True)
+        for t in producers + normalizers + [writer]:
+            t.start()
+
+        for t in producers:
+            t.join()
+        for _ in normalizers:
+            self.raw.put(_DONE)
+        for t in normalizers:
+            t.join()
+        self.rows.put(_DONE)
+        writer.join()
+
+        elapsed = time.time() - started
+        written = sum(s["written"] for s in self.stats.values())
+        fetch_seconds = sum(s["fetch_seconds"] for s in self.stats.values())
+        return {
+            "by_object": self.stats,
+            "written": written,
+            "failed": sum(s["failed"] for s in self.stats.values()),
+            "errors": [e for s in self.stats.values() for e in s["errors"]],
+            "metrics": {
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(written / elapsed, 1) if elapsed else 0,
+                "fetch_seconds": round(fetch_seconds, 3),
+                "write_seconds": round(self.write_seconds, 3),
+                # > 1 means Stripe paging and DB writes overlapped
+                "overlap": (
+                    round((fetch_seconds + self.write_seconds) / elapsed, 2)
+                    if elapsed
+                    else 0
+                ),
+                "raw_queue": self.raw.summary(),
+                "row_queue": self.rows.summary(),
+            },
+        }
+
+    # ---------------- Stages ----------------
+    def _paginate(self, source: Dict) -> None:
+        stats = self.stats[source["object_type"]]
+        skip = set(source.get("skip_ids") or [])
+        started = time.time()
+        waited = 0.0
+        # Sync yields to interactive Stripe calls (payouts) under the rate limit
+        try:
+            with stripe_lane("background"):
+                pages = source["resource"].list(**source["params"]).auto_paging_iter()
+                for obj in pages:
+                    if obj.id in skip:
+                        continue
+                    stats["fetched"] += 1
+                    newest = stats["newest"]
+                    if newest is None or obj.created > newest["last_created"]:
+                        stats["newest"] = {
+                            "last_created": obj.created,
+                            "last_ids": [obj.id],
+                        }
+                    elif obj.created == newest["last_created"]:
+                        newest["last_ids"] = sorted(set(newest["last_ids"]) | {obj.id})
+                    put_at = time.time()
+                    self.raw.put((source["object_type"], source["normalize"], obj))
+                    waited += time.time() - put_at
+        except Exception as e:
+            print(f"Error paging Stripe {source['object_type']}s: {e}")
+            stats["errors"].append(str(e))
+        finally:
+            # Time blocked on a full queue is backpressure, not fetching
+            stats["fetch_seconds"] = time.time() - started - waited
+
+    def _normalize(self) -> None:
+        while True:
+            item = self.raw.q.get()
+            if item is _DONE:
+                return
+            object_type, normalize, obj = item
+            row = normalize(obj, self.organization_id)
+            if row:
+                self.rows.put((object_type, row))
+
+    def _write(self) -> None:
+        batch: List = []
+        while True:
+            try:
+                item = self.rows.q.get(timeout=0.5)
+            except queue.Empty:
+                # Stripe is the bottleneck; write what we have meanwhile
+                self._flush(batch)
+                batch = []
+                continue
+            if item is _DONE:
+                self._flush(batch)
+                return
+            batch.append(item)
+            if len(batch) >= self.service.chunk_size:
+                self._flush(batch)
+                batch = []
+
+    def _flush(self, batch: List) -> None:
+        if not batch:
+            return
+        started = time.time()
+        result = self.service._upsert_transactions([row for _, row in batch])
+        self.write_seconds += time.time() - started
+
+        # Attribute the outcome to each entry's object type. A charge and its
+        # balance transaction share a transaction_id (merged into one row),
+        # so count entries rather than ids.
+        failed = set(result["failed_ids"])
+        failed_types = set()
+        for object_type, row in batch:
+            if row["transaction_id"] in failed:
+                self.stats[object_type]["failed"] += 1
+                failed_types.add(object_type)
+            else:
+                self.stats[object_type]["written"] += 1
+        for error in result["errors"]:
+            for object_type in failed_types:
+                self.stats[object_type]["errors"].append(error)
@@ -0,0 +1,253 @@
+# services/stripe_scheduler.py
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Dict, Mapping, Optional
+from urllib.parse import urlsplit
+
+import stripe
+
+from config.enviroment import get_config
+
+# Priority lanes, lower goes first
+LANES = {"interactive": 0, "background": 1}
+
+# Stripe's per-account limits (requests/second) by key mode
+STRIPE_LIVE_RATE = 100.0
+STRIPE_TEST_RATE = 25.0
+
+# Calls outside stripe_lane() are user-facing (payouts, account checks)
+_lane: contextvars.ContextVar = contextvars.ContextVar(
+    "stripe_lane", default="interactive"
+)
+
+
+@contextlib.contextmanager
+def stripe_lane(lane: str):
+    """Run the Stripe calls in this block (this thread) in the given lane"""
+    if lane not in LANES:
+        raise ValueError(f"Unknown Stripe lane: {lane}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+class _Bucket:
+    """Token bucket for one API key, with its waiters and counters"""
+
+    def __init__(self, rate: float, burst: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters: list = []
+        self.requests = 0
+        self.throttled = 0
+        self.waited = {lane: 0.0 for lane in LANES}
+
+    def refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+
+class StripeRateScheduler:
+    """Shared Stripe request scheduler: one token bucket per API key.
+
+    Each bucket refills at STRIPE_RATE_HEADROOM (default 90%) of Stripe's
+    limit for the key's mode (100/s live, 25/s test), or at
+    STRIPE_RATE_LIMIT if set. Queued requests take tokens in lane order, so
+    interactive calls go ahead of background sync. A 429 pauses the key for
+    Retry-After (or an exponential backoff) and cuts its rate. The rate then
+    recovers with each success, so sustained throughput settles just under
+    the limit.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ):
+        self.rate = float(rate or get_config("STRIPE_RATE_LIMIT", "0"))
+        self.headroom = float(get_config("STRIPE_RATE_HEADROOM", "0.9"))
+        self.burst = float(burst or get_config("STRIPE_RATE_BURST", "0"))
+        self.max_retries = int(
+            max_retries
+            if max_retries is not None
+            else get_config("STRIPE_429_MAX_RETRIES", "5")
+        )
+        self.backoff_base = float(get_config("STRIPE_429_BACKOFF_SECONDS", "1"))
+        self._buckets: Dict[str, _Bucket] = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def acquire(self, api_key: str, lane: Optional[str] = None) -> float:
+        """Block until the key may send a request; returns seconds waited"""
+        lane = lane or _lane.get()
+        started = time.monotonic()
+        with self._cond:
+            bucket = self._bucket(api_key)
+            ticket = (LANES[lane], next(self._seq))
+            heapq.heappush(bucket.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    timeout = None
+                    if bucket.waiters[0] == ticket:
+                        if now < bucket.paused_until:
+                            timeout = bucket.paused_until - now
+                        elif bucket.tokens >= 1:
+                            bucket.tokens -= 1
+                            break
+                        else:
+                            timeout = (1 - bucket.tokens) / bucket.rate
+                    self._cond.wait(timeout)
+            finally:
+                bucket.waiters.remove(ticket)
+                heapq.heapify(bucket.waiters)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            bucket.requests += 1
+            bucket.waited[lane] += waited
+        return waited
+
+    def throttled(
+        self, api_key: str, retry_after: Optional[float], attempt: int
+    ) -> float:
+        """Stripe answered 429: pause the key and slow it down; returns the pause"""
+        if retry_after is None:
+            delay = self.backoff_base * 2**attempt
+            delay *= 0.5 + random.random() / 2
+        else:
+            delay = retry_after
+        with self._cond:
+            bucket = self._bucket(api_key)
+            now = time.monotonic()
+            bucket.refill(now)
+            bucket.paused_until = max(bucket.paused_until, now + delay)
+            # Nothing accrues while paused
+            bucket.tokens = 0.0
+            bucket.updated = bucket.paused_until
+            bucket.rate = max(1.0, bucket.rate * 0.75)
+            bucket.throttled += 1
+            self._cond.notify_all()
+        return delay
+
+    def succeeded(self, api_key: str) -> None:
+        """A request got through; win back rate lost to 429s"""
+        with self._cond:
+            bucket = self._bucket(api_key)
+            if bucket.rate < bucket.max_rate:
+                bucket.refill(time.monotonic())
+                # About +1 request/second per second of successes
+                bucket.rate = min(bucket.max_rate, bucket.rate + 1 / bucket.rate)
+
+    def stats(self) -> Dict:
+        """Per-key counters, keys masked"""
+        with self._cond:
+            return {
+                _mask_key(key): {
+                    "requests": b.requests,
+                    "throttled": b.throttled,
+                    "rate": round(b.rate, 2),
+                    "max_rate": round(b.max_rate, 2),
+                    "waited_seconds": {k: round(v, 3) for k, v in b.waited.items()},
+                }
+                for key, b in self._buckets.items()
+            }
+
+    def _bucket(self, api_key: str) -> _Bucket:
+        bucket = self._buckets.get(api_key)
+        if bucket is None:
+            rate = self.rate or self.headroom * (
+                STRIPE_TEST_RATE if "_test_" in (api_key or "") else STRIPE_LIVE_RATE
+            )
+            bucket = _Bucket(rate, self.burst or max(1.0, rate / 10))
+            self._buckets[api_key] = bucket
+        return bucket
+
+
+class ScheduledHTTPClient(stripe.RequestsClient):
+    """Stripe HTTP client that sends every request through the scheduler"""
+
+    def __init__(self, scheduler: StripeRateScheduler, **kwargs):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+
+    def request(self, method, url, headers, post_data=None):
+        api_key = _api_key(headers)
+        attempt = 0
+        while True:
+            self.scheduler.acquire(api_key)
+            response = super().request(method, url, headers, post_data)
+            _, status, rheaders = response
+            if status != 429:
+                self.scheduler.succeeded(api_key)
+                return response
+            if attempt >= self.scheduler.max_retries:
+                # Surfaces as stripe.error.RateLimitError
+                return response
+            delay = self.scheduler.throttled(api_key, _retry_after(rheaders), attempt)
+            print(
+                f"Stripe rate limited {method.upper()} {urlsplit(url).path}, "
+                f"retrying in {delay:.2f}s"
+            )
+            attempt += 1
+
+
+def _api_key(headers: Optional[Mapping[str, str]]) -> str:
+    auth = (headers or {}).get("Authorization") or ""
+    return auth[7:] if auth.startswith("Bearer ") else auth
+
+
+def _retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    if not headers:
+        return None
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        # HTTP-date form; fall back to backoff
+        return None
+
+
+def _mask_key(api_key: str) -> str:
+    return f"{api_key[:8]}...{api_key[-4:]}" if len(api_key) > 12 else "***"
+
+
+_scheduler: Optional[StripeRateScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_stripe_scheduler() -> StripeRateScheduler:
+    """Process-wide scheduler, installed as the Stripe SDK's HTTP client.
+
+    Set STRIPE_SCHEDULER_ENABLED=0 to leave the SDK's default client alone.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = StripeRateScheduler()
+            if get_config("STRIPE_SCHEDULER_ENABLED", "1") not in {
+                "0",
+                "false",
+                "False",
+            }:
+                stripe.default_http_client = ScheduledHTTPClient(
+                    _scheduler,
+                    verify_ssl_certs=stripe.verify_ssl_certs,
+                    proxy=stripe.proxy,
+                )
+        return _scheduler
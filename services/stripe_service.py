@@ -8,6 +8,31 @@ from config.database import get_db
 from supabase import Client
 
 from config.enviroment import get_config
+from services.alert_pipeline import get_alert_pipeline
+from services.quick_answers import invalidate_quick_answers
+from services.snapshot_store import invalidate_snapshot
+from services.stripe_pipeline import StripeSyncPipeline
+from services.stripe_scheduler import get_stripe_scheduler, stripe_lane
+from services.stripe_sync_state import SyncStateStore
+
+# transactions columns older installations may lack; dropped from upserts
+# once the database reports them missing
+OPTIONAL_TX_COLUMNS = ("project_id", "fee", "net", "balance_transaction_id")
+
+# Balance transaction types already written as their own rows elsewhere
+# (transfer_only writes transfers)
+SKIP_BALANCE_TX_TYPES = {"transfer"}
+
+# Balance transaction types that reverse or correct income rather than spend
+# money, and the category their rows get (spend aggregates exclude these; see
+# cashflow_forecast.NON_SPEND_CATEGORIES)
+INCOME_REVERSAL_CATEGORIES = {
+    "refund": "refund",
+    "payment_refund": "refund",
+    "payment_failure_refund": "refund",
+    "refund_failure": "refund",
+    "adjustment": "adjustment",
+}
 
 
 class StripeService:
@@ -23,38 +48,258 @@ class StripeService:
         if not api_key:
             raise ValueError("Missing STRIPE_API_KEY/STRIPE_SECRET_KEY in environment")
         stripe.api_key = api_key
+        # e.g. http://localhost:12111 for scripts/stripe_stub_server.py
+        api_base = get_config("STRIPE_API_BASE")
+        if api_base:
+            stripe.api_base = api_base
+        # Throttles every SDK request per API key (shared across instances)
+        self.scheduler = get_stripe_scheduler()
         self.db: Client = get_db()
         # optional feature flags
         self.enabled = get_config("STRIPE_ENABLED", "1") not in {"0", "false", "False"}
         self.dry_run = get_config("STRIPE_DRY_RUN", "0") in {"1", "true", "True"}
+        # Rows per bulk upsert request
+        self.chunk_size = int(get_config("STRIPE_UPSERT_CHUNK_SIZE", "500"))
+        # OPTIONAL_TX_COLUMNS the transactions table turned out not to have
+        self._missing_columns = set()
 
     # ------------- Public sync API -------------
     def sync_recent(self, organization_id: str, days: int = 7) -> Dict:
-        """Fetch recent charges and payouts and upsert into transactions."""
+        """Fetch recent charges, payouts and balance transactions into transactions."""
         try:
-            now = int(datetime.utcnow().timestamp())
-            since = now - days * 24 * 3600
-
-            charges = stripe.Charge.list(created={"gte": since}, limit=100)
-            payouts = stripe.Payout.list(created={"gte": since}, limit=100)
-
-            count = 0
-            for ch in charges.auto_paging_iter():
-                tx = self._charge_to_tx(ch, organization_id)
-                if tx:
-                    self._upsert_transaction(tx)
-                    count += 1
-
-            for po in payouts.auto_paging_iter():
-                tx = self._payout_to_tx(po, organization_id)
-                if tx:
-                    self._upsert_transaction(tx)
-                    count += 1
+            since = int(datetime.utcnow().timestamp()) - days * 24 * 3600
+            sources = [
+                {
+                    "object_type": object_type,
+                    "resource": spec["resource"],
+                    "normalize": spec["normalize"],
+                    "params": {
+                        "created": {"gte": since},
+                        "limit": 100,
+                        **spec["params"],
+                    },
+                }
+                for object_type, spec in self._sync_objects().items()
+            ]
+            run = StripeSyncPipeline(self, organization_id).run(sources)
+            result = {
+                "success": not run["errors"],
+                "synced": run["written"],
+                "failed": run["failed"],
+                "metrics": run["metrics"],
+            }
+            if run["errors"]:
+                result["error"] = "; ".join(run["errors"])
+            return result
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
-            return {"success": True, "synced": count}
+    def sync_incremental(
+        self,
+        organization_id: str,
+        initial_days: Optional[int] = None,
+        recheck_days: Optional[int] = None,
+        stripe_account: Optional[str] = None,
+        owned_only: bool = False,
+    ) -> Dict:
+        """Fetch only objects created since the org's saved cursor, per type.
+
+        The first run (no cursor) backfills initial_days (SYNC_DAYS). Objects
+        from the last recheck_days (STRIPE_RECHECK_DAYS) that are older than
+        the cursor are re-listed, and only rows whose status changed are
+        written. That catches late refunds and payout settlement.
+        stripe_account lists a connected account's objects instead of the
+        platform's. With owned_only, objects are kept only when their
+        metadata.organization_id (the source's, for balance transactions) is
+        this org, for orgs sharing one Stripe account.
+        """
+        try:
+            initial_days = int(initial_days or get_config("SYNC_DAYS", "7"))
+            recheck_days = int(
+                recheck_days
+                if recheck_days is not None
+                else get_config("STRIPE_RECHECK_DAYS", "3")
+            )
+            state = SyncStateStore(self.db)
+            now = int(datetime.utcnow().timestamp())
+            objects = self._sync_objects()
+            account = {"stripe_account": stripe_account} if stripe_account else {}
+
+            # New objects for every type, paged concurrently
+            cursors, sources = {}, []
+            if owned_only:
+                for spec in objects.values():
+                    spec["normalize"] = self._owned(spec["normalize"])
+            for object_type, spec in objects.items():
+                cursor = state.load(organization_id, object_type)
+                cursors[object_type] = cursor
+                sources.append(
+                    {
+                        "object_type": object_type,
+                        "resource": spec["resource"],
+                        "normalize": spec["normalize"],
+                        "params": {
+                            "created": {
+                                "gte": (
+                                    cursor["last_created"]
+                                    if cursor
+                                    else now - initial_days * 86400
+                                )
+                            },
+                            "limit": 100,
+                            **spec["params"],
+                            **account,
+                        },
+                        "skip_ids": (cursor or {}).get("last_ids"),
+                    }
+                )
+            run = StripeSyncPipeline(self, organization_id).run(sources)
+
+            result = {
+                "success": not run["errors"],
+                "synced": 0,
+                "updated": 0,
+                "failed": 0,
+                "by_object": {},
+                "metrics": run["metrics"],
+            }
+            if run["errors"]:
+                result["error"] = "; ".join(run["errors"])
+            for object_type, spec in objects.items():
+                stats, cursor = run["by_object"][object_type], cursors[object_type]
+                updated = 0
+                if cursor and recheck_days > 0 and spec["recheck"]:
+                    updated = self._recheck(
+                        spec["resource"],
+                        spec["normalize"],
+                        organization_id,
+                        since=now - recheck_days * 86400,
+                        until=cursor["last_created"],
+                        params=account,
+                    )
+                # Keep the old cursor if anything failed, so the next run retries it
+                if not stats["failed"] and not stats["errors"]:
+                    new_cursor = self._advance_cursor(
+                        cursor or {"last_created": now - initial_days * 86400},
+                        stats["newest"],
+                    )
+                    if new_cursor != cursor:
+                        state.save(organization_id, object_type, new_cursor)
+
+                result["synced"] += stats["written"]
+                result["updated"] += updated
+                result["failed"] += stats["failed"]
+                result["by_object"][object_type] = {
+                    "synced": stats["written"],
+                    "updated": updated,
+                    "failed": stats["failed"],
+                }
+            return result
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _sync_objects(self) -> Dict:
+        """Synced Stripe object types: list resource, normalizer, extra list
+        params, and whether statuses can change later (re-check window)"""
+        objects = {
+            "charge": {
+                "resource": stripe.Charge,
+                "normalize": self._charge_to_tx,
+                "params": {},
+                "recheck": True,
+            },
+            "payout": {
+                "resource": stripe.Payout,
+                "normalize": self._payout_to_tx,
+                "params": {},
+                "recheck": True,
+            },
+        }
+        if get_config("STRIPE_SYNC_BALANCE_TRANSACTIONS", "1") not in {
+            "0",
+            "false",
+            "False",
+        }:
+            objects["balance_transaction"] = {
+                "resource": stripe.BalanceTransaction,
+                "normalize": self._balance_tx_to_tx,
+                # Source charges/payouts come back inline with each page
+                "params": {"expand": ["data.source"]},
+                "recheck": False,
+            }
+        return objects
+
+    @staticmethod
+    def _owned(normalize):
+        """Normalizer that drops objects tagged for another org (or untagged)"""
+
+        def owned(obj, organization_id):
+            tagged = obj
+            if getattr(obj, "object", None) == "balance_transaction":
+                source = getattr(obj, "source", None)
+                tagged = None if isinstance(source, str) else source
+            meta = getattr(tagged, "metadata", None) or {}
+            if str(meta.get("organization_id")) != str(organization_id):
+                return None
+            return normalize(obj, organization_id)
+
+        return owned
+
+    @staticmethod
+    def _advance_cursor(cursor: Dict, newest: Optional[Dict]) -> Dict:
+        """Cursor after a sync that saw `newest` (ids in its newest second)"""
+        cursor = {"last_ids": [], **cursor}
+        if not newest or newest["last_created"] < cursor["last_created"]:
+            return cursor
+        if newest["last_created"] > cursor["last_created"]:
+            return newest
+        # Same second as before: remember both sets of ids
+        return {
+            "last_created": cursor["last_created"],
+            "last_ids": sorted(set(cursor["last_ids"]) | set(newest["last_ids"])),
+        }
+
+    def _recheck(
+        self,
+        resource,
+        normalize,
+        organization_id,
+        since,
+        until,
+        params: Optional[Dict] = None,
+    ) -> int:
+        """Write objects in [since, until] whose status differs from the stored row"""
+        if since > until:
+            return 0
+        fresh = {}
+        with stripe_lane("background"):
+            for obj in resource.list(
+                created={"gte": since, "lte": until}, limit=100, **(params or {})
+            ).auto_paging_iter():
+                tx = normalize(obj, organization_id)
+                if tx:
+                    fresh[tx["transaction_id"]] = tx
+        if not fresh:
+            return 0
+
+        stored = {}
+        ids = list(fresh)
+        # Chunked so the id filter stays within URL limits
+        for i in range(0, len(ids), 200):
+            rows = (
+                self.db.table("transactions")
+                .select("transaction_id,status")
+                .eq("organization_id", organization_id)
+                .in_("transaction_id", ids[i : i + 200])
+                .execute()
+                .data
+                or []
+            )
+            stored.update({r["transaction_id"]: r.get("status") for r in rows})
+        changed = [tx for tid, tx in fresh.items() if stored.get(tid) != tx["status"]]
+        # Known rows re-synced for a status change: update alert totals only
+        return self._upsert_transactions(changed, evaluate_alerts=False)["written"]
+
     # ------------- Connected accounts (Create/Onboard) -------------
     def create_connected_account(
         self,
@@ -313,6 +558,9 @@ class StripeService:
                 self.db.table("transactions").upsert(
                     data2, on_conflict="transaction_id"
                 ).execute()
+            get_alert_pipeline().on_transaction(tx_row)
+            invalidate_quick_answers(tx_row.get("organization_id"))
+            invalidate_snapshot(tx_row.get("organization_id"), self.db)
 
             return {"success": True, "transfer_id": transfer_id, "status": status}
         except Exception as e:
@@ -430,6 +678,9 @@ class StripeService:
                 self.db.table("transactions").upsert(
                     data2, on_conflict="transaction_id"
                 ).execute()
+            get_alert_pipeline().on_transaction(tx_row)
+            invalidate_quick_answers(tx_row.get("organization_id"))
+            invalidate_snapshot(tx_row.get("organization_id"), self.db)
 
             return {
                 "success": True,
@@ -447,6 +698,9 @@ class StripeService:
             currency = ch.currency.upper() if ch.currency else "USD"
             status = ch.status or "succeeded"
             category = "income" if status == "succeeded" else "pending"
+            if getattr(ch, "refunded", False):
+                # Same status the charge.refunded webhook writes
+                status = "refunded"
             project_id = None
             # Try derive project from metadata
             meta = getattr(ch, "metadata", {}) or {}
@@ -507,18 +761,137 @@ class StripeService:
         except Exception:
             return None
 
-    # ------------- Storage helpers -------------
-    def _upsert_transaction(self, tx: Dict) -> None:
-        # Ensure transactions table has columns; insert or update by transaction_id
-        # Add project_id column support dynamically if exists in table
-        data = tx.copy()
-        # Some installations may not yet have project_id column in transactions; try insert with it, fallback without
+    def _balance_tx_to_tx(
+        self, bt: stripe.BalanceTransaction, organization_id: str
+    ) -> Optional[Dict]:
+        """Fee and net for a balance transaction, on its source's row.
+
+        Charges and payouts (expanded inline as bt.source) get their usual
+        row plus fee/net, so the upsert merges into the existing row. Other
+        types (Stripe fees, refunds, adjustments) get a row of their own, with
+        money leaving the balance as a positive amount like any expense and
+        money coming in as "income". Refunds and adjustments keep that sign
+        but are categorized so they never count as spend.
+        """
         try:
-            self.db.table("transactions").upsert(
-                data, on_conflict="transaction_id"
-            ).execute()
+            if bt.type in SKIP_BALANCE_TX_TYPES:
+                return None
+            source = getattr(bt, "source", None)
+            source_type = (
+                None if isinstance(source, str) else getattr(source, "object", None)
+            )
+            if source_type == "charge":
+                tx = self._charge_to_tx(source, organization_id)
+            elif source_type == "payout":
+                tx = self._payout_to_tx(source, organization_id)
+            else:
+                # Stripe signs amounts from the balance's side: negative = out
+                amount = -(bt.amount or 0) / 100.0
+                category = INCOME_REVERSAL_CATEGORIES.get(bt.type) or (
+                    bt.type if amount > 0 else "income"
+                )
+                tx = {
+                    "transaction_id": bt.id,
+                    "amount": amount if category != "income" else -amount,
+                    "date": datetime.fromtimestamp(bt.created).date().isoformat(),
+                    "category": category,
+                    "merchant": "Stripe",
+                    "employee_id": None,
+                    "fraud_flag": 0,
+                    "description": bt.description or f"Stripe {bt.type}",
+                    "payment_method": "stripe_balance",
+                    "currency": bt.currency.upper() if bt.currency else "USD",
+                    "status": bt.status,
+                    "approval_required": 0,
+                    "organization_id": organization_id,
+                    "created_by": None,
+                    "project_id": None,
+                }
+            if not tx:
+                return None
+            tx.update(
+                {
+                    "fee": (bt.fee or 0) / 100.0,
+                    "net": (bt.net or 0) / 100.0,
+                    "balance_transaction_id": bt.id,
+                }
+            )
+            return tx
         except Exception:
-            data.pop("project_id", None)
-            self.db.table("transactions").upsert(
-                data, on_conflict="transaction_id"
-            ).execute()
+            return None
+
+    # ------------- Storage helpers -------------
+    def _upsert_transaction(self, tx: Dict) -> None:
+        # Insert or update by transaction_id
+        written = self._upsert_transactions([tx])
+        if written["failed"]:
+            raise RuntimeError(written["errors"][0])
+
+    def _upsert_transactions(
+        self, rows: List[Dict], evaluate_alerts: bool = True
+    ) -> Dict:
+        """Bulk upsert by transaction_id in chunks of STRIPE_UPSERT_CHUNK_SIZE.
+
+        A failing chunk is reported and skipped; the other chunks still land.
+        The written rows reach the alert pipeline as one batch.
+        Returns {written, failed, failed_ids, errors}.
+        """
+        # One row per transaction_id (Postgres rejects touching a row twice);
+        # a charge row and its balance transaction's fee/net merge into one
+        merged: Dict[str, Dict] = {}
+        for tx in rows:
+            tid = tx["transaction_id"]
+            merged[tid] = {**merged.get(tid, {}), **tx}
+        unique = list(merged.values())
+        result = {"written": 0, "failed": 0, "failed_ids": [], "errors": []}
+        written: List[Dict] = []
+        for i in range(0, len(unique), self.chunk_size):
+            chunk = unique[i : i + self.chunk_size]
+            try:
+                self._upsert_chunk(chunk)
+            except Exception as e:
+                print(f"Error upserting {len(chunk)} transactions: {e}")
+                result["failed"] += len(chunk)
+                result["failed_ids"] += [tx["transaction_id"] for tx in chunk]
+                result["errors"].append(str(e))
+                continue
+            result["written"] += len(chunk)
+            written += chunk
+            for org_id in {tx.get("organization_id") for tx in chunk}:
+                invalidate_quick_answers(org_id)
+                invalidate_snapshot(org_id, self.db)
+        get_alert_pipeline().on_transactions(written, evaluate=evaluate_alerts)
+        return result
+
+    def _upsert_chunk(self, chunk: List[Dict]) -> None:
+        # A bulk upsert needs the same keys on every row, so group by key set
+        groups: Dict[tuple, List[Dict]] = {}
+        for tx in chunk:
+            groups.setdefault(tuple(sorted(tx)), []).append(tx)
+        for group in groups.values():
+            self._upsert_group(group)
+
+    def _upsert_group(self, rows: List[Dict]) -> None:
+        # Some installations lack newer columns (project_id, fee, ...); drop
+        # each one for the rest of the sync the first time it is reported
+        while True:
+            data = [
+                {k: v for k, v in tx.items() if k not in self._missing_columns}
+                for tx in rows
+            ]
+            try:
+                self.db.table("transactions").upsert(
+                    data, on_conflict="transaction_id"
+                ).execute()
+                return
+            except Exception as e:
+                # PostgREST/Postgres quote the missing column's name
+                missing = [
+                    c
+                    for c in OPTIONAL_TX_COLUMNS
+                    if c not in self._missing_columns
+                    and (f"'{c}'" in str(e) or f'"{c}"' in str(e))
+                ]
+                if not missing:
+                    raise
+                self._missing_columns.update(missing)
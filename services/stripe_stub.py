@@ -0,0 +1,365 @@
+# services/stripe_stub.py
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from config.enviroment import get_config
+
+CARD_BRANDS = ["visa", "mastercard", "amex", "discover"]
+
+
+class StripeStub:
+    """Generated Stripe data for the endpoints StripeService calls.
+
+    Charges, payouts and balance transactions are never stored: object i of
+    each type is derived from its index, newest first, spread evenly over
+    the last `days` before the stub started. Listing is a binary search on
+    `created`, so millions of objects cost no memory and every page is as
+    cheap as the first. Transfers and payouts created through the API are
+    kept in memory (replayed by Idempotency-Key).
+    """
+
+    def __init__(
+        self,
+        charges: Optional[int] = None,
+        payouts: Optional[int] = None,
+        days: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.counts = {
+            "charge": int(charges or get_config("STRIPE_STUB_CHARGES", "10000")),
+            "payout": int(payouts or get_config("STRIPE_STUB_PAYOUTS", "500")),
+        }
+        self.counts["balance_transaction"] = (
+            self.counts["charge"] + self.counts["payout"]
+        )
+        self.days = int(days or get_config("STRIPE_STUB_DAYS", "30"))
+        self.seed = int(seed or get_config("STRIPE_STUB_SEED", "7"))
+        self.now = int(time.time())
+        self.created_objects: Dict[str, Dict] = {}
+        self.idempotent: Dict[tuple, Dict] = {}
+        self._lock = threading.Lock()
+
+    # ---------------- Generated objects ----------------
+    def created(self, object_type: str, i: int) -> int:
+        return self.now - (i * self.days * 86400) // max(1, self.counts[object_type])
+
+    def charge(self, i: int) -> Dict:
+        rng = random.Random(self.seed * 1_000_003 + i)
+        refunded = rng.random() < 0.02
+        return {
+            "id": f"ch_stub{i:010d}",
+            "object": "charge",
+            "amount": rng.randint(500, 500_000),
+            "currency": "usd",
+            "created": self.created("charge", i),
+            "status": "failed" if rng.random() < 0.01 else "succeeded",
+            "refunded": refunded,
+            "description": f"Stub charge {i}",
+            "metadata": {},
+            "payment_method_details": {
+                "type": "card",
+                "card": {"brand": rng.choice(CARD_BRANDS)},
+            },
+            "fraud_details": (
+                {"stripe_report": "fraudulent"} if rng.random() < 0.002 else {}
+            ),
+        }
+
+    def payout(self, i: int) -> Dict:
+        rng = random.Random(self.seed * 2_000_003 + i)
+        # Recent payouts are still in transit
+        recent = i < max(1, self.counts["payout"] // 100)
+        return {
+            "id": f"po_stub{i:010d}",
+            "object": "payout",
+            "amount": rng.randint(10_000, 5_000_000),
+            "currency": "usd",
+            "created": self.created("payout", i),
+            "status": "in_transit" if recent else "paid",
+            "metadata": {},
+        }
+
+    def balance_transaction(self, k: int, expand_source: bool = False) -> Dict:
+        # Charges and payouts interleaved in proportion to their counts
+        total = self.counts["balance_transaction"]
+        payouts = self.counts["payout"]
+        p = (k * payouts) // total
+        is_payout = ((k + 1) * payouts) // total > p
+        source = self.payout(p) if is_payout else self.charge(k - p)
+        fee = 0 if is_payout else int(source["amount"] * 0.029) + 30
+        amount = -source["amount"] if is_payout else source["amount"]
+        return {
+            "id": f"txn_stub{k:010d}",
+            "object": "balance_transaction",
+            "amount": amount,
+            "fee": fee,
+            "net": amount - fee,
+            "currency": "usd",
+            "created": self.created("balance_transaction", k),
+            "type": source["object"],
+            "status": "available",
+            "description": source.get("description"),
+            "source": source if expand_source else source["id"],
+        }
+
+    def list(self, object_type: str, params: Dict) -> Dict:
+        """A list page honoring created[gte|gt|lte|lt], limit and starting_after"""
+        created = params.get("created") or {}
+        count = self.counts[object_type]
+        upper = _int(created.get("lte"), _int(created.get("lt"), None, -1))
+        lower = _int(created.get("gte"), _int(created.get("gt"), None, 1))
+
+        # created() is non-increasing in the index
+        start = 0 if upper is None else self._first(object_type, lambda c: c <= upper)
+        end = count if lower is None else self._first(object_type, lambda c: c < lower)
+        after = params.get("starting_after")
+        if after:
+            start = max(start, int(re.sub(r"\D", "", after)) + 1)
+        limit = min(100, max(1, _int(params.get("limit"), 10)))
+        stop = min(end, start + limit)
+
+        expand = "data.source" in (params.get("expand") or [])
+        make = {
+            "charge": self.charge,
+            "payout": self.payout,
+            "balance_transaction": lambda i: self.balance_transaction(i, expand),
+        }[object_type]
+        return {
+            "object": "list",
+            "url": f"/v1/{object_type}s",
+            "has_more": stop < end,
+            "data": [make(i) for i in range(start, stop)],
+        }
+
+    def _first(self, object_type: str, predicate) -> int:
+        lo, hi = 0, self.counts[object_type]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if predicate(self.created(object_type, mid)):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    # ---------------- Writes ----------------
+    def create(self, object_type: str, params: Dict, headers) -> Dict:
+        """Transfer or payout create; a repeated Idempotency-Key replays the
+        first response like Stripe does"""
+        # Keys are scoped per account, as transfer_and_payout reuses one
+        # key for the platform transfer and the connected-account payout
+        key = headers.get("Idempotency-Key")
+        if key:
+            key = (object_type, headers.get("Stripe-Account"), key)
+        with self._lock:
+            if key and key in self.idempotent:
+                return self.idempotent[key]
+            prefix = {"transfer": "tr", "payout": "po"}[object_type]
+            obj = {
+                "id": f"{prefix}_stubnew{len(self.created_objects):010d}",
+                "object": object_type,
+                "amount": _int(params.get("amount"), 0),
+                "currency": params.get("currency") or "usd",
+                "created": int(time.time()),
+                "metadata": params.get("metadata") or {},
+                "description": params.get("description"),
+            }
+            if object_type == "transfer":
+                obj["destination"] = params.get("destination")
+            else:
+                obj["status"] = "pending"
+                obj["account"] = headers.get("Stripe-Account")
+            self.created_objects[obj["id"]] = obj
+            if key:
+                self.idempotent[key] = obj
+            return obj
+
+    def account(self, account_id: str) -> Dict:
+        """Payout-ready unless the id contains 'restricted'"""
+        restricted = "restricted" in account_id
+        return {
+            "id": account_id,
+            "object": "account",
+            "type": "express",
+            "payouts_enabled": not restricted,
+            "charges_enabled": not restricted,
+            "requirements": {
+                "disabled_reason": "requirements.past_due" if restricted else None
+            },
+        }
+
+
+class _RateLimit:
+    """Requests allowed per rolling second; 0 disables"""
+
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self.hits: deque = deque()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if not self.per_second:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            while self.hits and self.hits[0] <= now - 1:
+                self.hits.popleft()
+            if len(self.hits) >= self.per_second:
+                return False
+            self.hits.append(now)
+            return True
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    routes = [
+        ("GET", re.compile(r"^/v1/(charge|payout|balance_transaction)s$"), "list"),
+        ("POST", re.compile(r"^/v1/(transfer|payout)s$"), "create"),
+        ("GET", re.compile(r"^/v1/accounts/([^/]+)$"), "account"),
+    ]
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str) -> None:
+        server = self.server
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        params = _parse_form(url.query if method == "GET" else body)
+
+        if server.latency:
+            time.sleep(server.latency * (0.5 + random.random()))
+        if not server.rate_limit.allow():
+            server.count("429")
+            self._send(
+                429,
+                _error("Too many requests", "rate_limit"),
+                {"Retry-After": "1"},
+            )
+            return
+
+        for route_method, pattern, action in self.routes:
+            match = pattern.match(url.path)
+            if route_method != method or not match:
+                continue
+            path = "/v1/accounts/:id" if action == "account" else url.path
+            server.count(f"{method} {path}")
+            stub = server.stub
+            if action == "list":
+                payload = stub.list(match.group(1), params)
+            elif action == "create":
+                payload = stub.create(match.group(1), params, self.headers)
+            else:
+                payload = stub.account(match.group(1))
+            self._send(200, payload)
+            return
+        self._send(404, _error(f"Unrecognized request URL ({method}: {url.path})"))
+
+    def _send(self, status: int, payload: Dict, headers: Optional[Dict] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Request-Id", f"req_stub{int(time.time() * 1000)}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class StripeStubServer(ThreadingHTTPServer):
+    """HTTP server speaking enough of the Stripe API for StripeService.
+
+    Point the SDK at it with STRIPE_API_BASE=http://host:port. Every
+    response is delayed by STRIPE_STUB_LATENCY_MS (+/-50%), and with
+    STRIPE_STUB_RATE_LIMIT > 0 requests over that rate per second get a 429
+    with Retry-After, like Stripe's limiter.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        stub: Optional[StripeStub] = None,
+        latency_ms: Optional[float] = None,
+        rate_limit: Optional[float] = None,
+        verbose: bool = False,
+    ):
+        super().__init__(address, StubHandler)
+        self.stub = stub or StripeStub()
+        self.latency = (
+            float(
+                latency_ms
+                if latency_ms is not None
+                else get_config("STRIPE_STUB_LATENCY_MS", "0")
+            )
+            / 1000
+        )
+        self.rate_limit = _RateLimit(
+            float(
+                rate_limit
+                if rate_limit is not None
+                else get_config("STRIPE_STUB_RATE_LIMIT", "0")
+            )
+        )
+        self.verbose = verbose
+        self.requests: Dict[str, int] = {}
+        self._count_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str) -> None:
+        with self._count_lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+
+def _parse_form(query: str) -> Dict:
+    """Stripe's form encoding (a[b]=1, expand[0]=x) back into dicts and lists"""
+    result: Dict = {}
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        parts = re.findall(r"[^\[\]]+", key)
+        target = result
+        for part, following in zip(parts, parts[1:]):
+            default: object = [] if following.isdigit() else {}
+            if isinstance(target, list):
+                target.append(default)
+                target = target[-1]
+            else:
+                target = target.setdefault(part, default)
+        last = parts[-1]
+        if isinstance(target, list):
+            target.append(value)
+        else:
+            target[last] = value
+    return result
+
+
+def _error(message: str, code: Optional[str] = None) -> Dict:
+    error = {"type": "invalid_request_error", "message": message}
+    if code:
+        error["code"] = code
+    return {"error": error}
+
+
+def _int(value, default, offset: int = 0):
+    if value in (None, ""):
+        return default
+    return int(value) + offset
@@ -0,0 +1,81 @@
+# services/stripe_sync_state.py
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from supabase import Client
+
+from config.database import get_db
+from config.enviroment import get_config
+
+SYNC_STATE_TABLE = "stripe_sync_state"
+
+
+class SyncStateStore:
+    """Per-org, per-object-type Stripe sync cursors.
+
+    A cursor is {"last_created": unix seconds, "last_ids": ids created in
+    that second}: the next sync lists created >= last_created and skips
+    last_ids. Rows live in stripe_sync_state (organization_id, object_type,
+    cursor, updated_at). If the table is unavailable, or
+    STRIPE_SYNC_STATE_STORE=file, they go to <STRIPE_SYNC_STATE_DIR>/<org>.json.
+    """
+
+    def __init__(self, db: Optional[Client] = None):
+        self.db: Client = db or get_db()
+        self.use_file = get_config("STRIPE_SYNC_STATE_STORE", "db") == "file"
+        self.dir = Path(get_config("STRIPE_SYNC_STATE_DIR", ".cache/stripe_sync_state"))
+
+    def load(self, org_id, object_type: str) -> Optional[Dict]:
+        """Cursor for the org's object type, or None before the first sync"""
+        if not self.use_file:
+            try:
+                rows = (
+                    self.db.table(SYNC_STATE_TABLE)
+                    .select("cursor")
+                    .eq("organization_id", org_id)
+                    .eq("object_type", object_type)
+                    .limit(1)
+                    .execute()
+                    .data
+                )
+                if rows:
+                    cursor = rows[0]["cursor"]
+                    return json.loads(cursor) if isinstance(cursor, str) else cursor
+                return None
+            except Exception as e:
+                print(f"Error loading sync state from {SYNC_STATE_TABLE}: {e}")
+        return self._load_file(org_id).get(object_type)
+
+    def save(self, org_id, object_type: str, cursor: Dict) -> str:
+        """Persist a cursor; returns where it was written ("db" or "file")"""
+        if not self.use_file:
+            try:
+                self.db.table(SYNC_STATE_TABLE).upsert(
+                    {
+                        "organization_id": org_id,
+                        "object_type": object_type,
+                        "cursor": cursor,
+                        "updated_at": datetime.utcnow().isoformat(),
+                    },
+                    on_conflict="organization_id,object_type",
+                ).execute()
+                return "db"
+            except Exception as e:
+                print(f"Error saving sync state to {SYNC_STATE_TABLE}, using file: {e}")
+
+        state = self._load_file(org_id)
+        state[object_type] = cursor
+        self.dir.mkdir(parents=True, exist_ok=True)
+        (self.dir / f"{org_id}.json").write_text(json.dumps(state), encoding="utf-8")
+        return "file"
+
+    def _load_file(self, org_id) -> Dict:
+        path = self.dir / f"{org_id}.json"
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            return {}
@@ -0,0 +1,23 @@
+# utils/clock.py
+import threading
+from datetime import datetime
+from typing import Optional
+
+_pinned: Optional[datetime] = None
+_lock = threading.Lock()
+
+
+def now() -> datetime:
+    """Current local time, or the pinned time while one is set.
+
+    Data windows and prompt dates go through this, so an LLM replay can pin
+    the recording's time and rebuild byte-identical prompts.
+    """
+    return _pinned or datetime.now()
+
+
+def pin(moment: Optional[datetime]) -> None:
+    """Freeze now() at `moment` for the whole process (None unpins)"""
+    global _pinned
+    with _lock:
+        _pinned = moment
@@ -16,4 +16,8 @@ def get_date_range(days: int):
     """Get date range for queries"""
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
-    return start_date, end_date
\ No newline at end of file
+    return start_date, end_date
+
+def to_plain(value):
+    """numpy scalars -> Python values, for JSON snapshots and alert payloads"""
+    return value.item() if hasattr(value, "item") else value
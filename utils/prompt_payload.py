@@ -0,0 +1,158 @@
+# utils/prompt_payload.py
+import math
+from typing import Callable, Dict, List, Optional, Sequence
+
+from config.enviroment import get_config
+
+# ~4 characters per token is close enough for English text mixed with numbers
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 1200
+MIN_TOP_K = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for prompt budgeting and reporting"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def get_token_budget(agent_key: str, default: int = DEFAULT_TOKEN_BUDGET) -> int:
+    """Data token budget for an agent.
+
+    PROMPT_TOKEN_BUDGET_<AGENT> (e.g. PROMPT_TOKEN_BUDGET_SPENDING) wins over the
+    global PROMPT_TOKEN_BUDGET.
+    """
+    raw = get_config(f"PROMPT_TOKEN_BUDGET_{agent_key.upper()}") or get_config(
+        "PROMPT_TOKEN_BUDGET"
+    )
+    try:
+        return int(raw) if raw else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _fmt(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+class _Table:
+    def __init__(self, title, rows, columns, top_k, sum_columns):
+        self.title = title
+        self.rows = rows
+        self.columns = list(columns)
+        self.top_k = top_k
+        self.sum_columns = set(sum_columns)
+
+    def render(self, top_k: int) -> str:
+        shown = self.rows[:top_k]
+        rest = self.rows[top_k:]
+        if rest:
+            header = f"{self.title} (top {len(shown)} of {len(self.rows)}):"
+        else:
+            header = f"{self.title}:"
+        if not self.rows:
+            return f"{header} none"
+
+        lines = [header, "|".join(self.columns)]
+        for row in shown:
+            lines.append("|".join(_fmt(row.get(c)) for c in self.columns))
+        if rest:
+            other = []
+            for i, c in enumerate(self.columns):
+                if i == 0:
+                    other.append(f"other ({len(rest)})")
+                elif c in self.sum_columns:
+                    other.append(_fmt(float(sum(float(r.get(c) or 0) for r in rest))))
+                else:
+                    other.append("-")
+            lines.append("|".join(other))
+        return "\n".join(lines)
+
+
+class PromptPayload:
+    """Builds the data section of an agent prompt as compact pipe-separated tables.
+
+    Tables are ranked, cut to top-k and the remainder folded into an "other" row.
+    If the rendered payload exceeds the token budget, the largest tables are
+    shrunk until it fits (down to MIN_TOP_K rows each).
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._blocks: List = []
+        self.token_count = 0
+
+    def add_line(self, text: str) -> "PromptPayload":
+        self._blocks.append(text)
+        return self
+
+    def add_table(
+        self,
+        title: str,
+        rows: Sequence[Dict],
+        columns: Sequence[str],
+        top_k: int = 10,
+        sort_key: Optional[Callable[[Dict], float]] = None,
+        sum_columns: Sequence[str] = (),
+    ) -> "PromptPayload":
+        """Add a list of dict rows; sorted descending by sort_key when given"""
+        rows = list(rows or [])
+        if sort_key:
+            rows.sort(key=sort_key, reverse=True)
+        self._blocks.append(_Table(title, rows, columns, top_k, sum_columns))
+        return self
+
+    def add_mapping(
+        self,
+        title: str,
+        mapping: Dict,
+        key_name: str,
+        value_name: str,
+        top_k: int = 10,
+    ) -> "PromptPayload":
+        """Add a {label: amount} dict, largest amounts first"""
+        rows = [
+            {key_name: k, value_name: float(v or 0)} for k, v in (mapping or {}).items()
+        ]
+        return self.add_table(
+            title,
+            rows,
+            [key_name, value_name],
+            top_k=top_k,
+            sort_key=lambda r: r[value_name],
+            sum_columns=[value_name],
+        )
+
+    def render(self) -> str:
+        limits = {
+            id(b): min(b.top_k, len(b.rows))
+            for b in self._blocks
+            if isinstance(b, _Table)
+        }
+
+        while True:
+            text = "\n\n".join(
+                b.render(limits[id(b)]) if isinstance(b, _Table) else b
+                for b in self._blocks
+            )
+            self.token_count = estimate_tokens(text)
+            if self.token_count <= self.token_budget:
+                return text
+
+            # Shrink the table currently showing the most rows
+            shrinkable = [
+                b
+                for b in self._blocks
+                if isinstance(b, _Table) and limits[id(b)] > MIN_TOP_K
+            ]
+            if not shrinkable:
+                return text
+            largest = max(shrinkable, key=lambda b: limits[id(b)])
+            limits[id(largest)] = max(MIN_TOP_K, limits[id(largest)] // 2)